@@ -17,7 +17,6 @@
 # but in the form of a proxy. For instance, it serves as the single subscriber to
 # all publishers. On the other hand, it serves as the single publisher to all the subscribers.
 
-import time   # for sleep
 import argparse # for argument parsing
 import configparser # for configuration parsing
 import logging # for logging. Use it in place of print statements.
@@ -26,6 +25,7 @@ from topic_selector import TopicSelector
 
 # Now import our CS6381 Middleware
 from CS6381_MW.BrokerMW import BrokerMW
+from CS6381_MW.Common import RetryBackoff
 # We also need the message formats to handle incoming responses.
 from CS6381_MW import discovery_pb2
 
@@ -61,6 +61,8 @@ class BrokerAppln ():
         self.frequency = None # rate at which dissemination takes place
         self.lookup = None # one of the diff ways we do lookup
         self.dissemination = None # direct or via broker
+        self.retry_after = None  # milliseconds to wait at least before asking is ready again
+        self.isready_backoff = RetryBackoff ()  # how long to wait after a not ready answer
         self.mw_obj = None # handle to the underlying Middleware object
         self.logger = logger  # internal logger for print statements
 
@@ -83,13 +85,6 @@ class BrokerAppln ():
             self.frequency = args.frequency # frequency with which topics are disseminated
             self.port = args.port
 
-            # Choose a discovery node.  Start with the first one to make sure things are wired properly.
-            dht_nodes = ChordUtils.to_sorted_dht_node_list(
-                ChordUtils.load_json_data(os.path.join(os.path.dirname(__file__), 'Utils', args.json_file)))
-            discover_node = dht_nodes[0]
-            args.discovery = f"{discover_node.get(IP)}:{discover_node.get(PORT)}"
-            self.logger.info(f"BrokerAppln::configure - discovery set to {discover_node} - {args.discovery}")
-
             # Now, get the configuration object
             try:
                 self.logger.debug ("BrokerAppln::configure - parsing config.ini")
@@ -101,6 +96,7 @@ class BrokerAppln ():
                 self.lookup = config["Discovery"]["Strategy"]
                 self.logger.debug ("BrokerAppln::configure - config.ini dissemination")
                 self.dissemination = config["Dissemination"]["Strategy"]
+                self.retry_after = config.getint ("Discovery", "RetryAfter", fallback=100)
             except Exception as e:
                 self.logger.exception ("BrokerAppln::configure - Trace {}".format(e))
 
@@ -113,7 +109,17 @@ class BrokerAppln ():
             # everything
             self.logger.debug ("BrokerAppln::configure - initialize the middleware object")
             self.mw_obj = BrokerMW (self.logger)
-            self.mw_obj.configure (args) # pass remainder of the args to the m/w object
+
+            # Discovery requests go straight to the DHT nodes owning their keys, so we need
+            # the ring as the discovery nodes were started with it, virtual nodes included
+            dht_json = ChordUtils.load_json_data (os.path.join (os.path.dirname (__file__), 'Utils', args.json_file))
+            bits = ChordUtils.ring_bits (dht_json)
+            dht_ring = ChordUtils.expand_virtual_nodes (ChordUtils.to_sorted_dht_node_list (dht_json), bits,
+                                                        config.getint ("Chord", "VirtualNodes", fallback=1),
+                                                        ChordUtils.parse_host_weights (config.get ("Chord", "HostWeights", fallback="")))
+            self.mw_obj.configure (args, dht_ring, bits, config.getint ("Discovery", "ClientConnections", fallback=4),
+                                 config.getfloat ("Discovery", "TraceRate", fallback=0.0),
+                                 config.getint ("Metrics", "PortOffset", fallback=0)) # pass remainder of the args to the m/w object
 
             self.logger.info ("BrokerAppln::configure - configuration complete")
 
@@ -229,13 +235,15 @@ class BrokerAppln ():
         try:
             self.logger.info ("BrokerAppln::isready_response")
     
-            # Notice how we get that loop effect with the sleep (10)
-            # by an interaction between the event loop and these
-            # upcall methods.
+            # Notice how we get that loop effect by an interaction between the
+            # event loop and these upcall methods. The discovery service usually
+            # holds our request until it is ready, but with IsReadyWait 0 it answers
+            # not ready at once, so we wait a little (and longer each time) before
+            # we ask again instead of flooding it.
             if not isready_resp.status:
                 # discovery service is not ready yet
                 self.logger.debug ("BrokerAppln::driver - Not ready yet; check again")
-                time.sleep (10)  # sleep between calls so that we don't make excessive calls
+                return self.isready_backoff.delay (self.retry_after)
     
             else:
                 self.state = self.State.LOOKUP_PUBS
@@ -253,6 +261,9 @@ class BrokerAppln ():
 
             self.mw_obj.subscribe(self.topiclist, lookup_resp.pubs)
 
+            # publishers that register later, or leave, reach us as watch answers
+            self.mw_obj.watch(self.topiclist, lookup_resp.pubs)
+
             self.state = self.State.CONSUME
 
             # return timeout of 0 so event loop calls us back in the invoke_operation
@@ -0,0 +1,193 @@
+###############################################
+#
+# Purpose: asyncio flavor of the discovery middleware
+#
+# Created: Distributed Systems Spring 2023
+#
+###############################################
+
+# DiscoveryMW waits in a single zmq.Poller loop and works out by hand how long it
+# may block before the next ring maintenance round or request deadline is due.
+# Here the same middleware runs on zmq.asyncio sockets instead: the ROUTER, every
+# DEALER to another DHT node and each timer get a task of their own on one asyncio
+# event loop. Parsing, routing, the pending request table and the upcalls to the
+# application are inherited unchanged from DiscoveryMW.
+#
+# A send on a zmq.asyncio socket returns a future. Most go out at once and a
+# failed one raises right there. One held back by a full queue is counted
+# (sends_held_total) and awaited by a task of its own, whose failure takes the
+# event loop down like any other. We keep reading meanwhile: two nodes that both
+# stopped reading until their sends to each other went out would wait forever.
+#
+# This is a cooperative wrapper, not a concurrent server: a request is handled,
+# upcalls and registry log writes included, from start to end before any other
+# task runs, so slow requests do not overlap. Handing the upcalls to threads
+# would let the replies overtake the registry log they depend on.
+#
+# DiscoveryAppln selects this middleware with its -A/--asyncio option.
+
+# import the needed packages
+import time  # for the deadlines
+import asyncio  # the event loop
+import zmq  # ZMQ sockets
+import zmq.asyncio  # ZMQ sockets usable from asyncio
+
+from CS6381_MW.DiscoveryMW import DiscoveryMW
+
+##################################
+# AsyncDiscoveryMW Middleware class
+##################################
+class AsyncDiscoveryMW(DiscoveryMW):
+
+    ########################################
+    # constructor
+    ########################################
+    def __init__(self, logger):
+        super().__init__(logger)
+        self.tasks = None  # tasks of the running event loop, None until it starts
+        self.dealer_tasks = {}  # DEALER -> the task reading it
+        self.sending = set()  # sends held back while no event loop of ours runs
+        self.metrics.counter("sends_held_total", "Messages that could not be sent at once because a queue was full")
+
+    ########################################
+    # hooks of DiscoveryMW
+    ########################################
+    def create_context(self, io_threads=1):
+        '''ZMQ context whose sockets can be awaited'''
+        return zmq.asyncio.Context.instance(io_threads)
+
+    def send_frames(self, socket, frames:[]):
+        '''Sends on a zmq.asyncio socket; one that cannot go out at once is awaited by a task'''
+        future = socket.send_multipart(frames)
+        if future.done():
+            future.result()  # raises what the send failed with
+            return
+        self.metrics.inc("sends_held_total")
+        if self.tasks is not None:
+            self.__spawn(self.__settle(future))
+        else:
+            self.sending.add(future)
+
+    async def __settle(self, future):
+        '''Waits for a send held back by a full queue'''
+        await future
+
+    def watch_dealer(self, dealer_socket):
+        '''Starts a reader task for a new DEALER, or leaves it to the event loop if that is not running yet'''
+        if self.tasks is not None:
+            self.dealer_tasks[dealer_socket] = self.__spawn(self.__serve_dealer(dealer_socket))
+
+    def unwatch_dealer(self, dealer_socket):
+        '''Stops the reader task of a DEALER that is about to be closed'''
+        task = self.dealer_tasks.pop(dealer_socket, None)
+        if task is not None:
+            task.cancel()
+
+    #################################################################
+    # run the event loop where we expect to receive incoming requests
+    #################################################################
+    def event_loop(self, timeout=None):
+
+        try:
+            self.logger.info("AsyncDiscoveryMW::event_loop - run the event loop")
+            asyncio.run(self.__serve(timeout))
+            self.logger.info("AsyncDiscoveryMW::event_loop - out of the event loop")
+        except Exception as e:
+            raise e
+
+    async def __serve(self, timeout):
+        '''Starts one task per socket and timer and waits until the event loop is disabled'''
+        self.tasks = set()
+        self.__spawn(self.__serve_router(self.router_socket))
+        if self.worker_intake is not None:
+            self.__spawn(self.__serve_router(self.worker_intake))
+        for dealer_socket in list(self.dealer_sockets):
+            self.dealer_tasks[dealer_socket] = self.__spawn(self.__serve_dealer(dealer_socket))
+        if self.stabilize_interval > 0:
+            self.__spawn(self.__maintain())
+        self.__spawn(self.__expire())
+        self.__spawn(self.__operations(timeout))
+
+        try:
+            while self.handle_events:
+                # a task that failed takes the event loop down with it like an
+                # exception in the poll loop would
+                done, pending = await asyncio.wait(self.tasks, return_when=asyncio.FIRST_EXCEPTION)
+                for task in done:
+                    self.tasks.discard(task)
+                    if not task.cancelled() and task.exception() is not None:
+                        raise task.exception()
+                if not self.tasks:
+                    break
+        finally:
+            for task in self.tasks:
+                task.cancel()
+            self.tasks = None
+            self.dealer_tasks.clear()
+
+    def __spawn(self, coro):
+        '''Runs coro as a task of our event loop'''
+        task = asyncio.get_running_loop().create_task(coro)
+        self.tasks.add(task)
+        return task
+
+    async def __serve_router(self, socket):
+        '''Requests from clients and other DHT nodes, or the ones our workers pass on'''
+        while self.handle_events:
+            rcv_parts = await socket.recv_multipart()
+            woke = time.perf_counter()
+            self.logger.info("AsyncDiscoveryMW::__serve_router - router received event")
+            self.process_request(rcv_parts)
+            # serve what else is queued before yielding to the other tasks; as in
+            # handle_request, clients queued beyond ingress_queue are shed
+            served = 1
+            while served < 2 * self.ingress_queue and socket.getsockopt(zmq.EVENTS) & zmq.POLLIN:
+                self.backlogged = served >= self.ingress_queue
+                self.process_request(await socket.recv_multipart())
+                served += 1
+            self.backlogged = False
+            self.metrics.observe("loop_seconds", time.perf_counter() - woke)
+
+    async def __serve_dealer(self, dealer_socket):
+        '''Answers to the requests we forwarded over one DEALER'''
+        while self.handle_events:
+            rcv_parts = await dealer_socket.recv_multipart()
+            self.logger.debug("AsyncDiscoveryMW::__serve_dealer - dealer received event")
+            self.process_reply(rcv_parts[-1])
+            while dealer_socket.getsockopt(zmq.EVENTS) & zmq.POLLIN:
+                self.process_reply((await dealer_socket.recv_multipart())[-1])
+
+    async def __maintain(self):
+        '''Stabilize and fix fingers every stabilize interval'''
+        while self.handle_events:
+            await asyncio.sleep(max(0, self.next_maintenance - time.monotonic()))
+            self.run_maintenance()
+            self.next_maintenance = time.monotonic() + self.stabilize_interval
+
+    async def __expire(self):
+        '''Gives up on forwarded requests that were not answered in time and on parked long polls'''
+        while self.handle_events:
+            # a request forwarded or parked from now on expires no earlier than one timeout from now
+            wait = min([self.forward_timeout] + [t for t in (self.isready_wait, self.watch_wait) if t > 0])
+            if self.deadlines:
+                wait = min(wait, self.deadlines[0][0] - time.monotonic())
+            await asyncio.sleep(max(0, wait))
+            self.expire_pending()
+
+    async def __operations(self, timeout):
+        '''Upcalls to the application whenever the timeout it asked for runs out'''
+        while self.handle_events and timeout is not None:
+            await asyncio.sleep(timeout / 1000.0)
+            timeout = self.upcall_obj.invoke_operation()
+
+    ########################################
+    # leave the ring
+    ########################################
+    def leave(self):
+        '''Leaves the ring; the last messages go out from an event loop of their own'''
+        asyncio.run(self.__leave())
+
+    async def __leave(self):
+        self.sending = set()
+        DiscoveryMW.leave(self)
+        await asyncio.gather(*self.sending)
@@ -18,11 +18,16 @@
 # Discovery service, it will have both PUB and SUB sockets as it must work on
 # behalf of the real publishers and subscribers. So this will have the logic of
 # both publisher and subscriber middleware.
+import time  # for the metrics of the event loop
 import zmq  # ZMQ sockets
 
 # import serialization logic
 from CS6381_MW import discovery_pb2
 from CS6381_MW import topic_pb2
+from CS6381_MW.Common import RetryBackoff
+from CS6381_MW.DhtClient import DhtClient
+from CS6381_MW.Metrics import Metrics, LOOP_BUCKETS
+from CS6381_MW.PubWatch import PubWatch
 
 # from CS6381_MW import topic_pb2  # you will need this eventually
 
@@ -34,7 +39,7 @@ from CS6381_MW import topic_pb2
 class BrokerMW():
     def __init__(self, logger):
         self.logger = logger  # internal logger for print statements
-        self.req = None  # will be a ZMQ REQ socket to talk to Discovery service
+        self.req = None  # DhtClient sending our requests to the discovery nodes owning their keys
         self.pub = None  # will be a ZMQ PUB socket for dissemination
         self.sub = None  # will be a ZMQ SUB socket for consumption
         self.poller = None  # used to wait on incoming replies
@@ -42,12 +47,15 @@ class BrokerMW():
         self.port = None  # port num where we are going to publish our topics
         self.upcall_obj = None  # handle to appln obj to handle appln-specific data
         self.handle_events = True  # in general we keep going thru the event loop
+        self.backoff = RetryBackoff()  # how long to wait when the discovery service sheds a request
+        self.metrics = Metrics("broker")  # runtime counters, served on a port of their own if configured
+        self.pub_watch = None  # publishers of our topics while we watch them, else None
 
 
     ########################################
     # configure/initialize
     ########################################
-    def configure(self, args):
+    def configure(self, args, dht_ring, bits, connections=4, trace_rate=0.0, metrics_offset=0):
         ''' Initialize the object '''
 
         try:
@@ -66,24 +74,20 @@ class BrokerMW():
             self.logger.debug("BrokerMW::configure - obtain the poller")
             self.poller = zmq.Poller()
 
-            self.logger.debug("BrokerMW::configure - obtain REQ and PUB sockets")
-            self.req = context.socket(zmq.REQ)
+            self.logger.debug("BrokerMW::configure - obtain PUB and SUB sockets")
             self.pub = context.socket(zmq.PUB)
             self.sub = context.socket(zmq.SUB)
 
-            self.logger.debug("BrokerMW::configure - register the REQ socket for incoming replies")
-            self.poller.register(self.req, zmq.POLLIN)
+            self.logger.debug("BrokerMW::configure - register the SUB socket for incoming publications")
             self.poller.register(self.sub, zmq.POLLIN)
 
-            # Now connect ourselves to the discovery service. Recall that the IP/port were
-            # supplied in our argument parsing. Best practices of ZQM suggest that the
-            # one who maintains the REQ socket should do the "connect"
-            self.logger.debug("BrokerMW::configure - connect to Discovery service")
-            # For our assignments we will use TCP. The connect string is made up of
-            # tcp:// followed by IP addr:port number.
-            connect_str = "tcp://" + args.discovery
-            self.req.connect(connect_str)
-            self.logger.info(f"BrokerMW::configure - connected to Discovery service - {connect_str}")
+            # We are the client of the Discovery service. Our requests go straight to the
+            # DHT node owning their keys, on DEALER sockets that register themselves with
+            # our poller as they are connected.
+            self.logger.debug("BrokerMW::configure - route to the Discovery service")
+            self.req = DhtClient(self.logger, context, self.poller, dht_ring, bits, args.name, False, connections,
+                                 trace_rate, self.metrics)
+            self.logger.info(f"BrokerMW::configure - routing discovery requests over {len(dht_ring)} ring positions")
 
             # Since we are the publisher, the best practice as suggested in ZMQ is for us to
             # "bind" the PUB socket
@@ -94,6 +98,16 @@ class BrokerMW():
             bind_string = "tcp://*:" + str(self.port)
             self.pub.bind(bind_string)
 
+            # our metrics, next to our port
+            self.metrics.counter("received_total", "Messages received from publishers by topic", ("topic",))
+            self.metrics.counter("published_total", "Messages passed on to subscribers by topic", ("topic",))
+            self.metrics.counter("discovery_shed_total", "Discovery requests we were told to send again later")
+            self.metrics.histogram("loop_seconds", "Seconds spent on the events of one wake-up of the event loop",
+                                   LOOP_BUCKETS)
+            if metrics_offset:
+                self.logger.debug("BrokerMW::configure - metrics on port {}".format(self.port + metrics_offset))
+                self.metrics.start(self.port + metrics_offset)
+
             self.logger.info("BrokerMW::configure completed")
 
         except Exception as e:
@@ -114,6 +128,17 @@ class BrokerMW():
                 # poll for events. We give it an infinite timeout.
                 # The return value is a socket to event mask mapping
                 events = dict(self.poller.poll(timeout=timeout))
+                woke = time.perf_counter()
+
+                # a late answer on another connection to the discovery nodes is no event
+                # of ours; if it was the only one, go back to waiting
+                if self.req.discard_stale(events) and not events:
+                    continue
+
+                # publications are read by consume in the CONSUME state. The first ones
+                # may arrive before we get there, and more after it, when we only poll
+                # to move on; either way they are no event of the loop
+                events.pop(self.sub, None)
 
                 # Unlike the previous starter code, here we are never returning from
                 # the event loop but handle everything in the same locus of control
@@ -129,7 +154,7 @@ class BrokerMW():
                     # object is in.
                     timeout = self.upcall_obj.invoke_operation()
 
-                elif self.req in events:  # this is the only socket on which we should be receiving replies
+                elif self.req.readable(events):  # this is the only socket on which we should be receiving replies
 
                     # handle the incoming reply from remote entity and return the result
                     timeout = self.handle_reply()
@@ -137,6 +162,8 @@ class BrokerMW():
                 else:
                     raise Exception("Unknown event after poll")
 
+                self.metrics.observe("loop_seconds", time.perf_counter() - woke)
+
             self.logger.info("BrokerMW::event_loop - out of the event loop")
         except Exception as e:
             raise e
@@ -159,6 +186,15 @@ class BrokerMW():
             disc_resp = discovery_pb2.DiscoveryResp()
             disc_resp.ParseFromString(bytesRcvd)
 
+            # an overloaded discovery service did not serve the request. Returning the
+            # wait as timeout lets invoke_operation send it again from the same state.
+            if disc_resp.status == discovery_pb2.STATUS_CHECK_AGAIN:
+                self.metrics.inc("discovery_shed_total")
+                timeout = self.backoff.delay(disc_resp.retry_after)
+                self.logger.info("BrokerMW::handle_reply - discovery service busy, retry in {} ms".format(timeout))
+                return timeout
+            self.backoff.reset()
+
             # demultiplex the message based on the message type but let the application
             # object handle the contents as it is best positioned to do so. See how we make
             # the upcall on the application object by using the saved handle to the appln object.
@@ -174,6 +210,10 @@ class BrokerMW():
             elif (disc_resp.msg_type == discovery_pb2.TYPE_LOOKUP_ALL_PUBS):
                 self.logger.debug ("BrokerMW::handle_reply TYPE_LOOKUP_ALL_PUBS")
                 timeout = self.upcall_obj.lookup_all_pubs_response(disc_resp.lookup_resp)
+            elif (disc_resp.msg_type == discovery_pb2.TYPE_WATCH):
+                # a watch answer that came in after we stopped consuming
+                self.__watch_update(disc_resp, watch_on=False)
+                timeout = 0
             else:  # anything else is unrecognizable by this object
                 # raise an exception here
                 raise ValueError("Unrecognized response message")
@@ -271,7 +311,9 @@ class BrokerMW():
             # first build a IsReady message
             self.logger.debug("BrokerMW::is_ready - populate the nested IsReady msg")
             isready_req = discovery_pb2.IsReadyReq()  # allocate
-            # actually, there is nothing inside that msg declaration.
+            # ask the discovery service to hold the request until it is ready
+            # instead of answering not ready right away
+            isready_req.wait = True
             self.logger.debug("BrokerMW::is_ready - done populating nested IsReady msg")
 
             # Build the outer layer Discovery Message
@@ -340,14 +382,56 @@ class BrokerMW():
             self.sub.setsockopt(zmq.SUBSCRIBE, bytes(topic, "utf-8"))
         self.logger.debug("BrokerMW::subscribe complete")
 
+    ########################################
+    # watch the publishers of our topics
+    #
+    # keeps a watch request outstanding with the discovery service so that
+    # we relay publishers that register after our lookup too
+    ########################################
+    def watch(self, topics, publishers):
+        self.logger.debug("BrokerMW::watch")
+        self.pub_watch = PubWatch(self.logger, topics, publishers)
+        self.req.send(self.pub_watch.request())
+
+    def __watch_update(self, disc_resp=None, watch_on=True):
+        ''' apply a watch answer to the SUB socket and watch on '''
+        if disc_resp is None:
+            disc_resp = discovery_pb2.DiscoveryResp()
+            disc_resp.ParseFromString(self.req.recv())
+
+        connect, disconnect = self.pub_watch.apply(disc_resp.watch_resp)
+        for connect_string in connect:
+            self.logger.info("BrokerMW::watch - connect to {}".format(connect_string))
+            self.sub.connect(connect_string)
+        for connect_string in disconnect:
+            self.logger.info("BrokerMW::watch - disconnect from {}".format(connect_string))
+            self.sub.disconnect(connect_string)
+
+        if watch_on:
+            self.req.send(self.pub_watch.request())
+
+    def __next_publication(self):
+        ''' wait for the next publication, applying watch answers meanwhile '''
+        if self.pub_watch is None:
+            return self.sub.recv_multipart()
+
+        while True:
+            events = dict(self.poller.poll())
+            self.req.discard_stale(events)
+            if self.req.readable(events):
+                self.__watch_update()
+            if self.sub in events:
+                return self.sub.recv_multipart()
+
     def consume(self):
         try:
             self.logger.debug("BrokerMW::consume")
 
-            bytes_rcvd = self.sub.recv_multipart()
+            bytes_rcvd = self.__next_publication()
 
             topic_info = topic_pb2.topic()
             topic_info.ParseFromString(bytes_rcvd[1])
+            self.metrics.inc("received_total", topic_info.topic)
 
             self.disseminate(topic_info)
             self.logger.debug("BrokerMW::consume - {}".format(topic_info))
@@ -373,6 +457,7 @@ class BrokerMW():
 
             # send the info as bytes. See how we are providing an encoding of utf-8
             self.pub.send_multipart([bytes(topic_info.topic, "utf-8"), buf2send])
+            self.metrics.inc("published_total", topic_info.topic)
             # self.pub.send_string(send_str)
 
             self.logger.debug("BrokerMW::disseminate complete")
@@ -15,3 +15,30 @@
 # the role we are playing and any other common things that we need across
 # all our middleware objects. Make sure then to import this file in those files once
 # some content is added here that is needed by others. 
+
+import random  # to spread out the retries of clients
+
+##################################
+#       RetryBackoff class
+#
+# An overloaded discovery node answers a new request with STATUS_CHECK_AGAIN
+# and the milliseconds to wait at least (retry_after). If all the clients it
+# shed came back after exactly that long they would overload it again, so
+# each waits a random time between the hint and an exponentially growing
+# ceiling (capped). A served request resets the ceiling.
+##################################
+class RetryBackoff():
+
+    def __init__(self, cap=10000):
+        self.cap = cap  # longest wait in milliseconds
+        self.attempts = 0  # requests shed in a row
+
+    def delay(self, retry_after):
+        '''Milliseconds to wait before sending the shed request again'''
+        self.attempts += 1
+        floor = max(1, retry_after)
+        ceiling = min(self.cap, floor << min(self.attempts, 16))
+        return int(random.uniform(floor, max(floor, ceiling)))
+
+    def reset(self):
+        self.attempts = 0
@@ -0,0 +1,250 @@
+###############################################
+#
+# Purpose: client side routing of discovery requests over the DHT ring
+#
+# Created: Distributed Systems Spring 2023
+#
+###############################################
+
+# Publishers, subscribers and the broker used to send every discovery request to
+# the first node of the DHT json, which then forwarded most of it around the ring.
+# DhtClient knows the ring from the same json (and the same virtual node settings)
+# the discovery nodes are started with. It hashes the keys of a request the way the
+# discovery nodes do and sends the request straight to the node that owns most of
+# them, so that the parts it owns need no hop at all.
+#
+# The json only tells us how the ring started; nodes may have joined or left since.
+# A request therefore asks the node it goes to (want_owner) to name the owner of its
+# key in the answer, or at least a node between the key and itself we did not know.
+# If that is not the position we picked, the positions between the key and the named
+# node are gone from the ring and the named node is added. A node we sent to that no
+# longer owns the key forwards the request as before, so a stale view costs hops,
+# never answers.
+#
+# Every request goes out on a DEALER connected to its node. We keep a few of them
+# open (ClientConnections), closing the least recently used one when we need
+# another. Like the REQ socket this replaces, we have at most one request outstanding.
+#
+# A share of the requests (TraceRate) is traced: the discovery nodes on the way
+# record when each of them received and passed on the request and send the paths
+# back with the answer. We log them in one line per request for Utils/trace_report.py.
+
+import bisect  # sorted ring positions
+import collections  # ordered pool of connections
+import random  # which requests to trace
+import time  # timestamps of traced requests
+import zmq  # ZMQ sockets
+
+# import serialization logic
+from CS6381_MW import discovery_pb2
+
+from Chord.constants import *
+from Chord.chordutils import ChordUtils
+
+##################################
+#       DhtClient class
+##################################
+class DhtClient():
+
+    ########################################
+    # constructor
+    ########################################
+    def __init__(self, logger, context, poller, dht_ring, bits, name, broker_lookup=False, connections=4,
+                 trace_rate=0.0, metrics=None):
+        self.logger = logger  # internal logger for print statements
+        self.context = context  # ZMQ context the DEALER sockets come from
+        self.poller = poller  # poller of the middleware, answers arrive on it
+        self.bits = bits  # width of the hash space
+        self.name = name  # our id; requests without a key of their own go to its owner
+        self.broker_lookup = broker_lookup  # lookups go to the broker's key (Broker dissemination)
+        self.connections = max(1, connections)  # DEALER sockets kept open at most
+        self.hashes = sorted(node[HASH] for node in dht_ring)  # ring positions we know
+        self.endpoints = {node[HASH]: "tcp://{}:{}".format(node[IP], node[PORT]) for node in dht_ring}
+        self.sockets = collections.OrderedDict()  # endpoint -> DEALER, least recently used first
+        self.current = None  # DEALER of the request waiting for its answer
+        self.key = None  # dht_key of that request
+        self.learned = 0  # owners learned from answers
+        self.trace_rate = trace_rate  # fraction of the requests we trace
+        self.traced = None  # (msg type, time.time_ns () it was sent) of the outstanding request if traced
+        self.metrics = metrics  # Metrics of the middleware using us, None if it keeps none
+        self.sent = None  # (msg type name, time.perf_counter () it was sent) of the outstanding request
+        if metrics is not None:
+            metrics.counter("discovery_requests_total", "Requests sent to the discovery nodes by type", ("type",))
+            metrics.histogram("discovery_seconds", "Seconds from sending a discovery request to its answer",
+                              labels=("type",))
+            metrics.gauge("discovery_connections", "Open connections to discovery nodes", fn=lambda: len(self.sockets))
+            metrics.counter("discovery_owners_learned_total", "Key owners learned from answers",
+                            fn=lambda: self.learned)
+
+    ########################################
+    # the node owning a key in our view of the ring
+    ########################################
+    def owner(self, key):
+        '''Ring position owning key: the first position at or after it'''
+        i = bisect.bisect_left(self.hashes, key)
+        return self.hashes[i % len(self.hashes)]
+
+    def request_keys(self, disc_req):
+        '''The DHT keys whose owners serve parts of a request, the same ones the discovery nodes use'''
+        if disc_req.msg_type in (discovery_pb2.TYPE_REGISTER, discovery_pb2.TYPE_UNREGISTER):
+            register_req = disc_req.register_req if disc_req.msg_type == discovery_pb2.TYPE_REGISTER \
+                else disc_req.unregister_req
+            if register_req.role == discovery_pb2.ROLE_BOTH:
+                keys = [ChordUtils.broker_key(self.bits)]
+            else:
+                keys = [ChordUtils.entity_key(self.bits, register_req.info.id)]
+            if register_req.role == discovery_pb2.ROLE_PUBLISHER:
+                keys.extend(ChordUtils.topic_key(self.bits, topic) for topic in register_req.topiclist)
+            return keys
+        if disc_req.msg_type == discovery_pb2.TYPE_LOOKUP_PUB_BY_TOPIC:
+            if self.broker_lookup:
+                return [ChordUtils.broker_key(self.bits)]
+            return [ChordUtils.topic_key(self.bits, topic) for topic in disc_req.lookup_req.topiclist]
+        if disc_req.msg_type == discovery_pb2.TYPE_WATCH:
+            return [ChordUtils.topic_key(self.bits, topic) for topic in disc_req.watch_req.topiclist]
+        if disc_req.msg_type == discovery_pb2.TYPE_ISREADY:
+            # only its owner adds up the counts of the whole ring
+            return [ChordUtils.readiness_key(self.bits)]
+        # the walk over all publishers can start anywhere; spread the clients over
+        # the ring by their own ids
+        return [ChordUtils.entity_key(self.bits, self.name)]
+
+    ########################################
+    # send a serialized DiscoveryReq to the owner of its keys
+    ########################################
+    def send(self, buf2send):
+        disc_req = discovery_pb2.DiscoveryReq()  # allocate
+        disc_req.ParseFromString(buf2send)
+
+        # the node owning most of the keys, counting all its virtual nodes; ties go
+        # to the owner of the first key
+        owners = collections.Counter()
+        first = {}
+        for key in self.request_keys(disc_req):
+            endpoint = self.endpoints[self.owner(key)]
+            owners[endpoint] += 1
+            first.setdefault(endpoint, key)
+        endpoint = owners.most_common(1)[0][0]
+
+        self.key = first[endpoint]
+        disc_req.dht_key = self.key
+        disc_req.want_owner = True
+        self.traced = None
+        if self.trace_rate > 0 and random.random() < self.trace_rate:
+            disc_req.trace = True
+            self.traced = (disc_req.msg_type, time.time_ns())
+        self.logger.debug("DhtClient::send - key {} to {}".format(self.key, endpoint))
+        self.current = self.__socket(endpoint)
+        if self.metrics is not None:
+            self.sent = (discovery_pb2.MsgTypes.Name(disc_req.msg_type), time.perf_counter())
+            self.metrics.inc("discovery_requests_total", self.sent[0])
+        # the empty delimiter frame makes the DEALER look like a REQ socket to the ROUTER
+        self.current.send_multipart([b"", disc_req.SerializeToString()])
+
+    ########################################
+    # receive the answer to the outstanding request
+    ########################################
+    def recv(self):
+        bytesRcvd = self.current.recv_multipart()[-1]
+        self.current = None
+        recvd = time.time_ns()
+        if self.sent is not None:
+            self.metrics.observe("discovery_seconds", time.perf_counter() - self.sent[1], self.sent[0])
+            self.sent = None
+
+        disc_resp = discovery_pb2.DiscoveryResp()  # allocate
+        disc_resp.ParseFromString(bytesRcvd)
+        if disc_resp.HasField("owner"):
+            self.learn(self.key, disc_resp.owner)
+        if self.traced is not None:
+            self.log_trace(disc_resp, recvd)
+        return bytesRcvd
+
+    def readable(self, events):
+        '''True when the answer to the outstanding request is in the events of a poll'''
+        return self.current is not None and self.current in events
+
+    def discard_stale(self, events):
+        '''Drops the answers that arrived late on our other connections and takes their sockets
+        out of the events of a poll; returns True if there were any'''
+        stale = [socket for socket in self.sockets.values() if socket is not self.current and socket in events]
+        for socket in stale:
+            del events[socket]
+            # nobody waits for them any more; left unread they keep the socket readable
+            while True:
+                try:
+                    socket.recv_multipart(zmq.NOBLOCK)
+                except zmq.Again:
+                    break
+                self.logger.debug("DhtClient::discard_stale - dropped a late answer")
+        return bool(stale)
+
+    ########################################
+    # learn the owner of a key from an answer
+    ########################################
+    def learn(self, key, owner):
+        endpoint = "tcp://{}:{}".format(owner.addr, owner.port)
+        if self.owner(key) == owner.hash:
+            self.endpoints[owner.hash] = endpoint
+            return
+
+        # no position lies in [key, owner) any more; the owner is new to us or we
+        # took one of those for it
+        span = ChordUtils.distance(key, owner.hash, self.bits)
+        stale = [h for h in self.hashes if h != owner.hash and ChordUtils.distance(key, h, self.bits) < span]
+        for h in stale:
+            self.hashes.remove(h)
+            del self.endpoints[h]
+        if owner.hash not in self.endpoints:
+            bisect.insort(self.hashes, owner.hash)
+        self.endpoints[owner.hash] = endpoint
+        self.learned += 1
+        self.logger.info("DhtClient::learn - key {} is owned by {} at {}, dropped {} stale positions".format(
+            key, owner.id, endpoint, len(stale)))
+
+    ########################################
+    # log the paths of a traced request
+    ########################################
+    def log_trace(self, disc_resp, recvd):
+        msg_type, sent = self.traced
+        self.traced = None
+        hops = ",".join("{}/{}/{}/{}".format(hop.node, hop.depth, hop.recv_ns, hop.send_ns) for hop in disc_resp.hops)
+        self.logger.info("DhtClient::trace - client={} type={} sent={} recvd={} hops={}".format(
+            self.name, discovery_pb2.MsgTypes.Name(msg_type), sent, recvd, hops or "-"))
+
+    ########################################
+    # pool of DEALER sockets
+    ########################################
+    def __socket(self, endpoint):
+        '''Open DEALER to endpoint, connecting a new one and closing the least recently used if needed'''
+        socket = self.sockets.get(endpoint)
+        if socket is not None:
+            self.sockets.move_to_end(endpoint)
+            return socket
+
+        for old in list(self.sockets):
+            if len(self.sockets) < self.connections:
+                break
+            if self.sockets[old] is self.current:
+                continue
+            self.logger.debug("DhtClient::__socket - closing the connection to {}".format(old))
+            self.poller.unregister(self.sockets[old])
+            self.sockets.pop(old).close(linger=0)
+
+        self.logger.debug("DhtClient::__socket - connecting to {}".format(endpoint))
+        socket = self.context.socket(zmq.DEALER)
+        socket.connect(endpoint)
+        self.poller.register(socket, zmq.POLLIN)
+        self.sockets[endpoint] = socket
+        return socket
+
+    def routing_stats(self):
+        '''Returns the open connections, known ring positions and owners learned'''
+        return {"connections": len(self.sockets), "positions": len(self.hashes), "learned": self.learned}
+
+    def close(self):
+        for socket in self.sockets.values():
+            self.poller.unregister(socket)
+            socket.close(linger=0)
+        self.sockets.clear()
+        self.current = None
@@ -36,20 +36,57 @@ import sys  # for syspath and system exception
 import time  # for sleep
 import logging  # for logging. Use it in place of print statements.
 import zmq  # ZMQ sockets
+import heapq  # deadlines of the requests we forwarded
+import itertools  # correlation ids
+import collections  # least recently used order of the dealers
 import traceback
+import shutil  # to remove the sockets of the worker pool
+import tempfile  # directory of the sockets of the worker pool
+import threading  # the proxy in front of the worker pool
+import multiprocessing  # the worker pool
 
 # import serialization logic
 from CS6381_MW import discovery_pb2
+from CS6381_MW.DiscoveryWorker import DiscoveryWorker
+from CS6381_MW.Metrics import Metrics, LOOP_BUCKETS
 
 from Chord.fingertablegen import FingerTableGen
+from Chord.fingertable import VirtualFingerTables
 from Chord.chordutils import ChordUtils
 from Chord.constants import *
-from Chord.hashgen import hashgen
 
 # from CS6381_MW import topic_pb2  # you will need this eventually
 
+# maintenance rounds after which our readiness counts go to the owner of the
+# readiness key again, even unchanged, in case they went to an owner in the making
+COUNTS_REFRESH = 30
+
 # import any other packages you need.
 
+##################################
+# A request waiting for the replies to the sub-requests we forwarded for it
+##################################
+class PendingRequest():
+
+    __slots__ = ("envelope", "req_id", "msg_type", "outstanding", "pubs", "failures", "cache_key", "local",
+                 "watch", "ready", "answered", "hops", "started")
+
+    def __init__(self, envelope: [], req_id, msg_type):
+        self.envelope = envelope  # ROUTER envelope of whoever sent us the request
+        self.req_id = req_id  # their correlation id, 0 for a client
+        self.msg_type = msg_type  # type of the request and of the answer
+        self.outstanding = 0  # forwarded sub-requests not answered yet
+        self.pubs = {}  # publisher id -> RegistrantInfo gathered by a lookup
+        self.failures = []  # why sub-requests failed or timed out
+        self.cache_key = None  # key of the answer in the lookup cache, None if not cacheable
+        self.local = True  # answered from our registry alone, nothing was forwarded
+        self.watch = None  # WatchResp gathered for a watch
+        self.ready = False  # the answer of the owner of the readiness key to an is_ready request
+        self.answered = False  # the answer went out; replies still coming in are dropped
+        self.hops = []  # TraceHops of the paths of a traced request that were served
+        self.started = time.monotonic()  # when we received the request
+
+
 ##################################
 # DiscoveryMW Middleware class
 ##################################
@@ -61,7 +98,13 @@ class DiscoveryMW():
     def __init__(self, logger):
         self.logger = logger  # internal logger for print statements
         self.router_socket = None
-        self.dealer_sockets_dict = {}
+        self.dealer_sockets_dict = collections.OrderedDict()  # physical node -> DEALER, least recently used first
+        self.dealer_sockets = set()  # the sockets of dealer_sockets_dict, to tell them apart in events
+        self.peer_connections = None  # DEALERs kept open at most, 0 for no limit
+        self.peer_outstanding = collections.Counter()  # physical node -> forwarded requests awaiting its reply
+        self.pending_peers = {}  # req_id of a forwarded request -> physical node it went to
+        self.peers_opened = 0  # DEALERs connected since we started
+        self.peers_closed = 0  # DEALERs closed to stay within peer_connections
         self.poller = None  # used to wait on incoming replies
         self.addr = None  # our advertised IP address
         self.port = None  # port num where we are going to publish our topics
@@ -73,10 +116,59 @@ class DiscoveryMW():
         self.num_ft_entries = None
         self.dht_info = None
         self.dht_sockets_dic = {}
+        self.context = None  # ZMQ context, kept to open dealers to peers on demand
+        self.stabilize_interval = None  # seconds between ring maintenance rounds, 0 disables them
+        self.fingers_per_round = None  # finger entries refreshed per virtual node and round
+        self.next_maintenance = None  # time.monotonic () of the next maintenance round
+        self.next_finger = {}  # virtual node id -> next finger entry to refresh
+        self.counts_rounds = 0  # maintenance rounds since our readiness counts all went out
+        self.counts_ring_generation = None  # ring generation at the last maintenance round
+        self.forward_timeout = None  # seconds a forwarded request may stay unanswered
+        self.pending = {}  # req_id of a request we forwarded -> PendingRequest waiting for it
+        self.deadlines = []  # heap of (deadline, req_id) of the forwarded requests
+        self.req_ids = itertools.count(1)  # source of correlation ids
+        self.cache_size = None  # most answers kept in the lookup cache, 0 disables it
+        self.lookup_cache = {}  # (msg type, sorted topics) -> serialized DiscoveryResp without req_id
+        self.cache_generation = None  # (registry, ring) generation the cached answers were built at
+        self.ring_generation = 0  # bumped whenever a finger or predecessor of ours changes
+        self.cache_hits = 0  # lookups answered from the cache
+        self.cache_misses = 0  # lookups not found in the cache
+        self.isready_wait = None  # seconds an ISREADY long poll is parked at most, 0 answers right away
+        self.parked = {}  # park id -> (envelope, req_id) of a parked ISREADY request, its deadline is in deadlines
+        self.parked_generation = None  # registry and ring count generations readiness was last evaluated at
+        self.watch_wait = None  # seconds a watch without changes is parked at most
+        self.watches = {}  # park id -> (PendingRequest, WatchReq) of a parked watch, its deadline is in deadlines
+        self.watch_generation = None  # registry generation the parked watches were last evaluated at
+        self.replicas = None  # successors of the owner of a key that keep a copy of its entries, 0 disables that
+        self.read_consistency = None  # "owner": only owners answer lookups, "replica": so does any copy on the way
+        self.replica_targets = {}  # virtual node id -> physical node the entries it owns were last copied to
+        self.replica_reads = 0  # lookup parts answered from a replica instead of the owner
+        self.ingress_queue = None  # requests served per wake-up; clients beyond that are shed
+        self.max_in_flight = None  # client requests waiting for other DHT nodes before new ones are shed
+        self.retry_after = None  # milliseconds a shed client is told to wait before it asks again
+        self.in_flight = 0  # client registrations and lookups we forwarded parts of and not answered yet
+        self.backlogged = False  # more requests are queued than we serve per wake-up
+        self.accepted = 0  # client requests admitted
+        self.shed = 0  # client requests answered with STATUS_CHECK_AGAIN instead
+        self.num_workers = 0  # worker processes serving reads from a copy of the registry, 0 serves all here
+        self.pool_dir = None  # directory of the ipc sockets between the proxy, us and the workers
+        self.proxy_context = None  # ZMQ context of the proxy thread in front of the pool
+        self.worker_intake = None  # PULL socket receiving the requests the workers pass to us
+        self.workers = []  # the worker processes
+        self.worker_updates = []  # PUSH socket to each worker carrying the changes of the registry
+        self.shared_ring_generation = None  # ring generation whose arcs the application and the workers know
+        self.owner_hints = {}  # envelope of a want_owner client request -> serialized DiscoveryResp naming the owner
+        self.metrics = Metrics("discovery")  # runtime counters, served on a port of their own if configured
+        self.__declare_metrics()
+
     ########################################
     # configure/initialize
     ########################################
-    def configure(self, args, dht_info, num_ft_entries, finger_table:[]):
+    def configure(self, args, dht_info, num_ft_entries, finger_table: VirtualFingerTables,
+                  stabilize_interval=1000, fingers_per_round=4, forward_timeout=5000, cache_size=4096,
+                  isready_wait=30000, watch_wait=30000, replicas=0, read_consistency="owner",
+                  router_hwm=1000, ingress_queue=256, max_in_flight=1024, retry_after=100, workers=0,
+                  peer_connections=64, io_threads=1, metrics_offset=0):
         ''' Initialize the object '''
 
         try:
@@ -89,10 +181,27 @@ class DiscoveryMW():
             self.dht_info  = dht_info
             self.num_ft_entries = num_ft_entries
             self.finger_table = finger_table
+            self.stabilize_interval = stabilize_interval / 1000.0
+            self.fingers_per_round = fingers_per_round
+            self.next_maintenance = time.monotonic() + self.stabilize_interval
+            self.forward_timeout = forward_timeout / 1000.0
+            self.cache_size = cache_size
+            self.isready_wait = isready_wait / 1000.0
+            self.watch_wait = watch_wait / 1000.0
+            if read_consistency not in ("owner", "replica"):
+                raise ValueError("ReadConsistency must be owner or replica, not {}".format(read_consistency))
+            self.replicas = replicas
+            self.read_consistency = read_consistency
+            self.ingress_queue = ingress_queue
+            self.max_in_flight = max_in_flight
+            self.retry_after = retry_after
+            self.num_workers = workers
+            self.peer_connections = peer_connections
 
             # Next get the ZMQ context
             self.logger.debug("DiscoveryMW::configure - obtain ZMQ context")
-            context = zmq.Context()  # returns a singleton object
+            context = self.create_context(io_threads)
+            self.context = context
 
             # get the ZMQ poller object
             self.logger.debug("DiscoveryMW::configure - obtain the poller")
@@ -101,40 +210,194 @@ class DiscoveryMW():
             # Set up the ROUTER socket as a front-end
             self.logger.debug("DiscoveryMW::configure - setting up Router")
 
-            self.router_socket = context.socket(zmq.ROUTER)
-            self.router_socket.identity = str(self.dht_info.get(ID)).encode()
-            self.poller.register(self.router_socket, zmq.POLLIN)
             bind_str = "tcp://*:" + str(args.port)
             self.logger.debug("bind_str = {}".format(bind_str))
-            self.router_socket.bind(bind_str)
-
-            # create a dealer for successor in the finger table.
-            self.logger.debug("DiscoveryMW::configure - setting up Dealer")
-
-            # Establish dealer connections only for unique successors
-            # Extract the dictionary items from the original_list portion of the tuples
-            original_list = [d for _, d in finger_table]
+            if self.num_workers > 0:
+                # the ROUTER is the front end of a proxy dealing requests out to us and
+                # the workers (see DiscoveryWorker). Our end is a DEALER; it receives and
+                # answers the same frames a ROUTER would.
+                self.pool_dir = tempfile.mkdtemp(prefix="{}-pool-".format(self.dht_info.get(ID)))
+                self.__start_proxy(bind_str, router_hwm)
+                self.router_socket = context.socket(zmq.DEALER)
+                self.router_socket.connect("ipc://{}/backend".format(self.pool_dir))
+                self.worker_intake = context.socket(zmq.PULL)
+                self.worker_intake.bind("ipc://{}/writer".format(self.pool_dir))
+                self.poller.register(self.worker_intake, zmq.POLLIN)
+            else:
+                self.router_socket = context.socket(zmq.ROUTER)
+                self.router_socket.identity = str(self.dht_info.get(ID)).encode()
+                # bound what ZMQ queues for us in either direction; beyond that it drops
+                self.router_socket.setsockopt(zmq.RCVHWM, router_hwm)
+                self.router_socket.setsockopt(zmq.SNDHWM, router_hwm)
+                self.router_socket.bind(bind_str)
+            self.poller.register(self.router_socket, zmq.POLLIN)
 
-            # Create a set of tuples containing the dictionary items
-            tuple_set = set(tuple(sorted(d.items())) for d in original_list)
+            # Dealers to the other DHT nodes are connected the first time we send to
+            # them (see __peer_socket), not one per finger up front: on a large ring most
+            # fingers carry no traffic for a long time, if ever.
+            self.logger.debug(f"DiscoveryMW::configure - at most {peer_connections or 'unlimited'} dealers")
 
-            # Convert the tuples back to dictionaries
-            unique_successors = [dict(t) for t in tuple_set]
+            # if we are joining a running ring, ask the node we were pointed at to look
+            # up the successor of each of our virtual nodes
+            if args.join:
+                self.join(args.join)
 
-            for successor in unique_successors:
-                self.logger.info(f"DiscoveryMW::configure successor- {successor}")
-                dealer_socket = context.socket(zmq.DEALER)
-                dealer_socket.identity = self.router_socket.identity
-                conn_str = f"tcp://{successor.get(IP)}:{successor.get(PORT)}"
-                dealer_socket.connect(conn_str)
-                self.dealer_sockets_dict[successor.get(ID)] = dealer_socket
-                self.logger.info(f"DiscoveryMW::configure - adding dealer for {successor.get(ID)} with connection {conn_str}")
+            # our metrics, next to our port
+            if metrics_offset:
+                self.logger.debug(f"DiscoveryMW::configure - metrics on port {self.port + metrics_offset}")
+                self.metrics.start(self.port + metrics_offset)
 
             self.logger.info("DiscoveryMW::configure completed")
 
         except Exception as e:
             raise e
 
+    ########################################
+    # the series of our metrics
+    ########################################
+    def __declare_metrics(self):
+        m = self.metrics
+        m.counter("requests_total", "Requests received from clients and other DHT nodes by type", ("type",))
+        m.counter("forwarded_total", "Requests and sub-requests sent on to other DHT nodes")
+        m.counter("peer_timeouts_total", "Forwarded requests other DHT nodes did not answer in time")
+        m.counter("accepted_total", "Client requests admitted", fn=lambda: self.accepted)
+        m.counter("shed_total", "Client requests told to check again later", fn=lambda: self.shed)
+        m.counter("cache_hits_total", "Lookups answered from the lookup cache", fn=lambda: self.cache_hits)
+        m.counter("cache_misses_total", "Lookups not found in the lookup cache", fn=lambda: self.cache_misses)
+        m.counter("replica_reads_total", "Lookup parts answered from a replica", fn=lambda: self.replica_reads)
+        m.counter("peers_opened_total", "Dealers to other DHT nodes connected", fn=lambda: self.peers_opened)
+        m.counter("peers_closed_total", "Dealers to other DHT nodes closed to stay within PeerConnections",
+                  fn=lambda: self.peers_closed)
+        m.gauge("pending", "Forwarded requests waiting for a reply", fn=lambda: len(self.pending))
+        m.gauge("in_flight", "Client requests waiting for other DHT nodes", fn=lambda: self.in_flight)
+        m.gauge("parked_isready", "Is ready long polls waiting for the expected registrations",
+                fn=lambda: len(self.parked))
+        m.gauge("parked_watches", "Watches waiting for changes", fn=lambda: len(self.watches))
+        m.gauge("dealers", "Open dealers to other DHT nodes", fn=lambda: len(self.dealer_sockets_dict))
+        m.gauge("cache_entries", "Answers in the lookup cache", fn=lambda: len(self.lookup_cache))
+        m.histogram("request_seconds", "Seconds from receiving a client request to answering it", labels=("type",))
+        m.histogram("loop_seconds", "Seconds spent on the events of one wake-up of the event loop", LOOP_BUCKETS)
+
+    ########################################
+    # worker pool
+    #
+    # The proxy runs zmq.proxy on a thread of its own, i.e., in C
+    # without the GIL. We are the only writer of the registry; every
+    # change we apply is sent to each worker, together with the arcs
+    # of keys we own whenever the ring changed. The arcs also go to the
+    # application, which counts the registrations on each of them.
+    ########################################
+    def __start_proxy(self, bind_str, router_hwm):
+        '''Binds the ROUTER the clients and DHT nodes talk to and deals its requests out to the pool'''
+        self.proxy_context = zmq.Context()
+        frontend = self.proxy_context.socket(zmq.ROUTER)
+        frontend.identity = str(self.dht_info.get(ID)).encode()
+        # bound what ZMQ queues for us in either direction; beyond that it drops
+        frontend.setsockopt(zmq.RCVHWM, router_hwm)
+        frontend.setsockopt(zmq.SNDHWM, router_hwm)
+        frontend.bind(bind_str)
+        backend = self.proxy_context.socket(zmq.DEALER)
+        backend.bind("ipc://{}/backend".format(self.pool_dir))
+
+        def proxy():
+            try:
+                zmq.proxy(frontend, backend)
+            except zmq.ContextTerminated:
+                pass  # we are leaving
+            finally:
+                frontend.close(linger=0)
+                backend.close(linger=0)
+
+        threading.Thread(target=proxy, daemon=True).start()
+
+    def start_workers(self):
+        '''Forks the worker processes, each with a copy of the registry as it is now'''
+        if self.num_workers <= 0:
+            return
+        # the workers start with the arcs the application knows
+        self.__share_ring()
+        fork = multiprocessing.get_context("fork")
+        for i in range(self.num_workers):
+            update_addr = "ipc://{}/worker{}".format(self.pool_dir, i)
+            worker = DiscoveryWorker(self.logger, self.upcall_obj, self.num_ft_entries, self.__owned_arcs(),
+                                     self.read_consistency, self.isready_wait,
+                                     "ipc://{}/backend".format(self.pool_dir), update_addr,
+                                     "ipc://{}/writer".format(self.pool_dir))
+            process = fork.Process(target=worker.run, daemon=True)
+            process.start()
+            self.workers.append(process)
+
+            # a connecting PUSH queues the updates until the worker has bound its end
+            updates = self.context.socket(zmq.PUSH)
+            updates.setsockopt(zmq.SNDHWM, 0)
+            updates.connect(update_addr)
+            self.worker_updates.append(updates)
+        self.logger.info(f"DiscoveryMW::start_workers - {self.num_workers} workers started")
+
+    def __owned_arcs(self):
+        '''(virtual node, start, end) of the arcs of keys (start, end] our virtual nodes own'''
+        arcs = []
+        for table in self.finger_table:
+            if table.predecessor is not None:
+                arcs.append((table.node[ID], table.predecessor[HASH], table.node[HASH]))
+            elif table.successor[ID] == table.node[ID]:
+                arcs.append((table.node[ID], table.node[HASH], table.node[HASH]))  # alone on the ring
+        return arcs
+
+    def __share(self, update):
+        '''Sends a change of our registry or ring to every worker'''
+        buf = update.SerializeToString()
+        for updates in self.worker_updates:
+            self.send_frames(updates, [buf])
+
+    def __share_record(self, op, key_type, register_req):
+        '''Tells the workers about a registration or unregistration we applied'''
+        if not self.worker_updates:
+            return
+        update = discovery_pb2.WorkerUpdate()  # allocate
+        update.record.op = op
+        update.record.key_type = key_type
+        update.record.reg.CopyFrom(register_req)
+        self.__share(update)
+
+    def __share_ring(self):
+        '''Tells the application and the workers which keys we own if that changed'''
+        if self.shared_ring_generation == self.ring_generation:
+            return
+        self.shared_ring_generation = self.ring_generation
+        arcs = self.__owned_arcs()
+        self.upcall_obj.set_ring_arcs(arcs)
+        if not self.worker_updates:
+            return
+        update = discovery_pb2.WorkerUpdate()  # allocate
+        update.ring = True
+        for node, start, end in arcs:
+            update.arc_nodes.append(node)
+            update.arc_starts.append(start)
+            update.arc_ends.append(end)
+        self.__share(update)
+
+    ########################################
+    # hooks for the event loop flavor
+    #
+    # The asyncio variant (AsyncDiscoveryMW) overrides these.
+    ########################################
+    def create_context(self, io_threads=1):
+        '''ZMQ context all our sockets are created from'''
+        return zmq.Context.instance(io_threads)  # returns a singleton object
+
+    def send_frames(self, socket, frames:[]):
+        '''Sends a message on one of our sockets; every message we send goes out here'''
+        socket.send_multipart(frames)
+
+    def watch_dealer(self, dealer_socket):
+        '''Makes the event loop listen for answers on a new DEALER'''
+        self.poller.register(dealer_socket, zmq.POLLIN)
+
+    def unwatch_dealer(self, dealer_socket):
+        '''Stops listening on a DEALER that is about to be closed'''
+        self.poller.unregister(dealer_socket)
+
     #################################################################
     # run the event loop where we expect to receive incoming requests
     # WHERE [WHICH DHT NODE] TO RECIEVE INCOMING REQUEST
@@ -148,9 +411,34 @@ class DiscoveryMW():
             # True but can be set out of band to False in order to exit this forever
             # loop
             while self.handle_events:  # it starts with a True value
-                # poll for events. We give it an infinite timeout.
+                # poll for events. We give it an infinite timeout unless the ring
+                # maintenance or the deadline of a forwarded request is due earlier.
                 # The return value is a socket to event mask mapping
-                events = dict(self.poller.poll(timeout=timeout))
+                poll_timeout = timeout
+                timers = []
+                if self.stabilize_interval > 0:
+                    timers.append(self.next_maintenance)
+                if self.deadlines:
+                    timers.append(self.deadlines[0][0])
+                if timers:
+                    remaining = max(0, int((min(timers) - time.monotonic()) * 1000))
+                    poll_timeout = remaining if timeout is None else min(timeout, remaining)
+                events = dict(self.poller.poll(timeout=poll_timeout))
+                woke = time.perf_counter()
+
+                # stabilize and fix fingers when it is time to do so
+                if self.stabilize_interval > 0 and time.monotonic() >= self.next_maintenance:
+                    self.run_maintenance()
+                    self.next_maintenance = time.monotonic() + self.stabilize_interval
+
+                # give up on forwarded requests that were not answered in time
+                self.expire_pending()
+
+                # if a timer is the only reason we woke up, go back to waiting with
+                # the same timeout
+                if not events and poll_timeout != timeout:
+                    self.metrics.observe("loop_seconds", time.perf_counter() - woke)
+                    continue
 
                 # Unlike the previous starter code, here we are never returning from
                 # the event loop but handle everything in the same locus of control
@@ -166,17 +454,22 @@ class DiscoveryMW():
                     # object is in.
                     timeout = self.upcall_obj.invoke_operation()
 
-                elif self.router_socket in events:
-                    self.logger.info("DiscoveryMW::event_loop - router received event")
-                    timeout = self.handle_request()
-                elif self.dealer_sockets_dict in events:
-                    self.logger.info("DiscoveryMW::event_loop - dealer received event")
-                    # If a message is received on the backend socket, route it back to the frontend socket
-
-                    # message = backend.recv_multipart()
-                    self.router_socket.send_multipart(message)
                 else:
-                    raise Exception("Unknown event after poll")
+                    # requests from clients and other DHT nodes arrive on the ROUTER,
+                    # answers to the requests we forwarded on the DEALER they left from
+                    for socket in events:
+                        if socket is self.router_socket or socket is self.worker_intake:
+                            self.logger.info("DiscoveryMW::event_loop - router received event")
+                            timeout = self.handle_request(socket)
+                        elif socket in self.dealer_sockets:
+                            self.logger.debug("DiscoveryMW::event_loop - dealer received event")
+                            self.handle_reply(socket)
+                        elif socket.closed:
+                            continue  # a dealer we closed while handling an earlier event
+                        else:
+                            raise Exception("Unknown event after poll")
+
+                self.metrics.observe("loop_seconds", time.perf_counter() - woke)
 
             self.logger.info("DiscoveryMW::event_loop - out of the event loop")
         except Exception as e:
@@ -186,46 +479,46 @@ class DiscoveryMW():
     # handle an incoming request
     #################################################################
     def find_successor(self, key) -> {}:
+        '''Returns the (virtual) node the request for key goes to next; one of our own when we own the key'''
         self.logger.info(f"DiscoveryMW::find_successor - start key {key}")
-        # self.logger.info(f"DiscoveryMW::find_successor - fingle_table: {self.finger_table}")
-        if self.dht_info.get(HASH) == key:
-            self.logger.info(f"DiscoveryMW::find_successor - successor: {self.dht_info}")
-            return self.dht_info
-
-        if self.finger_table[0][1].get(HASH) == self.dht_info.get(ID):
-            self.logger.info(f"DiscoveryMW::find_successor - successor: {self.dht_info}")
-            return self.dht_info
-
-        if self.dht_info.get(HASH)  < key <= self.finger_table[0][1].get(HASH):
-            self.logger.info(f"DiscoveryMW::find_successor - successor: {self.finger_table[0][1]}")
-            return self.finger_table[0][1]
+        successor = self.finger_table.next_hop(key)
+        self.logger.info(f"DiscoveryMW::find_successor - successor: {successor}")
+        return successor
 
-        return self.__closest_preceding_node(key)
+    def handle_request(self, socket=None):
 
-    def __closest_preceding_node(self, key):
-        '''Determines who is the closest successor based on the finger table'''
-
-        self.logger.info(f"DiscoveryMW::__closest_preceding_node - start key {key}")
-        for i in range(len(self.finger_table) - 1, -1, -1):
-            if self.finger_table[i][1].get(HASH) > self.dht_info.get(HASH) and self.finger_table[i][1].get(HASH)  < key:
-                self.logger.info(f"DiscoveryMW::__closest_preceding_node - successor: {self.finger_table[i][1]}")
-                return self.finger_table[i][1]
+        try:
+            self.logger.info("DiscoveryMW::handle_request")
+            # requests come from the ROUTER or, with a worker pool, also from the workers
+            socket = socket if socket is not None else self.router_socket
+
+            # let us first receive all the bytes. We serve up to ingress_queue requests
+            # per wake-up; whatever is queued after those waited too long already, so the
+            # clients among them are shed and told to come back later. The next poll
+            # waits no longer than the shortest timeout any of them asked for.
+            timeout = None
+            for i in range(2 * self.ingress_queue):
+                try:
+                    rcv_parts = socket.recv_multipart(zmq.NOBLOCK)
+                except zmq.Again:
+                    break
+                self.backlogged = i >= self.ingress_queue
+                request_timeout = self.process_request(rcv_parts)
+                if request_timeout is not None:
+                    timeout = request_timeout if timeout is None else min(timeout, request_timeout)
+            self.backlogged = False
+            return timeout
 
-        self.logger.info(f"DiscoveryMW::find_successor - successor: {self.dht_info}")
-        return self.dht_info
+        except Exception as e:
+            raise e
 
-    def handle_request(self):
+    def process_request(self, rcv_parts:[]):
+        '''Handles one request received on the ROUTER; returns the timeout for the next poll'''
 
         try:
-            self.logger.info("DiscoveryMW::handle_request")
-
-            # let us first receive all the bytes
-            rcv_parts = self.router_socket.recv_multipart()
-            self.logger.info(f"DiscoveryMW::handle_request - register - rcv_parts: {rcv_parts}")
-            prv_nodes = []
+            self.logger.debug(f"DiscoveryMW::process_request - rcv_parts: {rcv_parts}")
 
             bytesRcvd = rcv_parts[len(rcv_parts) - 1]
-            self.logger.info(f"DiscoveryMW::handle_request - register - bytesRcvd: {bytesRcvd}")
 
             # now use protobuf to deserialize the bytes
             # The way to do this is to first allocate the space for the
@@ -233,6 +526,19 @@ class DiscoveryMW():
             # the incoming bytes and populate this structure (via protobuf code)
             disc_req = discovery_pb2.DiscoveryReq()
             disc_req.ParseFromString(bytesRcvd)
+            self.metrics.inc("requests_total", discovery_pb2.MsgTypes.Name(disc_req.msg_type))
+
+            # a new request of a client waits for a better moment if we are overloaded
+            if not self.__admit(rcv_parts, disc_req):
+                return 0
+
+            # a traced request records that it passed us
+            if disc_req.trace:
+                self.__trace_arrival(disc_req)
+
+            # a client routing by key itself learns the owner of its key with the answer
+            if disc_req.want_owner and not disc_req.forwarded and not disc_req.req_id:
+                self.__note_owner(rcv_parts[:-1], disc_req.dht_key)
 
             # demultiplex the message based on the message type but let the application
             # object handle the contents as it is best positioned to do so. See how we make
@@ -240,163 +546,175 @@ class DiscoveryMW():
             #
             # Note also that we expect the return value to be the desired timeout to use
             # in the next iteration of the poll.
-            if (disc_req.msg_type == discovery_pb2.TYPE_REGISTER):
-
-
-                # register on the node according to the role
-                # CREATE A HASH VALUE OF THE NODE
-                req_hash = hashgen(self.num_ft_entries, str(disc_req.register_req.role))
-
-                # get the appropriate successor
-                successor = self.find_successor(req_hash)
-
-                # if this is the correct service to handle the request, else pass it on
-                if successor.get(ID) == self.dht_info.get(ID):
-                    self.upcall_obj.register_request(disc_req.register_req)
-
-                    # Build a RegisterResp message
-                    self.logger.debug ("DiscoveryMW::register - populate the nested register resp")
-                    register_resp = discovery_pb2.RegisterResp()  # allocate
-                    register_resp.status = discovery_pb2.STATUS_SUCCESS  # registration successful
-                    self.logger.debug ("DiscoveryMW::register - done populating nested RegisterResp")
-
-                    # Finally, build the outer layer DiscoveryResp Message
-                    self.logger.debug ("DiscoveryMW::register - build the outer DiscoveryReq message")
-                    disc_resp = discovery_pb2.DiscoveryResp()  # allocate
-                    disc_resp.msg_type = discovery_pb2.TYPE_REGISTER  # set message type
-                    # It was observed that we cannot directly assign the nested field here.
-                    # A way around is to use the CopyFrom method as shown
-                    disc_resp.register_resp.CopyFrom(register_resp)
-                    self.logger.debug ("DiscoveryMW::register - done building the outer message")
+            if disc_req.msg_type in (discovery_pb2.TYPE_REGISTER, discovery_pb2.TYPE_UNREGISTER):
 
-                    # now let us stringify the buffer and print it. This is actually a sequence of bytes and not
-                    # a real string
-                    buf2send = disc_resp.SerializeToString ()
-                    self.logger.debug ("Stringified serialized buf = {}".format (buf2send))
-
-                    # now send this to our discovery service
-                    self.logger.debug ("DiscoveryMW::register - send stringified buffer to client")
-
-                    if len(rcv_parts) > 2:
-                        prev_sender = rcv_parts.pop(0)
+                if disc_req.forwarded:
+                    # a sub-request split by another DHT node. Store it if we own its key
+                    # or pass it on towards the owner.
+                    self.__serve_forwarded(rcv_parts, disc_req)
+                    self.__registry_changed()
+                    return 0
 
-                    rcv_parts[len(rcv_parts)-1] = buf2send
-                        # We are back at the original dht node, send response back to the client.
-                    self.logger.info(f"DiscoveryMW::register - sending {rcv_parts}")
-                    self.router_socket.send_multipart(rcv_parts)  # we use the "send" method of ZMQ that sends the bytes
-
-                    # now go to our event loop to receive more requests
-                    self.logger.info ("DiscoveryMW::register - sent register response and now wait for more incoming msgs")
-                else:
-                    # forward to successor node
-                    self.__forward_find_successor(successor, rcv_parts)
+                # A client registration. Registrations are spread over the ring: the record
+                # of the registrant lives with the owner of its entity id and every topic of
+                # a publisher is stored with the owner of that topic. The client hears back
+                # once every owner has acknowledged its part. Unregistrations take the same way.
+                field = "register_req" if disc_req.msg_type == discovery_pb2.TYPE_REGISTER else "unregister_req"
+                pending = PendingRequest(rcv_parts[:-1], 0, disc_req.msg_type)
+                self.in_flight += 1
+                for key, key_type, register_req in self.__registration_keys(getattr(disc_req, field)):
+                    sub_req = discovery_pb2.DiscoveryReq()  # allocate
+                    sub_req.msg_type = disc_req.msg_type
+                    getattr(sub_req, field).CopyFrom(register_req)
+                    sub_req.forwarded = True
+                    sub_req.dht_key = key
+                    sub_req.key_type = key_type
+                    self.__trace_into(disc_req, sub_req)
+                    self.__serve_or_forward(sub_req, pending)
+
+                # answers right away if we own all the keys ourselves
+                self.__complete(pending)
+                self.__registry_changed()
 
+                # now go to our event loop to receive more requests
+                self.logger.info ("DiscoveryMW::register - registration in progress, wait for more incoming msgs")
                 return 0
             elif (disc_req.msg_type == discovery_pb2.TYPE_ISREADY):
+                # only the owner of the readiness key adds up the counts of the whole
+                # ring; everybody else passes the request on towards it
+                key = ChordUtils.readiness_key(self.num_ft_entries)
+                successor, owner = self.finger_table.route(key)
+                if not disc_req.at_owner and not self.finger_table.is_local(successor):
+                    pending = PendingRequest(rcv_parts[:-1], disc_req.req_id, discovery_pb2.TYPE_ISREADY)
+                    if not disc_req.req_id:
+                        self.in_flight += 1
+                    sub_req = discovery_pb2.DiscoveryReq()  # allocate
+                    sub_req.msg_type = discovery_pb2.TYPE_ISREADY
+                    sub_req.isready_req.CopyFrom(disc_req.isready_req)
+                    sub_req.forwarded = True
+                    sub_req.dht_key = key
+                    sub_req.at_owner = owner
+                    self.logger.info(f"DiscoveryMW::isready - forwarding to {successor.get(PHYSICAL)}")
+                    self.__forward(successor, sub_req, pending)
+                    return 0
+
                 # this is a response to is ready request
                 ready = self.upcall_obj.isready_request(disc_req.isready_req)
 
-                # Build a RegisterResp message
-                self.logger.debug ("DiscoveryMW::isready - populate the nested IsReadyResp resp")
-                isready_resp = discovery_pb2.IsReadyResp()  # allocate
-
-                if ready:
-                    isready_resp.status = 1  # ready
-                else:
-                    isready_resp.status = 0  # not ready
-
-                self.logger.debug ("DiscoveryMW::isready - done populating nested RegisterResp")
-
-                # Finally, build the outer layer DiscoveryResp Message
-                self.logger.debug ("DiscoveryMW::isready - build the outer DiscoveryReq message")
-                disc_resp = discovery_pb2.DiscoveryResp()  # allocate
-                disc_resp.msg_type = discovery_pb2.TYPE_ISREADY  # set message type
-                # It was observed that we cannot directly assign the nested field here.
-                # A way around is to use the CopyFrom method as shown
-                disc_resp.isready_resp.CopyFrom(isready_resp)
-                self.logger.debug ("DiscoveryMW::isready - done building the outer message")
-
-                # now let us stringify the buffer and print it. This is actually a sequence of bytes and not
-                # a real string
-                buf2send = disc_resp.SerializeToString ()
-                self.logger.debug ("Stringified serialized buf = {}".format (buf2send))
+                if not ready and disc_req.isready_req.wait and self.isready_wait > 0:
+                    # a long poll. Instead of the client asking again and again we park the
+                    # request and answer it the moment the expected registrations are in, or
+                    # with not ready once it waited isready_wait and the client asks again.
+                    park_id = next(self.req_ids)
+                    self.parked[park_id] = (rcv_parts[:-1], disc_req.req_id)
+                    self.parked_generation = (self.upcall_obj.generation, self.upcall_obj.counts_generation)
+                    heapq.heappush(self.deadlines, (time.monotonic() + self.isready_wait, park_id))
+                    self.logger.info ("DiscoveryMW::isready - not ready, parked the request")
+                    return 0
 
-                # now send this to our discovery service
+                # now send this to the client, or the DHT node that forwarded it
                 self.logger.debug ("DiscoveryMW::isready - send stringified buffer to client")
-                self.router_socket.send (buf2send)  # we use the "send" method of ZMQ that sends the bytes
+                self.__reply(rcv_parts[:-1], disc_req.req_id, self.__isready_buf(ready))
 
                 # now go to our event loop to receive more requests
                 self.logger.info ("DiscoveryMW::isready - sent isready response and now wait for more incoming msgs")
                 return 0
-            elif (disc_req.msg_type == discovery_pb2.TYPE_LOOKUP_PUB_BY_TOPIC):
-
-                try:
-                    pub_list = self.upcall_obj.lookup_pubs_topic_request(disc_req.lookup_req)
-
-                    # Build a LookupPubByTopicResp message
-                    self.logger.debug ("DiscoveryMW::lookup - populate the nested LookupPubByTopicResp resp")
-                    lookup_resp = discovery_pb2.LookupPubByTopicResp()  # allocate
-                    self.logger.debug(pub_list)
-
-                    lookup_resp.pubs.extend(pub_list)
-
-                    self.logger.debug ("DiscoveryMW::lookup - done populating LookupPubByTopicResp")
+            elif (disc_req.msg_type == discovery_pb2.TYPE_CHORD):
+                # ring maintenance from another DHT node. Nobody waits for a reply on
+                # this connection; answers are sent as new messages.
+                self.handle_chord(disc_req.chord_msg)
+                # watchers of topics we handed over have to ask the new owner, and
+                # new counts of other nodes may decide parked is_ready requests
+                self.__registry_changed()
+                return 0
+            elif (disc_req.msg_type == discovery_pb2.TYPE_REPLICA):
+                # a copy of the entries of a key one of our predecessors owns
+                self.__store_replica(disc_req.replica_msg)
+                return 0
+            elif (disc_req.msg_type == discovery_pb2.TYPE_WATCH):
+                if disc_req.forwarded:
+                    # the part of a watch whose topics we own or can pass on
+                    self.__serve_forwarded(rcv_parts, disc_req)
+                    return 0
 
-                    # Finally, build the outer layer DiscoveryResp Message
-                    self.logger.debug ("DiscoveryMW::lookup - build the outer DiscoveryReq message")
-                    disc_resp = discovery_pb2.DiscoveryResp()  # allocate
-                    disc_resp.msg_type = discovery_pb2.TYPE_LOOKUP_PUB_BY_TOPIC  # set message type
-                    disc_resp.lookup_resp.CopyFrom(lookup_resp)
-                    self.logger.debug ("DiscoveryMW::lookup - done building the outer message")
+                # every owner of a watched topic answers with the changes after the versions
+                # the watcher has seen, or holds its part until there are some. The watcher
+                # hears back as soon as any owner has changes for it.
+                pending = PendingRequest(rcv_parts[:-1], 0, discovery_pb2.TYPE_WATCH)
+                for key, topics in self.__topic_keys(disc_req.watch_req.topiclist):
+                    sub_req = discovery_pb2.DiscoveryReq()  # allocate
+                    sub_req.msg_type = discovery_pb2.TYPE_WATCH
+                    sub_req.watch_req.topiclist.extend(topics)
+                    sub_req.watch_req.versions.extend(v for v in disc_req.watch_req.versions if v.topic in topics)
+                    sub_req.forwarded = True
+                    sub_req.dht_key = key
+                    self.__trace_into(disc_req, sub_req)
+                    self.__serve_or_forward(sub_req, pending)
+
+                # answers right away if we own all the topics and have changes
+                self.__complete(pending)
 
-                    # now let us stringify the buffer and print it. This is actually a sequence of bytes and not
-                    # a real string
-                    buf2send = disc_resp.SerializeToString ()
-                    self.logger.debug ("Stringified serialized buf = {}".format (buf2send))
+                # now go to our event loop to receive more requests
+                self.logger.info ("DiscoveryMW::watch - watch in progress, wait for more incoming msgs")
+                return 0
+            elif (disc_req.msg_type == discovery_pb2.TYPE_LOOKUP_PUB_BY_TOPIC):
 
-                    # now send this to our discovery service
-                    self.logger.debug ("DiscoveryMW::lookup - send stringified buffer to client")
-                    self.router_socket.send (buf2send)  # we use the "send" method of ZMQ that sends the bytes
+                try:
+                    if disc_req.forwarded:
+                        # the part of a lookup whose topics we own or can pass on
+                        self.__serve_forwarded(rcv_parts, disc_req)
+                        return 0
+
+                    # the same answer as last time if our registry answered it alone and
+                    # neither the registry nor the ring changed since
+                    cache_key = self.__cache_key(disc_req)
+                    if self.__send_cached(rcv_parts[:-1], 0, cache_key, disc_req):
+                        return 0
+
+                    # topics are stored with the owners of their keys. Ask each of them and
+                    # answer the subscriber with the union once all of them replied.
+                    pending = PendingRequest(rcv_parts[:-1], 0, discovery_pb2.TYPE_LOOKUP_PUB_BY_TOPIC)
+                    self.in_flight += 1
+                    pending.cache_key = cache_key
+                    for key, topics in self.__lookup_keys(disc_req.lookup_req):
+                        sub_req = discovery_pb2.DiscoveryReq()  # allocate
+                        sub_req.msg_type = discovery_pb2.TYPE_LOOKUP_PUB_BY_TOPIC
+                        sub_req.lookup_req.topiclist.extend(topics)
+                        sub_req.forwarded = True
+                        sub_req.dht_key = key
+                        self.__trace_into(disc_req, sub_req)
+                        self.__serve_or_forward(sub_req, pending)
+
+                    # answers right away if we own all the topics ourselves
+                    self.__complete(pending)
 
                     # now go to our event loop to receive more requests
-                    self.logger.info ("DiscoveryMW::lookup - sent lookup response and now wait for more incoming msgs")
+                    self.logger.info ("DiscoveryMW::lookup - lookup in progress, wait for more incoming msgs")
                     return 0
                 except Exception:
                     self.logger.debug (traceback.print_exc())
             elif (disc_req.msg_type == discovery_pb2.TYPE_LOOKUP_ALL_PUBS):
                 try:
-                    pub_list = self.upcall_obj.lookup_all_pubs()
-
-                    # Build a LookupPubByTopicResp message
-                    self.logger.debug ("DiscoveryMW::lookup - populate the nested LookupPubByTopicResp resp")
-                    lookup_resp = discovery_pb2.LookupPubByTopicResp()  # allocate
-                    self.logger.debug(pub_list)
-
-                    lookup_resp.pubs.extend(pub_list)
-                    # for index, item in enumerate(pub_list):
-                    #     lookup_resp.pubs.append(item)
-
-                    # lookup_resp.pubs[:] = pub_list
-                    self.logger.debug ("DiscoveryMW::lookup - done populating LookupPubByTopicResp")
-
-                    # Finally, build the outer layer DiscoveryResp Message
-                    self.logger.debug ("DiscoveryMW::lookup - build the outer DiscoveryReq message")
-                    disc_resp = discovery_pb2.DiscoveryResp()  # allocate
-                    disc_resp.msg_type = discovery_pb2.TYPE_LOOKUP_ALL_PUBS  # set message type
-                    disc_resp.lookup_resp.CopyFrom(lookup_resp)
-                    self.logger.debug ("DiscoveryMW::lookup - done building the outer message")
-
-                    # now let us stringify the buffer and print it. This is actually a sequence of bytes and not
-                    # a real string
-                    buf2send = disc_resp.SerializeToString ()
-                    self.logger.debug ("Stringified serialized buf = {}".format (buf2send))
-
-                    # now send this to our discovery service
-                    self.logger.debug ("DiscoveryMW::lookup - send stringified buffer to client")
-                    self.router_socket.send (buf2send)  # we use the "send" method of ZMQ that sends the bytes
+                    # publishers are stored with the owners of their entity ids, so the
+                    # request walks once around the ring and collects them on its way back
+                    if disc_req.forwarded:
+                        pending = PendingRequest(rcv_parts[:-1], disc_req.req_id, discovery_pb2.TYPE_LOOKUP_ALL_PUBS)
+                        self.__walk_all_pubs(disc_req.dht_key, disc_req.walk_start, pending)
+                    else:
+                        cache_key = self.__cache_key(disc_req)
+                        if self.__send_cached(rcv_parts[:-1], 0, cache_key, disc_req):
+                            return 0
+                        pending = PendingRequest(rcv_parts[:-1], 0, discovery_pb2.TYPE_LOOKUP_ALL_PUBS)
+                        self.in_flight += 1
+                        pending.cache_key = cache_key
+                        start = next(iter(self.finger_table)).node[HASH]
+                        self.__walk_all_pubs(start, start, pending)
+
+                    # answers right away if we are the only node
+                    self.__complete(pending)
 
                     # now go to our event loop to receive more requests
-                    self.logger.info ("DiscoveryMW::lookup - sent lookup response and now wait for more incoming msgs")
+                    self.logger.info ("DiscoveryMW::lookup - lookup of all pubs in progress, wait for more incoming msgs")
                     return 0
                 except Exception:
                     self.logger.debug (traceback.print_exc())
@@ -410,27 +728,1057 @@ class DiscoveryMW():
         except Exception as e:
             raise e
 
-    def handle_response(self):
+    def __isready_buf(self, ready):
+        '''Serialized answer to an ISREADY request'''
+        # Build a IsReadyResp message
+        self.logger.debug ("DiscoveryMW::isready - populate the nested IsReadyResp resp")
+        isready_resp = discovery_pb2.IsReadyResp()  # allocate
+
+        if ready:
+            isready_resp.status = 1  # ready
+        else:
+            isready_resp.status = 0  # not ready
+
+        self.logger.debug ("DiscoveryMW::isready - done populating nested IsReadyResp")
 
-        self.logger.info("DiscoveryMW::handle_response")
+        # Finally, build the outer layer DiscoveryResp Message
+        self.logger.debug ("DiscoveryMW::isready - build the outer DiscoveryResp message")
+        disc_resp = discovery_pb2.DiscoveryResp()  # allocate
+        disc_resp.msg_type = discovery_pb2.TYPE_ISREADY  # set message type
+        # It was observed that we cannot directly assign the nested field here.
+        # A way around is to use the CopyFrom method as shown
+        disc_resp.isready_resp.CopyFrom(isready_resp)
+        self.logger.debug ("DiscoveryMW::isready - done building the outer message")
 
-        # let us first receive all the bytes
-        rcv_msg = self.router_socket.recv_multipart()
+        # now let us stringify the buffer and print it. This is actually a sequence of bytes and not
+        # a real string
+        buf2send = disc_resp.SerializeToString ()
+        self.logger.debug ("Stringified serialized buf = {}".format (buf2send))
+        return buf2send
 
-        if len(rcv_msg) > 2:
-            self.router_socket.send_multipart(rcv_msg.pop(0))
+    ########################################
+    # admission control
+    #
+    # Only new requests of clients are ever shed. Traffic between DHT
+    # nodes (forwarded parts, replies, ring maintenance and replicas)
+    # finishes work we already accepted, and watches are cheap long
+    # polls that would only come back right away. A client is shed
+    # when more requests are queued than we serve per wake-up or when
+    # too many of its peers already wait for other DHT nodes. It gets
+    # STATUS_CHECK_AGAIN with a hint when to retry.
+    ########################################
+    def __admit(self, rcv_parts:[], disc_req):
+        '''Returns whether to serve a request; answers the ones we shed'''
+        if disc_req.forwarded or disc_req.req_id or disc_req.msg_type not in (
+                discovery_pb2.TYPE_REGISTER, discovery_pb2.TYPE_UNREGISTER, discovery_pb2.TYPE_ISREADY,
+                discovery_pb2.TYPE_LOOKUP_PUB_BY_TOPIC, discovery_pb2.TYPE_LOOKUP_ALL_PUBS):
+            return True
+        if not self.backlogged and self.in_flight < self.max_in_flight:
+            self.accepted += 1
+            return True
+
+        self.shed += 1
+        self.logger.info(f"DiscoveryMW::__admit - overloaded, shedding a {discovery_pb2.MsgTypes.Name(disc_req.msg_type)} request")
+        disc_resp = discovery_pb2.DiscoveryResp()  # allocate
+        disc_resp.msg_type = disc_req.msg_type
+        disc_resp.status = discovery_pb2.STATUS_CHECK_AGAIN
+        disc_resp.retry_after = self.retry_after
+        if disc_req.msg_type in (discovery_pb2.TYPE_REGISTER, discovery_pb2.TYPE_UNREGISTER):
+            disc_resp.register_resp.status = discovery_pb2.STATUS_CHECK_AGAIN
+            disc_resp.register_resp.reason = "overloaded"
+        self.__send_response(rcv_parts, disc_resp.SerializeToString())
+        return False
+
+    def admission_stats(self):
+        '''Returns the counts of admitted and shed client requests'''
+        return {"accepted": self.accepted, "shed": self.shed, "in_flight": self.in_flight}
+
+    def __release_parked(self):
+        '''Answers the parked ISREADY requests once the registry holds what they wait for'''
+        # readiness can only change with the registry or the counts of the other nodes
+        generation = (self.upcall_obj.generation, self.upcall_obj.counts_generation)
+        if not self.parked or generation == self.parked_generation:
+            return
+        self.parked_generation = generation
+        if not self.upcall_obj.isready_request(discovery_pb2.IsReadyReq()):
+            return
+
+        self.logger.info(f"DiscoveryMW::__release_parked - ready, answering {len(self.parked)} parked requests")
+        buf2send = self.__isready_buf(True)
+        for envelope, req_id in self.parked.values():
+            self.__reply(envelope, req_id, buf2send)
+        # their deadlines stay in the heap and are skipped by expire_pending
+        self.parked.clear()
+
+    def __send_response(self, rcv_parts:[], buf2send):
+        '''Replies on the ROUTER socket using the envelope of the request'''
+        # the envelope is everything but the last frame, i.e., the identity of the
+        # client plus the empty delimiter frame added by its REQ socket
+        self.__reply(rcv_parts[:-1], 0, buf2send)
+
+    def __note_owner(self, envelope:[], key):
+        '''Remembers the owner of key for the answer to the client behind envelope, if we know it'''
+        node, owner = self.finger_table.route(key)
+        if not owner:
+            # the client took us for the owner, so it does not know the nodes that joined
+            # in front of us. Our predecessor is one of them if it lies past the key.
+            table = min(self.finger_table, key=lambda t: ChordUtils.distance(key, t.node[HASH], self.num_ft_entries))
+            node = table.predecessor
+            if node is None or ChordUtils.distance(key, node[HASH], self.num_ft_entries) >= \
+                    ChordUtils.distance(key, table.node[HASH], self.num_ft_entries):
+                return  # somebody further along the ring knows
+        hint = discovery_pb2.DiscoveryResp()  # allocate
+        self.__to_chord_node(node, hint.owner)
+        self.owner_hints[tuple(envelope)] = hint.SerializeToString()
+
+    def __registration_keys(self, register_req):
+        '''Splits a registration into the (key, key type, sub-request) triples it is stored under'''
+        keys = []
+
+        # the registrant's own record goes to the owner of its entity id. Subscribers do
+        # not know the id of the broker, so it is stored under a well known key instead.
+        if register_req.role == discovery_pb2.ROLE_BOTH:
+            key = ChordUtils.broker_key(self.num_ft_entries)
+        else:
+            key = ChordUtils.entity_key(self.num_ft_entries, register_req.info.id)
+        keys.append((key, discovery_pb2.KEY_ENTITY, register_req))
+
+        # publishers are also entered under every topic they publish
+        if register_req.role == discovery_pb2.ROLE_PUBLISHER:
+            for topic in register_req.topiclist:
+                topic_req = discovery_pb2.RegisterReq()  # allocate
+                topic_req.role = register_req.role
+                topic_req.info.CopyFrom(register_req.info)
+                topic_req.topiclist.append(topic)
+                keys.append((ChordUtils.topic_key(self.num_ft_entries, topic), discovery_pb2.KEY_TOPIC, topic_req))
+
+        return keys
+
+    def __lookup_keys(self, lookup_req):
+        '''Groups the topics of a lookup by the key whose owner knows their publishers'''
+        if self.upcall_obj.is_broker_dissemination():
+            # subscribers only need the broker
+            return [(ChordUtils.broker_key(self.num_ft_entries), list(lookup_req.topiclist))]
+        return self.__topic_keys(lookup_req.topiclist)
+
+    def __topic_keys(self, topiclist):
+        '''Groups topics by the key whose owner stores their publishers'''
+        keys = {}
+        for topic in topiclist:
+            keys.setdefault(ChordUtils.topic_key(self.num_ft_entries, topic), []).append(topic)
+        return keys.items()
+
+    def __serve_forwarded(self, rcv_parts:[], disc_req):
+        '''Serves a sub-request forwarded by another DHT node and answers it if the sender waits for that'''
+        pending = None
+        if disc_req.req_id:
+            cache_key = None
+            if disc_req.msg_type == discovery_pb2.TYPE_LOOKUP_PUB_BY_TOPIC:
+                # the part of a lookup we own is what subscribers ask the owner over and over
+                cache_key = self.__cache_key(disc_req)
+                if self.__send_cached(rcv_parts[:-1], disc_req.req_id, cache_key, disc_req):
+                    return
+            pending = PendingRequest(rcv_parts[:-1], disc_req.req_id, disc_req.msg_type)
+            pending.cache_key = cache_key
+        self.__serve_or_forward(disc_req, pending)
+        if pending is not None:
+            self.__complete(pending)
+
+    def __serve_or_forward(self, disc_req, pending):
+        '''Serves a sub-request if we own its key, else sends it one hop closer to the owner.
+        The answer, or the wait for the reply of the next hop, is recorded in pending.'''
+        # the sender may already know that we own the key, e.g., a migration on join or leave
+        if not disc_req.at_owner:
+            successor, owner = self.finger_table.route(disc_req.dht_key)
+            if not self.finger_table.is_local(successor):
+                if self.__serve_replica(disc_req, pending):
+                    return
+                self.logger.info(f"DiscoveryMW::__serve_or_forward - forwarding key {disc_req.dht_key} to {successor.get(PHYSICAL)}")
+                disc_req.at_owner = owner
+                self.__forward(successor, disc_req, pending)
+                return
+
+        self.logger.info(f"DiscoveryMW::__serve_or_forward - serving key {disc_req.dht_key}")
+        if disc_req.trace and pending is not None:
+            pending.hops.extend(self.__trace_served(disc_req))
+        if disc_req.msg_type == discovery_pb2.TYPE_REGISTER:
+            self.upcall_obj.register_request(disc_req.register_req, disc_req.key_type)
+            self.__share_record(discovery_pb2.TYPE_REGISTER, disc_req.key_type, disc_req.register_req)
+            self.__replicate_registration(disc_req.dht_key, disc_req.key_type, disc_req.register_req)
+        elif disc_req.msg_type == discovery_pb2.TYPE_UNREGISTER:
+            self.upcall_obj.unregister_request(disc_req.unregister_req, disc_req.key_type)
+            self.__share_record(discovery_pb2.TYPE_UNREGISTER, disc_req.key_type, disc_req.unregister_req)
+            self.__replicate_registration(disc_req.dht_key, disc_req.key_type, disc_req.unregister_req)
+        elif pending is None:
+            return
+        elif disc_req.msg_type == discovery_pb2.TYPE_WATCH:
+            self.__serve_watch(disc_req.watch_req, pending)
         else:
-            self.router_socket.send_multipart(rcv_msg.pop(0))
+            for info in self.upcall_obj.lookup_pubs_topic_request(disc_req.lookup_req):
+                pending.pubs.setdefault(info.id, info)
 
+    ########################################
+    # replication
+    #
+    # The owner of a key copies what lookups read under it, the
+    # publishers of a topic or the broker record, to the next
+    # `replicas` distinct discovery instances after it on the ring.
+    # Each copy is passed from successor to successor, so every node
+    # only needs its own successor. Copies are pushed whenever the
+    # entries of a key change, and all of them again when the
+    # successor of one of our virtual nodes changed.
+    #
+    # With read_consistency "replica" a node on the way to the owner
+    # that holds copies for every topic of a lookup answers it. A
+    # lookup sent to a node just after the owner would otherwise go
+    # almost all the way around the ring. Copies may lag behind the
+    # owner, so "owner" keeps every read at the owner.
+    ########################################
+    def __replicate_registration(self, key, key_type, register_req):
+        '''Copies the entries under key after a registration or unregistration changed them'''
+        if not self.replicas:
+            return
+        if key_type == discovery_pb2.KEY_TOPIC:
+            for topic in register_req.topiclist:
+                self.__replicate(key, key_type, topic, self.upcall_obj.replica_entries(key_type, topic))
+        elif register_req.role == discovery_pb2.ROLE_BOTH:
+            self.__replicate(key, key_type, "", self.upcall_obj.replica_entries(key_type, ""))
+
+    def __replicate(self, key, key_type, topic, entries, table=None):
+        '''Sends the copy of the entries under a key we own down the successors of its virtual node'''
+        replica_msg = discovery_pb2.ReplicaMsg()  # allocate
+        replica_msg.dht_key = key
+        replica_msg.key_type = key_type
+        replica_msg.topic = topic
+        replica_msg.pubs.extend(entries)
+        replica_msg.owner = self.finger_table.physical
+        replica_msg.hops = self.replicas
+        self.__pass_replica(replica_msg, table if table is not None else self.__table_after(key))
+
+    def __store_replica(self, replica_msg):
+        '''Keeps a copy we received and passes it on while successors are still missing one'''
+        self.upcall_obj.store_replica(replica_msg)
+        if self.worker_updates:
+            update = discovery_pb2.WorkerUpdate()  # allocate
+            update.replica.CopyFrom(replica_msg)
+            self.__share(update)
+        self.__pass_replica(replica_msg, self.__table_after(replica_msg.dht_key))
+
+    def __pass_replica(self, replica_msg, table):
+        '''Sends a copy to the first other instance after table, unless enough instances have one'''
+        if replica_msg.hops == 0:
+            return
+        successor = self.__remote_successor(table)
+        if successor is None or successor.get(PHYSICAL, successor[ID]) == replica_msg.owner:
+            return  # fewer instances on the ring than copies
+        replica_msg.hops -= 1
+
+        disc_req = discovery_pb2.DiscoveryReq()  # allocate
+        disc_req.msg_type = discovery_pb2.TYPE_REPLICA
+        disc_req.replica_msg.CopyFrom(replica_msg)
+        self.__forward_find_successor(successor, [disc_req.SerializeToString()])
+
+    def __replicate_all(self):
+        '''Copies all our entries again to the virtual nodes whose successor changed'''
+        if not self.replicas:
+            return
+        changed = {}
+        for table in self.finger_table:
+            successor = self.__remote_successor(table)
+            physical = None if successor is None else successor.get(PHYSICAL, successor[ID])
+            if self.replica_targets.get(table.node[ID]) != physical:
+                self.replica_targets[table.node[ID]] = physical
+                changed[table.node[ID]] = table
+        if not changed:
+            return
+
+        for key, key_type, topic, entries in self.upcall_obj.replica_records():
+            table = self.__table_after(key)
+            if table.node[ID] in changed:
+                self.__replicate(key, key_type, topic, entries, table)
+
+    def __serve_replica(self, disc_req, pending):
+        '''Answers the part of a lookup we do not own from our copies; returns whether it did'''
+        if self.read_consistency != "replica" or pending is None or \
+                disc_req.msg_type != discovery_pb2.TYPE_LOOKUP_PUB_BY_TOPIC:
+            return False
+        pubs = self.upcall_obj.replica_lookup(disc_req.lookup_req)
+        if pubs is None:
+            return False
+        self.logger.info(f"DiscoveryMW::__serve_replica - serving key {disc_req.dht_key} from a replica")
+        self.replica_reads += 1
+        if disc_req.trace:
+            pending.hops.extend(self.__trace_served(disc_req))
+        for info in pubs:
+            pending.pubs.setdefault(info.id, info)
+        return True
+
+    def __table_after(self, key):
+        '''Finger table of our first virtual node at or after key, the one that owns key if we do'''
+        ring_size = 1 << self.num_ft_entries
+        return min(self.finger_table, key=lambda table: (table.node[HASH] - key) % ring_size)
+
+    ########################################
+    # watches
+    #
+    # The part of a watch whose topics we own is answered right away if
+    # any of them changed since the versions the watcher has seen. If
+    # not, it is parked until a registration or unregistration changes
+    # one of them or it waited watch_wait. A parked part counts as an
+    # outstanding reply of the request it belongs to, which is either
+    # the watch of a client or the sub-request of another DHT node.
+    ########################################
+    def __serve_watch(self, watch_req, pending):
+        '''Answers the part of a watch we own, or parks it until it has changes'''
+        watch_resp = self.upcall_obj.watch_request(watch_req)
+        if watch_resp.reset or watch_resp.deltas or self.watch_wait <= 0:
+            self.__watch_part(pending, watch_resp)
+            return
+
+        park_id = next(self.req_ids)
+        pending.outstanding += 1
+        self.watches[park_id] = (pending, watch_req)
+        self.watch_generation = self.upcall_obj.generation
+        heapq.heappush(self.deadlines, (time.monotonic() + self.watch_wait, park_id))
+        self.logger.debug(f"DiscoveryMW::__serve_watch - parked watch of {list(watch_req.topiclist)}")
+
+    def __watch_part(self, pending, watch_resp):
+        '''Adds the answer of one owner to a watch'''
+        if pending.watch is None:
+            pending.watch = discovery_pb2.WatchResp()  # allocate
+        pending.watch.MergeFrom(watch_resp)
+
+    def __release_watches(self):
+        '''Answers the parked watches whose topics changed'''
+        # the watched topics can only change with the registry
+        if not self.watches or self.upcall_obj.generation == self.watch_generation:
+            return
+        self.watch_generation = self.upcall_obj.generation
+
+        for park_id, (pending, watch_req) in list(self.watches.items()):
+            if pending.answered:
+                del self.watches[park_id]  # another owner answered the watch already
+                continue
+            watch_resp = self.upcall_obj.watch_request(watch_req)
+            if watch_resp.reset or watch_resp.deltas:
+                # the deadline stays in the heap and is skipped by expire_pending
+                del self.watches[park_id]
+                pending.outstanding -= 1
+                self.__watch_part(pending, watch_resp)
+                self.__complete(pending)
+
+    def __registry_changed(self):
+        '''Answers the long polls a registration or unregistration may have decided'''
+        self.__share_ring()
+        # with maintenance rounds the counts go out with the next one, however many
+        # registrations arrive until then; without them right away
+        if self.stabilize_interval <= 0:
+            self.__announce_counts()
+        self.__release_parked()
+        self.__release_watches()
+
+    ########################################
+    # readiness counts
+    #
+    # is_ready is about the whole ring, so its counts are added up at one
+    # place: the owner of the readiness key, a well known key like the
+    # one of the broker. Each of our virtual nodes counts the
+    # registrations on its arc. The entries that changed go to the owner
+    # at most once per maintenance round, so a burst of registrations
+    # costs one announcement, not one each. They travel in one message
+    # routed by the readiness key like any lookup, i.e., O(log N) hops
+    # and thus O(log N) messages per announcement, however large the
+    # ring. The owner answers is_ready; other nodes forward it there.
+    #
+    # The table moves with the key: the node that hands the key to a
+    # new predecessor on join, or to its successor on leave, hands the
+    # table along, in one message per change of the owner. While the
+    # ring changes, counts may end up at a node that only took itself
+    # for the owner. Such a node passes on what was new to it, and each
+    # node sends all its counts again after its view of the ring changed
+    # and every COUNTS_REFRESH rounds anyway.
+    ########################################
+    def __announce_counts(self, refresh=False):
+        '''Sends the counts of our virtual nodes that changed since we last did, or all of them, to the owner of the readiness key'''
+        changed = self.upcall_obj.update_ring_count(refresh)
+        if not changed:
+            return
+        chord_msg = discovery_pb2.ChordMsg()  # allocate
+        chord_msg.op = discovery_pb2.CHORD_COUNTS
+        chord_msg.counts.extend(changed)
+        chord_msg.key = ChordUtils.readiness_key(self.num_ft_entries)
+        self.__route_counts(chord_msg)
+
+    def __route_counts(self, chord_msg):
+        '''Sends counts one hop closer to the owner of the readiness key, to the owner itself once we know it'''
+        node, owner = self.finger_table.route(chord_msg.key)
+        if owner:
+            if self.finger_table.is_local(node):
+                # ours are counted as they are; the others we keep
+                self.__merge_counts(chord_msg.counts)
+                return
+            self.__to_chord_node(node, chord_msg.target)
+        self.__send_chord(node, chord_msg)
+
+    def __hand_counts(self, table, node:{}):
+        '''Sends every count we know to node, the new owner of the readiness key'''
+        chord_msg = discovery_pb2.ChordMsg()  # allocate
+        chord_msg.op = discovery_pb2.CHORD_COUNTS
+        chord_msg.counts.extend(self.upcall_obj.known_ring_counts())
+        chord_msg.key = ChordUtils.readiness_key(self.num_ft_entries)
+        self.__to_chord_node(table.node, chord_msg.sender)
+        self.__to_chord_node(node, chord_msg.target)
+        self.__send_chord(node, chord_msg)
+
+    def __merge_counts(self, counts):
+        '''Keeps the counts that are newer than ours and tells the workers about them; returns whether any was'''
+        if not self.upcall_obj.merge_ring_counts(counts):
+            return False
+        if self.worker_updates:
+            update = discovery_pb2.WorkerUpdate()  # allocate
+            update.counts.extend(counts)
+            self.__share(update)
+        return True
+
+    def __walk_all_pubs(self, position, walk_start, pending):
+        '''Adds our publishers to pending and passes the walk on to the node after position'''
+        for info in self.upcall_obj.lookup_all_pubs():
+            pending.pubs.setdefault(info.id, info)
+
+        table = None
+        for candidate in self.finger_table:
+            if candidate.node[HASH] == position:
+                table = candidate
+        if table is None:
+            # the virtual node the walk was sent to is gone; answer with what we have
+            self.logger.warning(f"DiscoveryMW::__walk_all_pubs - no virtual node at {position}, ending the walk")
+            return
+
+        # skip over our own virtual nodes until we are back where the walk started
+        node, successor = table.node, table.successor
+        while not ChordUtils.is_between(walk_start, node[HASH], successor[HASH]):
+            if not self.finger_table.is_local(successor):
+                sub_req = discovery_pb2.DiscoveryReq()  # allocate
+                sub_req.msg_type = discovery_pb2.TYPE_LOOKUP_ALL_PUBS
+                sub_req.lookup_req.SetInParent()
+                sub_req.forwarded = True
+                sub_req.dht_key = successor[HASH]
+                sub_req.walk_start = walk_start
+                self.__forward(successor, sub_req, pending)
+                return
+            node = successor
+            successor = self.finger_table.table(node[ID]).successor
+
+    def __forward(self, node:{}, disc_req, pending):
+        '''Sends a sub-request towards node. With pending, the request is tagged with a
+        correlation id and pending waits for its reply until the forward timeout.'''
+        if pending is not None:
+            req_id = next(self.req_ids)
+            disc_req.req_id = req_id
+            pending.outstanding += 1
+            pending.local = False
+            self.pending[req_id] = pending
+            # the reply comes back on the dealer to node, which must stay open until then
+            physical = node.get(PHYSICAL, node.get(ID))
+            self.pending_peers[req_id] = physical
+            self.peer_outstanding[physical] += 1
+            # the owner may hold a watch or an is_ready long poll before it answers
+            timeout = self.forward_timeout
+            if disc_req.msg_type == discovery_pb2.TYPE_WATCH:
+                timeout += self.watch_wait
+            elif disc_req.msg_type == discovery_pb2.TYPE_ISREADY and disc_req.isready_req.wait:
+                timeout += self.isready_wait
+            heapq.heappush(self.deadlines, (time.monotonic() + timeout, req_id))
+        else:
+            disc_req.req_id = 0
+        if disc_req.trace:
+            disc_req.hops[-1].send_ns = time.time_ns()
+        self.metrics.inc("forwarded_total")
+        self.__forward_find_successor(node, [disc_req.SerializeToString()])
+
+    def handle_reply(self, dealer_socket):
+        '''Handles the answer of a DHT node to a request we forwarded to it'''
+        self.process_reply(dealer_socket.recv_multipart()[-1])
+
+    def process_reply(self, bytesRcvd):
+        '''Matches an answer received on one of our DEALERs with the request waiting for it'''
+        disc_resp = discovery_pb2.DiscoveryResp()  # allocate
+        disc_resp.ParseFromString(bytesRcvd)
+
+        self.__peer_answered(disc_resp.req_id)
+        pending = self.pending.pop(disc_resp.req_id, None)
+        if pending is None:
+            # answered after its deadline; whoever was waiting has already heard from us
+            self.logger.warning(f"DiscoveryMW::handle_reply - late reply to request {disc_resp.req_id}")
+            return
+
+        self.logger.debug(f"DiscoveryMW::handle_reply - reply to request {disc_resp.req_id}")
+        pending.outstanding -= 1
+        if pending.answered:
+            return  # a watch another owner answered first
+        pending.hops.extend(disc_resp.hops)
+        if disc_resp.msg_type in (discovery_pb2.TYPE_REGISTER, discovery_pb2.TYPE_UNREGISTER):
+            if disc_resp.register_resp.status != discovery_pb2.STATUS_SUCCESS:
+                pending.failures.append(disc_resp.register_resp.reason)
+        elif disc_resp.msg_type == discovery_pb2.TYPE_WATCH:
+            self.__watch_part(pending, disc_resp.watch_resp)
+        elif disc_resp.msg_type == discovery_pb2.TYPE_ISREADY:
+            pending.ready = bool(disc_resp.isready_resp.status)
+        else:
+            for info in disc_resp.lookup_resp.pubs:
+                pending.pubs.setdefault(info.id, info)
+        self.__complete(pending)
+
+    def expire_pending(self):
+        '''Gives up on the forwarded requests whose deadline has passed'''
+        now = time.monotonic()
+        while self.deadlines and self.deadlines[0][0] <= now:
+            deadline, req_id = heapq.heappop(self.deadlines)
+            self.__peer_answered(req_id)
+            pending = self.pending.pop(req_id, None)
+            if pending is None:
+                parked = self.parked.pop(req_id, None)
+                if parked is not None:
+                    # a long poll that waited long enough; the client will ask again
+                    self.__reply(*parked, self.__isready_buf(False))
+                watch = self.watches.pop(req_id, None)
+                if watch is not None:
+                    # a watch without changes; answer with the versions so the watcher asks again
+                    pending, watch_req = watch
+                    pending.outstanding -= 1
+                    if not pending.answered:
+                        self.__watch_part(pending, self.upcall_obj.watch_request(watch_req))
+                        self.__complete(pending)
+                continue  # answered in time
+
+            pending.outstanding -= 1
+            if pending.answered:
+                continue  # a watch another owner answered first
+            self.logger.warning(f"DiscoveryMW::expire_pending - no reply to request {req_id}")
+            self.metrics.inc("peer_timeouts_total")
+            pending.failures.append(f"no reply to request {req_id} within {self.forward_timeout} s")
+            self.__complete(pending)
+
+    def __complete(self, pending):
+        '''Answers a pending request once it no longer waits for any reply. A watch is
+        answered as soon as one owner reported changes.'''
+        if pending.answered:
+            return
+        if pending.outstanding > 0:
+            if pending.msg_type != discovery_pb2.TYPE_WATCH or pending.watch is None or \
+                    not (pending.watch.reset or pending.watch.deltas):
+                return
+        pending.answered = True
+        if not pending.req_id and pending.msg_type != discovery_pb2.TYPE_WATCH:
+            self.in_flight -= 1
+        if not pending.req_id:
+            self.metrics.observe("request_seconds", time.monotonic() - pending.started,
+                                 discovery_pb2.MsgTypes.Name(pending.msg_type))
+
+        disc_resp = discovery_pb2.DiscoveryResp()  # allocate
+        disc_resp.msg_type = pending.msg_type
+        if pending.msg_type in (discovery_pb2.TYPE_REGISTER, discovery_pb2.TYPE_UNREGISTER):
+            register_resp = discovery_pb2.RegisterResp()  # allocate
+            if pending.failures:
+                register_resp.status = discovery_pb2.STATUS_FAILURE
+                register_resp.reason = "; ".join(pending.failures)
+            else:
+                register_resp.status = discovery_pb2.STATUS_SUCCESS  # registration successful
+            # It was observed that we cannot directly assign the nested field here.
+            # A way around is to use the CopyFrom method as shown
+            disc_resp.register_resp.CopyFrom(register_resp)
+        elif pending.msg_type == discovery_pb2.TYPE_WATCH:
+            if pending.failures:
+                self.logger.warning(f"DiscoveryMW::__complete - partial watch: {'; '.join(pending.failures)}")
+            disc_resp.watch_resp.SetInParent()
+            if pending.watch is not None:
+                disc_resp.watch_resp.CopyFrom(pending.watch)
+        elif pending.msg_type == discovery_pb2.TYPE_ISREADY:
+            # not ready if the owner of the readiness key did not answer in time; the client asks again
+            if pending.failures:
+                self.logger.warning(f"DiscoveryMW::__complete - is ready: {'; '.join(pending.failures)}")
+            disc_resp.isready_resp.status = 1 if pending.ready and not pending.failures else 0
+        else:
+            if pending.failures:
+                self.logger.warning(f"DiscoveryMW::__complete - partial lookup: {'; '.join(pending.failures)}")
+            lookup_resp = discovery_pb2.LookupPubByTopicResp()  # allocate
+            lookup_resp.pubs.extend(pending.pubs.values())
+            disc_resp.lookup_resp.CopyFrom(lookup_resp)
+
+        # now let us stringify the buffer and print it. This is actually a sequence of bytes and not
+        # a real string. The correlation id is added by __reply so that the bytes can be cached.
+        buf2send = disc_resp.SerializeToString()
+        self.logger.debug("Stringified serialized buf = {}".format(buf2send))
+
+        # an answer that came from our registry alone stays valid until it or the ring changes
+        if pending.cache_key is not None and pending.local:
+            self.__cache_store(pending.cache_key, buf2send)
+
+        # the paths of a traced request are not part of what we cache
+        if pending.hops:
+            buf2send += discovery_pb2.DiscoveryResp(hops=pending.hops).SerializeToString()
+
+        # back to the client or DHT node we got the request from
+        self.__reply(pending.envelope, pending.req_id, buf2send)
+
+    def __reply(self, envelope:[], req_id, buf2send):
+        '''Sends a serialized DiscoveryResp on the ROUTER, tagged with req_id if the sender waits for one'''
+        if req_id:
+            # protobuf merges concatenated messages, so the id can be appended to the
+            # bytes of an answer without parsing them again
+            buf2send += discovery_pb2.DiscoveryResp(req_id=req_id).SerializeToString()
+        else:
+            # the same goes for the owner a client asked us to name
+            buf2send += self.owner_hints.pop(tuple(envelope), b"")
+        self.send_frames(self.router_socket, envelope + [buf2send])
+
+    ########################################
+    # cache of serialized lookup answers
+    #
+    # Once publishers and subscribers are registered the registry hardly
+    # changes, while every subscriber asks for the same few topic sets.
+    # We keep the bytes of every lookup answer our registry gave alone,
+    # keyed by the sorted set of topics. The answers were built at a
+    # generation: the registry generation of the application, bumped on
+    # every change of the registry, plus our ring generation, bumped when
+    # a finger or predecessor changes, i.e., when we may stop owning a
+    # key. Any change of either empties the cache.
+    ########################################
+    def __cache_key(self, disc_req):
+        '''Key of the answer to a lookup in the cache, None with the cache disabled'''
+        if not self.cache_size:
+            return None
+        return disc_req.msg_type, tuple(sorted(set(disc_req.lookup_req.topiclist)))
+
+    def __cache_valid(self):
+        '''Empties the cache if the registry or the ring changed since its answers were built'''
+        generation = (self.upcall_obj.generation, self.ring_generation)
+        if generation != self.cache_generation:
+            self.lookup_cache.clear()
+            self.cache_generation = generation
+
+    def __send_cached(self, envelope:[], req_id, cache_key, disc_req):
+        '''Sends the cached answer for cache_key to disc_req, if there is one; returns whether it did'''
+        if cache_key is None:
+            return False
+        self.__cache_valid()
+        buf2send = self.lookup_cache.get(cache_key)
+        if buf2send is None:
+            self.cache_misses += 1
+            return False
+        self.cache_hits += 1
+        self.logger.debug(f"DiscoveryMW::__send_cached - cached answer for {cache_key}")
+        if disc_req.trace:
+            buf2send += discovery_pb2.DiscoveryResp(hops=self.__trace_served(disc_req)).SerializeToString()
+        self.__reply(envelope, req_id, buf2send)
+        return True
+
+    def __cache_store(self, cache_key, buf2send):
+        '''Keeps the answer for cache_key, dropping the oldest answer if the cache is full'''
+        self.__cache_valid()
+        if len(self.lookup_cache) >= self.cache_size:
+            del self.lookup_cache[next(iter(self.lookup_cache))]
+        self.lookup_cache[cache_key] = buf2send
+
+    def cache_stats(self):
+        '''Returns the hit and miss counts and the size of the lookup cache'''
+        return {"hits": self.cache_hits, "misses": self.cache_misses, "entries": len(self.lookup_cache)}
+
+    ########################################
+    # request tracing
+    #
+    # A traced request carries the path it took so far in hops. Every
+    # node adds itself when the request arrives and notes when it sent
+    # the request on. The parts of a client request inherit the hop of
+    # the node that split it. The node serving a part stamps its own hop
+    # and keeps the whole path with the pending request, which sends all
+    # the paths it gathered back with its answer. The client thus gets
+    # one path per part, each starting at depth 0. Clocks are those of
+    # the hosts, so the time between two hops on different hosts is only
+    # as good as their clock sync.
+    ########################################
+    def __trace_arrival(self, disc_req):
+        '''Adds our hop to the path of a traced request'''
+        hop = disc_req.hops.add()
+        hop.node = self.dht_info.get(ID)
+        hop.depth = len(disc_req.hops) - 1
+        hop.recv_ns = time.time_ns()
+
+    def __trace_into(self, disc_req, sub_req):
+        '''Lets a part of a traced client request carry the path of the request'''
+        if disc_req.trace:
+            sub_req.trace = True
+            sub_req.hops.extend(disc_req.hops)
+
+    def __trace_served(self, disc_req):
+        '''The path of a traced request we serve, ending with our hop stamped now'''
+        hops = list(disc_req.hops)
+        hops[-1] = discovery_pb2.TraceHop(node=hops[-1].node, depth=hops[-1].depth,
+                                          recv_ns=hops[-1].recv_ns, send_ns=time.time_ns())
+        return hops
 
     def __forward_find_successor(self, successor_info:{}, message:[]):
         '''Forwards the request to the appropriate successor node'''
-        successor_socket = self.dealer_sockets_dict.get(successor_info.get(ID))
+        successor_socket = self.__peer_socket(successor_info)
+        self.send_frames(successor_socket, message)
 
-        # message.insert(0, self.dht_info.get(HASH))
-        successor_socket.send_multipart(message)
+    ########################################
+    # dealers to the other DHT nodes
+    #
+    # One DEALER per physical node we talk to, connected on first use and
+    # kept in least recently used order. Beyond peer_connections we close
+    # the least recently used dealer that no forwarded request awaits a
+    # reply on; its queued one-way messages get a second to go out. The
+    # next message to that node simply connects again.
+    ########################################
+    def __peer_socket(self, node:{}):
+        '''DEALER to the discovery instance hosting node, connected the first time we need it'''
+        physical = node.get(PHYSICAL, node.get(ID))
+        dealer_socket = self.dealer_sockets_dict.get(physical)
+        if dealer_socket is not None:
+            self.dealer_sockets_dict.move_to_end(physical)
+            return dealer_socket
+
+        if self.peer_connections:
+            for idle in list(self.dealer_sockets_dict):
+                if len(self.dealer_sockets_dict) < self.peer_connections:
+                    break
+                if not self.peer_outstanding[idle]:
+                    self.__close_peer(idle)
+
+        # no fixed identity: the ROUTER at the other end drops a second connection
+        # that reuses an identity, e.g., the one we opened to a bootstrap node
+        dealer_socket = self.context.socket(zmq.DEALER)
+        conn_str = f"tcp://{node.get(IP)}:{node.get(PORT)}"
+        dealer_socket.connect(conn_str)
+        self.dealer_sockets_dict[physical] = dealer_socket
+        self.dealer_sockets.add(dealer_socket)
+        self.peers_opened += 1
+        # answers to the requests we forward come back on this socket
+        self.watch_dealer(dealer_socket)
+        self.logger.info(f"DiscoveryMW::__peer_socket - adding dealer for {physical} with connection {conn_str}")
+        return dealer_socket
+
+    def __close_peer(self, physical):
+        '''Closes the dealer to physical, which no reply is expected on'''
+        self.logger.info(f"DiscoveryMW::__close_peer - closing the least recently used dealer, to {physical}")
+        dealer_socket = self.dealer_sockets_dict.pop(physical)
+        self.dealer_sockets.discard(dealer_socket)
+        self.unwatch_dealer(dealer_socket)
+        dealer_socket.close(linger=1000)
+        self.peers_closed += 1
+
+    def __peer_answered(self, req_id):
+        '''The dealer a forwarded request went out on no longer waits for its reply'''
+        physical = self.pending_peers.pop(req_id, None)
+        if physical is not None:
+            self.peer_outstanding[physical] -= 1
+            if not self.peer_outstanding[physical]:
+                del self.peer_outstanding[physical]
+
+    def peer_stats(self):
+        '''Returns the open dealers to other DHT nodes and how many were opened and closed so far'''
+        return {"open": len(self.dealer_sockets_dict), "opened": self.peers_opened, "closed": self.peers_closed}
 
+    #################################################################
+    # Chord ring maintenance
+    #
+    # The classic join, stabilize, notify and fix_fingers protocol, run per
+    # virtual node. Every step is a one-way ChordMsg sent from our DEALER to the
+    # ROUTER of the node it concerns; the answer comes back the same way as a new
+    # message. Messages for our own virtual nodes are handled in place.
+    #################################################################
+    def join(self, bootstrap):
+        '''Joins a running ring through the discovery instance at bootstrap ("addr:port")'''
+        self.logger.info(f"DiscoveryMW::join - joining the ring through {bootstrap}")
+        addr, port = bootstrap.rsplit(":", 1)
+        bootstrap_node = {ID: bootstrap, PHYSICAL: bootstrap, IP: addr, PORT: int(port)}
+        for table in self.finger_table:
+            chord_msg = discovery_pb2.ChordMsg()  # allocate
+            chord_msg.op = discovery_pb2.CHORD_FIND_SUCCESSOR
+            self.__to_chord_node(table.node, chord_msg.sender)
+            chord_msg.key = table.node[HASH]
+            chord_msg.finger = 0
+            self.__send_chord(bootstrap_node, chord_msg)
+
+    def run_maintenance(self):
+        '''One round of stabilize and fix_fingers for each of our virtual nodes'''
+        self.logger.debug("DiscoveryMW::run_maintenance")
+        # copies of what we own go to our current successors
+        self.__replicate_all()
+        for table in self.finger_table:
+            # stabilize: ask our successor for its predecessor
+            chord_msg = discovery_pb2.ChordMsg()  # allocate
+            chord_msg.op = discovery_pb2.CHORD_GET_PREDECESSOR
+            self.__to_chord_node(table.node, chord_msg.sender)
+            self.__to_chord_node(table.successor, chord_msg.target)
+            self.__send_chord(table.successor, chord_msg)
+
+            # fix_fingers: refresh a few entries, round robin. An entry whose start lies
+            # between us and our successor is our successor; no need to ask anybody.
+            for k in range(min(self.fingers_per_round, len(table))):
+                i = self.next_finger.get(table.node[ID], 1) % len(table)
+                self.next_finger[table.node[ID]] = i + 1
+                if ChordUtils.is_between(table.start(i), table.node[HASH], table.successor[HASH]):
+                    if table.successor_node(i)[ID] != table.successor[ID] and \
+                            not table.eligible(i, table.successor_node(i)):
+                        table.set_finger(i, table.successor)
+                        self.ring_generation += 1
+                    continue
+
+                chord_msg = discovery_pb2.ChordMsg()  # allocate
+                chord_msg.op = discovery_pb2.CHORD_FIND_SUCCESSOR
+                self.__to_chord_node(table.node, chord_msg.sender)
+                chord_msg.key = table.start(i)
+                chord_msg.finger = i
+                self.handle_chord(chord_msg)
+
+        # our counts if they changed since the last round, by registrations, the ring or,
+        # e.g., a restore. All of them after our view of the ring changed, as they may
+        # have gone to a node that is not the owner, and every COUNTS_REFRESH rounds.
+        self.__share_ring()
+        self.counts_rounds = (self.counts_rounds + 1) % COUNTS_REFRESH
+        refresh = not self.counts_rounds or self.counts_ring_generation != self.ring_generation
+        self.counts_ring_generation = self.ring_generation
+        self.__announce_counts(refresh)
+
+    def leave(self):
+        '''Leaves the ring: hands our registrations over and tells the other nodes'''
+        self.logger.info("DiscoveryMW::leave - leaving the ring")
+        chord_msg = discovery_pb2.ChordMsg()  # allocate
+        chord_msg.op = discovery_pb2.CHORD_LEAVE
+        start = None
+        for table in self.finger_table:
+            successor = self.__remote_successor(table)
+            if successor is None:
+                continue
+            start = start if start is not None else successor
+
+            # the arc of this virtual node becomes part of the arc of its successor
+            if table.predecessor is not None:
+                self.__migrate(table.predecessor[HASH], table.node[HASH], successor)
+
+            self.__to_chord_node(table.node, chord_msg.leaving.add())
+            self.__to_chord_node(successor, chord_msg.leaving_successors.add())
+            predecessor = self.__remote_predecessor(table)
+            if predecessor is not None:
+                self.__to_chord_node(predecessor, chord_msg.leaving_predecessors.add())
+            else:
+                chord_msg.leaving_predecessors.add()
+
+        if start is not None:
+            # anything left, e.g., of a virtual node that never learnt its predecessor
+            self.__migrate(0, 0, start)
+
+            # every node may have fingers to us, so the news goes once around the ring
+            self.__to_chord_node(start, chord_msg.node)
+            self.__to_chord_node(start, chord_msg.target)
+            self.__send_chord(start, chord_msg)
+
+        # everything we stored went to our successors; nobody should count it twice
+        self.__announce_counts()
+
+        # if we added up the counts of the ring, our successor does so from now on
+        node, owner = self.finger_table.route(ChordUtils.readiness_key(self.num_ft_entries))
+        if owner and self.finger_table.is_local(node):
+            table = self.finger_table.table(node[ID])
+            successor = self.__remote_successor(table)
+            if successor is not None:
+                self.__hand_counts(table, successor)
+
+        # give the sockets a moment to flush before the process goes away
+        for dealer_socket in self.dealer_sockets_dict.values():
+            dealer_socket.close(linger=1000)
+        for process in self.workers:
+            process.terminate()
+        for updates in self.worker_updates:
+            updates.close(linger=0)
+        if self.worker_intake is not None:
+            self.worker_intake.close(linger=0)
+        self.router_socket.close(linger=0)
+        self.context.term()
+        if self.proxy_context is not None:
+            self.proxy_context.term()
+            shutil.rmtree(self.pool_dir, ignore_errors=True)
+        self.metrics.stop()
+
+    def handle_chord(self, chord_msg):
+        '''Handles one ring maintenance message addressed to us'''
+        self.logger.debug(f"DiscoveryMW::handle_chord - {discovery_pb2.ChordOp.Name(chord_msg.op)}")
+
+        if chord_msg.op == discovery_pb2.CHORD_FIND_SUCCESSOR:
+            # answer if we know the owner, otherwise pass the lookup on
+            node, owner = self.finger_table.route(chord_msg.key)
+            if not owner:
+                self.__send_chord(node, chord_msg)
+                return
+            reply = discovery_pb2.ChordMsg()  # allocate
+            reply.op = discovery_pb2.CHORD_FOUND_SUCCESSOR
+            reply.target.CopyFrom(chord_msg.sender)
+            reply.key = chord_msg.key
+            reply.finger = chord_msg.finger
+            self.__to_chord_node(node, reply.node)
+            self.__send_chord(self.__from_chord_node(chord_msg.sender), reply)
+            return
+
+        if chord_msg.op == discovery_pb2.CHORD_COUNTS and not chord_msg.HasField("target"):
+            # on its way to the owner of the readiness key
+            self.__route_counts(chord_msg)
+            return
+
+        table = self.finger_table.table(chord_msg.target.id)
+        if table is None:
+            self.logger.warning(f"DiscoveryMW::handle_chord - no virtual node {chord_msg.target.id} here")
+            return
+
+        if chord_msg.op == discovery_pb2.CHORD_FOUND_SUCCESSOR:
+            node = self.__from_chord_node(chord_msg.node)
+            current = table.successor_node(chord_msg.finger)
+            # a finger chosen for proximity is kept while it still lies in its interval
+            if chord_msg.finger > 0 and current[ID] != table.node[ID] and table.eligible(chord_msg.finger, current):
+                return
+            if current[ID] != node[ID]:
+                self.logger.info(f"DiscoveryMW::handle_chord - finger {chord_msg.finger} of {table.node[ID]} is now {node[ID]}")
+                table.set_finger(chord_msg.finger, node)
+                self.ring_generation += 1
+
+        elif chord_msg.op == discovery_pb2.CHORD_GET_PREDECESSOR:
+            reply = discovery_pb2.ChordMsg()  # allocate
+            reply.op = discovery_pb2.CHORD_PREDECESSOR
+            self.__to_chord_node(table.node, reply.sender)
+            reply.target.CopyFrom(chord_msg.sender)
+            if table.predecessor is not None:
+                self.__to_chord_node(table.predecessor, reply.node)
+            self.__send_chord(self.__from_chord_node(chord_msg.sender), reply)
+
+        elif chord_msg.op == discovery_pb2.CHORD_PREDECESSOR:
+            # stabilize: a node between us and our successor becomes our successor
+            successor = table.successor
+            if chord_msg.HasField("node"):
+                node = self.__from_chord_node(chord_msg.node)
+                if node[ID] != table.node[ID] and node[ID] != successor[ID] and \
+                        ChordUtils.is_between(node[HASH], table.node[HASH], successor[HASH]):
+                    self.logger.info(f"DiscoveryMW::handle_chord - successor of {table.node[ID]} is now {node[ID]}")
+                    table.set_finger(0, node)
+                    self.ring_generation += 1
+                    successor = node
+
+            if successor[ID] != table.node[ID]:
+                notify = discovery_pb2.ChordMsg()  # allocate
+                notify.op = discovery_pb2.CHORD_NOTIFY
+                self.__to_chord_node(table.node, notify.sender)
+                self.__to_chord_node(successor, notify.target)
+                self.__send_chord(successor, notify)
+
+        elif chord_msg.op == discovery_pb2.CHORD_NOTIFY:
+            node = self.__from_chord_node(chord_msg.sender)
+            old = table.predecessor
+            if node[ID] != table.node[ID] and (old is None or (node[ID] != old[ID] and ChordUtils.is_between(
+                    node[HASH], old[HASH], table.node[HASH]))):
+                self.logger.info(f"DiscoveryMW::handle_chord - predecessor of {table.node[ID]} is now {node[ID]}")
+                table.predecessor = node
+                self.ring_generation += 1
+                # the keys between our old and new predecessor now belong to the new one.
+                # Alone on the ring, or just joined, we did not know the old one; then we
+                # keep only the keys after the new one.
+                start = old[HASH] if old is not None else table.node[HASH]
+                self.__migrate(start, node[HASH], node)
+                # and with the readiness key the counts of the ring
+                if ChordUtils.is_between(ChordUtils.readiness_key(self.num_ft_entries), start, node[HASH]):
+                    self.__hand_counts(table, node)
+                # a lone node learns its first successor this way
+                if table.successor[ID] == table.node[ID]:
+                    table.set_finger(0, node)
+
+        elif chord_msg.op == discovery_pb2.CHORD_COUNTS:
+            # addressed to us as the owner of the readiness key. If we do not take ourselves
+            # for it, the news goes on; a node that knew them already stops them.
+            if self.__merge_counts(chord_msg.counts):
+                node, owner = self.finger_table.route(chord_msg.key)
+                if not owner or not self.finger_table.is_local(node):
+                    chord_msg.ClearField("target")
+                    self.__route_counts(chord_msg)
+
+        elif chord_msg.op == discovery_pb2.CHORD_LEAVE:
+            # the arc of every leaving node now belongs to its successor
+            for leaving, successor, predecessor in zip(chord_msg.leaving, chord_msg.leaving_successors,
+                                                       chord_msg.leaving_predecessors):
+                if table.predecessor is not None and table.predecessor[ID] == leaving.id:
+                    table.predecessor = self.__from_chord_node(predecessor) if predecessor.id else None
+                    self.ring_generation += 1
+                for i in range(len(table)):
+                    if table.successor_node(i)[ID] == leaving.id:
+                        table.set_finger(i, self.__from_chord_node(successor))
+                        self.ring_generation += 1
+                self.logger.info(f"DiscoveryMW::handle_chord - {leaving.id} left, {table.node[ID]} updated")
+
+            # pass it on until it is back where it started
+            successor = table.successor
+            if successor[ID] != chord_msg.node.id and successor[ID] != table.node[ID]:
+                self.__to_chord_node(successor, chord_msg.target)
+                self.__send_chord(successor, chord_msg)
 
+        else:
+            self.logger.warning(f"DiscoveryMW::handle_chord - unknown operation {chord_msg.op}")
+
+    def __send_chord(self, node:{}, chord_msg):
+        '''Sends a ring maintenance message to the discovery instance hosting node'''
+        if self.finger_table.is_local(node):
+            self.handle_chord(chord_msg)
+            return
+
+        disc_req = discovery_pb2.DiscoveryReq()  # allocate
+        disc_req.msg_type = discovery_pb2.TYPE_CHORD
+        disc_req.chord_msg.CopyFrom(chord_msg)
+        self.send_frames(self.__peer_socket(node), [disc_req.SerializeToString()])
+
+    def __migrate(self, start, end, node:{}):
+        '''Hands the registrations with keys in (start, end] over to node, their new owner'''
+        records = self.upcall_obj.migrate_registrations(start, end)
+        if records:
+            self.logger.info(f"DiscoveryMW::__migrate - moving {len(records)} records to {node[ID]}")
+        for key, key_type, register_req in records:
+            self.__share_record(discovery_pb2.TYPE_UNREGISTER, key_type, register_req)
+            disc_req = discovery_pb2.DiscoveryReq()  # allocate
+            disc_req.msg_type = discovery_pb2.TYPE_REGISTER
+            disc_req.register_req.CopyFrom(register_req)
+            disc_req.forwarded = True
+            disc_req.dht_key = key
+            disc_req.key_type = key_type
+            disc_req.at_owner = True
+            self.__forward_find_successor(node, [disc_req.SerializeToString()])
+
+    def __remote_successor(self, table):
+        '''First successor of a virtual node that is not hosted by us, None if we are alone'''
+        node = table.successor
+        seen = set()
+        while self.finger_table.is_local(node) and node[ID] not in seen:
+            seen.add(node[ID])
+            node = self.finger_table.table(node[ID]).successor
+        return None if self.finger_table.is_local(node) else node
+
+    def __remote_predecessor(self, table):
+        '''First predecessor of a virtual node that is not hosted by us, None if unknown'''
+        node = table.predecessor
+        seen = set()
+        while node is not None and self.finger_table.is_local(node) and node[ID] not in seen:
+            seen.add(node[ID])
+            node = self.finger_table.table(node[ID]).predecessor
+        return None if node is None or self.finger_table.is_local(node) else node
+
+    def __to_chord_node(self, record:{}, chord_node):
+        '''Fills a ChordNode message from a DHT node record'''
+        chord_node.id = record[ID]
+        chord_node.hash = record[HASH]
+        chord_node.addr = str(record.get(IP, ""))
+        chord_node.port = int(record.get(PORT, 0))
+        chord_node.host = str(record.get(HOST, ""))
+        chord_node.physical = record.get(PHYSICAL, record[ID])
+
+    def __from_chord_node(self, chord_node) -> {}:
+        '''DHT node record of a ChordNode message'''
+        return {ID: chord_node.id, HASH: chord_node.hash, IP: chord_node.addr, PORT: chord_node.port,
+                HOST: chord_node.host, PHYSICAL: chord_node.physical}
 
     ########################################
     # set upcall handle
@@ -0,0 +1,179 @@
+###############################################
+#
+# Purpose: worker process of a discovery node that serves reads from a copy of
+# the registry
+#
+# Created: Distributed Systems Spring 2023
+#
+###############################################
+
+# With Workers > 0 in the [Discovery] section of the configuration, a discovery
+# node no longer parses every request on its one thread. Its ROUTER becomes the
+# front end of a ZMQ proxy that deals the requests out over a DEALER to the
+# discovery process itself and to a pool of worker processes. A worker is forked
+# from the discovery process once the registry is loaded, so it starts with a
+# copy of it. From then on the discovery process, the only writer, sends every
+# change it applies (WorkerUpdate) to each worker, which applies it to its copy.
+#
+# A worker answers what it can from its copy alone: topic lookups of clients
+# whose keys we own (or hold replicas of, with read consistency "replica") and
+# is_ready requests if we own the readiness key. Everything else, i.e.,
+# registrations, lookups and is_ready requests that have to go to other DHT
+# nodes, long polls, watches, traced requests and all traffic between DHT
+# nodes, is passed unchanged to the discovery process. Answers leave through
+# the proxy with the envelope they came with, so clients cannot tell who answered.
+#
+# The copy may lag the discovery process by the updates still on their way,
+# e.g., a lookup can miss a registration acknowledged a moment before.
+
+import os  # to notice that the discovery process went away
+import zmq  # ZMQ sockets
+
+# import serialization logic
+from CS6381_MW import discovery_pb2
+
+from Chord.chordutils import ChordUtils
+
+##################################
+#       DiscoveryWorker class
+##################################
+class DiscoveryWorker():
+
+    ########################################
+    # constructor
+    #
+    # runs in the discovery process; run() is what the forked worker does
+    ########################################
+    def __init__(self, logger, upcall_obj, num_ft_entries, arcs, read_consistency, isready_wait,
+                 backend_addr, update_addr, writer_addr):
+        self.logger = logger  # internal logger for print statements
+        self.upcall_obj = upcall_obj  # the application object, copied into the worker by the fork
+        self.num_ft_entries = num_ft_entries
+        self.arcs = arcs  # (virtual node, start, end) of the arcs of keys (start, end] we own
+        self.read_consistency = read_consistency  # "replica" lets us answer from copies of other owners
+        self.isready_wait = isready_wait  # is_ready requests that may wait go to the discovery process
+        self.backend_addr = backend_addr  # requests arrive from the proxy here, answers go back
+        self.update_addr = update_addr  # where we receive the WorkerUpdates
+        self.writer_addr = writer_addr  # where requests we cannot answer go
+        self.parent = os.getpid()  # the discovery process
+        self.served = 0  # requests answered by us
+        self.passed = 0  # requests handed to the discovery process
+
+    ########################################
+    # the worker process
+    ########################################
+    def run(self):
+        try:
+            # our copy of the registry is changed by updates only; they are logged already
+            self.upcall_obj.store = None
+            self.upcall_obj.restoring = True
+
+            # sockets of the discovery process are not ours to use after the fork
+            context = zmq.Context()
+            updates = context.socket(zmq.PULL)
+            updates.setsockopt(zmq.RCVHWM, 0)
+            updates.bind(self.update_addr)
+            front = context.socket(zmq.DEALER)
+            front.connect(self.backend_addr)
+            writer = context.socket(zmq.PUSH)
+            writer.connect(self.writer_addr)
+
+            poller = zmq.Poller()
+            poller.register(updates, zmq.POLLIN)
+            poller.register(front, zmq.POLLIN)
+            self.logger.info(f"DiscoveryWorker::run - worker {os.getpid()} serving")
+
+            while os.getppid() == self.parent:
+                events = dict(poller.poll(timeout=1000))
+
+                # changes first, so that our answers are as recent as possible
+                if updates in events:
+                    while True:
+                        try:
+                            buf = updates.recv(zmq.NOBLOCK)
+                        except zmq.Again:
+                            break
+                        self.apply(discovery_pb2.WorkerUpdate.FromString(buf))
+
+                if front in events:
+                    rcv_parts = front.recv_multipart()
+                    buf2send = self.serve(rcv_parts[-1])
+                    if buf2send is None:
+                        writer.send_multipart(rcv_parts)
+                        self.passed += 1
+                    else:
+                        front.send_multipart(rcv_parts[:-1] + [buf2send])
+                        self.served += 1
+
+        except Exception as e:
+            self.logger.error(f"DiscoveryWorker::run - {e}")
+        finally:
+            self.logger.info(f"DiscoveryWorker::run - worker {os.getpid()} served {self.served}, passed on {self.passed}")
+            # leave the state inherited from the discovery process alone
+            os._exit(0)
+
+    ########################################
+    # apply a change made by the discovery process
+    ########################################
+    def apply(self, update):
+        if update.HasField("record"):
+            if update.record.op == discovery_pb2.TYPE_REGISTER:
+                self.upcall_obj.register_request(update.record.reg, update.record.key_type)
+            else:
+                self.upcall_obj.unregister_request(update.record.reg, update.record.key_type)
+        if update.HasField("replica"):
+            self.upcall_obj.store_replica(update.replica)
+        if update.counts:
+            self.upcall_obj.merge_ring_counts(update.counts)
+        if update.ring:
+            self.arcs = list(zip(update.arc_nodes, update.arc_starts, update.arc_ends))
+            self.upcall_obj.set_ring_arcs(self.arcs)
+
+    ########################################
+    # answer a request from our copy
+    #
+    # returns the serialized DiscoveryResp, None if the discovery
+    # process has to handle the request
+    ########################################
+    def serve(self, bytesRcvd):
+        disc_req = discovery_pb2.DiscoveryReq()  # allocate
+        disc_req.ParseFromString(bytesRcvd)
+        if disc_req.forwarded or disc_req.req_id:
+            return None  # traffic between DHT nodes
+        if disc_req.trace:
+            return None  # the discovery process records the hops
+
+        disc_resp = discovery_pb2.DiscoveryResp()  # allocate
+        disc_resp.msg_type = disc_req.msg_type
+        if disc_req.msg_type == discovery_pb2.TYPE_ISREADY:
+            if not self.owns(ChordUtils.readiness_key(self.num_ft_entries)):
+                return None  # forwarded to the owner of the readiness key
+            ready = self.upcall_obj.isready_request(disc_req.isready_req)
+            if not ready and disc_req.isready_req.wait and self.isready_wait > 0:
+                return None  # parked by the discovery process
+            disc_resp.isready_resp.status = ready
+
+        elif disc_req.msg_type == discovery_pb2.TYPE_LOOKUP_PUB_BY_TOPIC:
+            if self.upcall_obj.is_broker_dissemination():
+                keys = [ChordUtils.broker_key(self.num_ft_entries)]
+            else:
+                keys = [ChordUtils.topic_key(self.num_ft_entries, topic) for topic in disc_req.lookup_req.topiclist]
+            if all(self.owns(key) for key in keys):
+                pubs = self.upcall_obj.lookup_pubs_topic_request(disc_req.lookup_req)
+            elif self.read_consistency == "replica":
+                pubs = self.upcall_obj.replica_lookup(disc_req.lookup_req)
+                if pubs is None:
+                    return None
+            else:
+                return None
+            disc_resp.lookup_resp.SetInParent()
+            disc_resp.lookup_resp.pubs.extend(pubs)
+
+        else:
+            return None
+
+        return disc_resp.SerializeToString()
+
+    def owns(self, key):
+        ''' True when key lies on one of our arcs '''
+        return any(ChordUtils.is_between(key, start, end) for node, start, end in self.arcs)
@@ -0,0 +1,142 @@
+###############################################
+#
+# Purpose: runtime counters of a middleware object and the endpoint serving them
+#
+# Created: Distributed Systems Spring 2023
+#
+###############################################
+
+# Every middleware object keeps a Metrics registry of the series it maintains:
+# counters, gauges and histograms with fixed buckets, each optionally split by
+# labels. Series whose value the middleware keeps anyway (e.g., the hits of the
+# lookup cache, the number of pending requests) are read from a function at the
+# time they are exported instead of being updated twice.
+#
+# With a metrics port, a thread of its own answers every request on a ZMQ REP
+# socket with all the series in the Prometheus text format. It does not depend
+# on the event loop of the middleware, which the publisher and subscriber leave
+# for long stretches while they disseminate or consume. Utils/metrics_scrape.py
+# asks a set of processes for their metrics.
+
+import bisect  # the bucket of an observation
+import threading  # the thread serving the endpoint
+import zmq  # ZMQ sockets
+
+# upper bounds in seconds of the buckets of histograms
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LOOP_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 1.0)
+
+##################################
+#       Metrics class
+##################################
+class Metrics():
+
+    ########################################
+    # constructor
+    ########################################
+    def __init__(self, prefix):
+        self.prefix = prefix  # prepended to the name of every series, e.g., discovery
+        self.series = {}  # name -> (kind, help, label names, buckets, function or None), in the order declared
+        self.values = {}  # name -> label values -> value, or [bucket counts, sum, count] of a histogram
+        self.thread = None  # serving the endpoint, None without one
+        self.running = False  # the endpoint thread keeps serving
+
+    ########################################
+    # declare series
+    ########################################
+    def counter(self, name, help, labels=(), fn=None):
+        '''A value that only goes up; fn returns it if we do not count it here'''
+        self.__declare(name, "counter", help, labels, None, fn)
+
+    def gauge(self, name, help, labels=(), fn=None):
+        '''A value that goes up and down; fn returns it if we do not set it here'''
+        self.__declare(name, "gauge", help, labels, None, fn)
+
+    def histogram(self, name, help, buckets=LATENCY_BUCKETS, labels=()):
+        '''Observations counted in buckets with the given upper bounds'''
+        self.__declare(name, "histogram", help, labels, tuple(buckets), None)
+
+    def __declare(self, name, kind, help, labels, buckets, fn):
+        self.series[name] = (kind, help, tuple(labels), buckets, fn)
+        self.values[name] = {}
+
+    ########################################
+    # update series; label values go in the order the labels were declared
+    ########################################
+    def inc(self, name, *labels, value=1):
+        values = self.values[name]
+        values[labels] = values.get(labels, 0) + value
+
+    def set(self, name, value, *labels):
+        self.values[name][labels] = value
+
+    def observe(self, name, value, *labels):
+        values = self.values[name]
+        entry = values.get(labels)
+        if entry is None:
+            entry = values[labels] = [[0] * (len(self.series[name][3]) + 1), 0.0, 0]
+        # the first bucket whose upper bound is at least value, the last one is +Inf
+        entry[0][bisect.bisect_left(self.series[name][3], value)] += 1
+        entry[1] += value
+        entry[2] += 1
+
+    ########################################
+    # the Prometheus text format
+    ########################################
+    def render(self):
+        '''All series in the Prometheus text exposition format'''
+        lines = []
+        for name, (kind, help, label_names, buckets, fn) in self.series.items():
+            full_name = "{}_{}".format(self.prefix, name)
+            lines.append("# HELP {} {}".format(full_name, help))
+            lines.append("# TYPE {} {}".format(full_name, kind))
+            if fn is not None:
+                lines.append("{} {}".format(full_name, fn()))
+                continue
+
+            # copied at once, the middleware may add to them while we render
+            values = list(self.values[name].items())
+            if not values and not label_names:
+                values = [((), [[0] * (len(buckets) + 1), 0.0, 0] if buckets is not None else 0)]
+            for label_values, value in values:
+                labels = ",".join('{}="{}"'.format(k, v) for k, v in zip(label_names, label_values))
+                if buckets is None:
+                    lines.append("{}{} {}".format(full_name, "{" + labels + "}" if labels else "", value))
+                    continue
+                counts, total, count = value
+                cumulative = 0
+                for bound, bucket_count in zip(buckets + ("+Inf",), counts):
+                    cumulative += bucket_count
+                    le = ",".join(filter(None, [labels, 'le="{}"'.format(bound)]))
+                    lines.append("{}_bucket{{{}}} {}".format(full_name, le, cumulative))
+                suffix = "{" + labels + "}" if labels else ""
+                lines.append("{}_sum{} {}".format(full_name, suffix, total))
+                lines.append("{}_count{} {}".format(full_name, suffix, count))
+        return ("\n".join(lines) + "\n").encode()
+
+    ########################################
+    # the endpoint
+    ########################################
+    def start(self, port):
+        '''Serves render () to every request on a REP socket bound to port'''
+        # bound here so that a port in use fails the configuration of the middleware
+        context = zmq.Context()
+        socket = context.socket(zmq.REP)
+        socket.setsockopt(zmq.LINGER, 0)
+        socket.bind("tcp://*:{}".format(port))
+        self.running = True
+        self.thread = threading.Thread(target=self.__serve, args=(context, socket), daemon=True)
+        self.thread.start()
+
+    def __serve(self, context, socket):
+        poller = zmq.Poller()
+        poller.register(socket, zmq.POLLIN)
+        while self.running:
+            if poller.poll(timeout=1000):
+                socket.recv()
+                socket.send(self.render())
+        socket.close()
+        context.term()
+
+    def stop(self):
+        self.running = False
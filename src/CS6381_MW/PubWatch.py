@@ -0,0 +1,89 @@
+###############################################
+#
+# Purpose: publishers of watched topics, kept up to date from the watch answers of
+# the discovery service
+#
+# Created: Distributed Systems Spring 2023
+#
+###############################################
+
+# Subscribers and the broker find the publishers of their topics with one lookup.
+# After that they keep a watch (TYPE_WATCH) outstanding on their REQ socket. The
+# discovery service holds a watch until publishers of a watched topic come or go
+# and then answers with what changed since the versions we sent along. PubWatch
+# remembers those versions and the publishers of every topic, and tells the
+# middleware which publisher endpoints to connect to and disconnect from.
+
+# import serialization logic
+from CS6381_MW import discovery_pb2
+
+##################################
+#       PubWatch class
+##################################
+class PubWatch():
+
+    ########################################
+    # constructor
+    ########################################
+    def __init__(self, logger, topiclist, publishers):
+        self.logger = logger  # internal logger for print statements
+        self.topiclist = list(topiclist)  # topics we watch
+        self.versions = {}  # topic -> TopicVersion of the last answer about it
+        self.publishers = {}  # topic -> {publisher id: endpoint}
+        # the SUB socket is connected to what the lookup found; until every topic
+        # was answered once we cannot tell which of those publishers we still need
+        self.lookup_endpoints = set(PubWatch.endpoint(pub) for pub in publishers)
+        self.connected = set(self.lookup_endpoints)  # endpoints the SUB socket is connected to
+
+    ########################################
+    # connect string of a publisher
+    ########################################
+    @staticmethod
+    def endpoint(info):
+        return "tcp://" + info.addr + ":" + str(info.port)
+
+    ########################################
+    # serialized watch request for the versions we have
+    ########################################
+    def request(self):
+        disc_req = discovery_pb2.DiscoveryReq()
+        disc_req.msg_type = discovery_pb2.TYPE_WATCH
+        disc_req.watch_req.topiclist.extend(self.topiclist)
+        disc_req.watch_req.versions.extend(self.versions[topic] for topic in self.topiclist if topic in self.versions)
+        return disc_req.SerializeToString()
+
+    ########################################
+    # apply a watch answer
+    #
+    # returns the endpoints to connect to and to disconnect from
+    ########################################
+    def apply(self, watch_resp):
+        for topic in watch_resp.reset:
+            self.logger.debug("PubWatch::apply - full state of {}".format(topic))
+            self.publishers[topic] = {}
+
+        for delta in watch_resp.deltas:
+            pubs = self.publishers.setdefault(delta.topic, {})
+            if delta.removed:
+                self.logger.debug("PubWatch::apply - {} left {}".format(delta.info.id, delta.topic))
+                pubs.pop(delta.info.id, None)
+            else:
+                self.logger.debug("PubWatch::apply - {} publishes {}".format(delta.info.id, delta.topic))
+                pubs[delta.info.id] = PubWatch.endpoint(delta.info)
+
+        for version in watch_resp.versions:
+            self.versions[version.topic] = version
+
+        wanted = set()
+        for pubs in self.publishers.values():
+            wanted.update(pubs.values())
+        if self.lookup_endpoints:
+            if all(topic in self.publishers for topic in self.topiclist):
+                self.lookup_endpoints = set()
+            else:
+                wanted.update(self.lookup_endpoints)
+
+        connect = sorted(wanted - self.connected)
+        disconnect = sorted(self.connected - wanted)
+        self.connected = wanted
+        return connect, disconnect
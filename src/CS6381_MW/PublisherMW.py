@@ -33,6 +33,9 @@ import zmq  # ZMQ sockets
 # import serialization logic
 from CS6381_MW import discovery_pb2
 from CS6381_MW import topic_pb2
+from CS6381_MW.Common import RetryBackoff
+from CS6381_MW.DhtClient import DhtClient
+from CS6381_MW.Metrics import Metrics, LOOP_BUCKETS
 
 # from CS6381_MW import topic_pb2  # you will need this eventually
 
@@ -48,18 +51,20 @@ class PublisherMW():
     ########################################
     def __init__(self, logger):
         self.logger = logger  # internal logger for print statements
-        self.req = None  # will be a ZMQ REQ socket to talk to Discovery service
+        self.req = None  # DhtClient sending our requests to the discovery nodes owning their keys
         self.pub = None  # will be a ZMQ PUB socket for dissemination
         self.poller = None  # used to wait on incoming replies
         self.addr = None  # our advertised IP address
         self.port = None  # port num where we are going to publish our topics
         self.upcall_obj = None  # handle to appln obj to handle appln-specific data
         self.handle_events = True  # in general we keep going thru the event loop
+        self.backoff = RetryBackoff()  # how long to wait when the discovery service sheds a request
+        self.metrics = Metrics("publisher")  # runtime counters, served on a port of their own if configured
 
     ########################################
     # configure/initialize
     ########################################
-    def configure(self, args):
+    def configure(self, args, dht_ring, bits, connections=4, trace_rate=0.0, metrics_offset=0):
         ''' Initialize the object '''
 
         try:
@@ -78,28 +83,19 @@ class PublisherMW():
             self.logger.debug("PublisherMW::configure - obtain the poller")
             self.poller = zmq.Poller()
 
-            # Now acquire the REQ and PUB sockets
-            # REQ is needed because we are the client of the Discovery service
-            # PUB is needed because we publish topic data
-            self.logger.debug("PublisherMW::configure - obtain REQ and PUB sockets")
-            self.req = context.socket(zmq.REQ)
-            self.pub = context.socket(zmq.PUB)
-
-            # Since are using the event loop approach, register the REQ socket for incoming events
+            # Now acquire the PUB socket, needed because we publish topic data.
             # Note that nothing ever will be received on the PUB socket and so it does not make
             # any sense to register it with the poller for an incoming message.
-            self.logger.debug("PublisherMW::configure - register the REQ socket for incoming replies")
-            self.poller.register(self.req, zmq.POLLIN)
-
-            # Now connect ourselves to the discovery service. Recall that the IP/port were
-            # supplied in our argument parsing. Best practices of ZQM suggest that the
-            # one who maintains the REQ socket should do the "connect"
-            self.logger.debug("PublisherMW::configure - connect to Discovery service")
-            # For our assignments we will use TCP. The connect string is made up of
-            # tcp:// followed by IP addr:port number.
-            connect_str = "tcp://" + args.discovery
-            self.req.connect(connect_str)
-            self.logger.info(f"BrokerMW::configure - connected to Discovery service - {connect_str}")
+            self.logger.debug("PublisherMW::configure - obtain the PUB socket")
+            self.pub = context.socket(zmq.PUB)
+
+            # We are the client of the Discovery service. Our requests go straight to the
+            # DHT node owning their keys, on DEALER sockets that register themselves with
+            # our poller as they are connected.
+            self.logger.debug("PublisherMW::configure - route to the Discovery service")
+            self.req = DhtClient(self.logger, context, self.poller, dht_ring, bits, args.name, False, connections,
+                                 trace_rate, self.metrics)
+            self.logger.info(f"PublisherMW::configure - routing discovery requests over {len(dht_ring)} ring positions")
 
             # Since we are the publisher, the best practice as suggested in ZMQ is for us to
             # "bind" the PUB socket
@@ -110,6 +106,15 @@ class PublisherMW():
             bind_string = "tcp://*:" + str(self.port)
             self.pub.bind(bind_string)
 
+            # our metrics, next to our port
+            self.metrics.counter("published_total", "Messages published by topic", ("topic",))
+            self.metrics.counter("discovery_shed_total", "Discovery requests we were told to send again later")
+            self.metrics.histogram("loop_seconds", "Seconds spent on the events of one wake-up of the event loop",
+                                   LOOP_BUCKETS)
+            if metrics_offset:
+                self.logger.debug("PublisherMW::configure - metrics on port {}".format(self.port + metrics_offset))
+                self.metrics.start(self.port + metrics_offset)
+
             self.logger.info("PublisherMW::configure completed")
 
         except Exception as e:
@@ -130,6 +135,12 @@ class PublisherMW():
                 # poll for events. We give it an infinite timeout.
                 # The return value is a socket to event mask mapping
                 events = dict(self.poller.poll(timeout=timeout))
+                woke = time.perf_counter()
+
+                # a late answer on another connection to the discovery nodes is no event
+                # of ours; if it was the only one, go back to waiting
+                if self.req.discard_stale(events) and not events:
+                    continue
 
                 # Unlike the previous starter code, here we are never returning from
                 # the event loop but handle everything in the same locus of control
@@ -145,7 +156,7 @@ class PublisherMW():
                     # object is in.
                     timeout = self.upcall_obj.invoke_operation()
 
-                elif self.req in events:  # this is the only socket on which we should be receiving replies
+                elif self.req.readable(events):  # this is the only socket on which we should be receiving replies
 
                     # handle the incoming reply from remote entity and return the result
                     timeout = self.handle_reply()
@@ -153,6 +164,8 @@ class PublisherMW():
                 else:
                     raise Exception("Unknown event after poll")
 
+                self.metrics.observe("loop_seconds", time.perf_counter() - woke)
+
             self.logger.info("PublisherMW::event_loop - out of the event loop")
         except Exception as e:
             raise e
@@ -175,6 +188,15 @@ class PublisherMW():
             disc_resp = discovery_pb2.DiscoveryResp()
             disc_resp.ParseFromString(bytesRcvd)
 
+            # an overloaded discovery service did not serve the request. Returning the
+            # wait as timeout lets invoke_operation send it again from the same state.
+            if disc_resp.status == discovery_pb2.STATUS_CHECK_AGAIN:
+                self.metrics.inc("discovery_shed_total")
+                timeout = self.backoff.delay(disc_resp.retry_after)
+                self.logger.info("PublisherMW::handle_reply - discovery service busy, retry in {} ms".format(timeout))
+                return timeout
+            self.backoff.reset()
+
             # demultiplex the message based on the message type but let the application
             # object handle the contents as it is best positioned to do so. See how we make
             # the upcall on the application object by using the saved handle to the appln object.
@@ -187,6 +209,9 @@ class PublisherMW():
             elif (disc_resp.msg_type == discovery_pb2.TYPE_ISREADY):
                 # this is a response to is ready request
                 timeout = self.upcall_obj.isready_response(disc_resp.isready_resp)
+            elif (disc_resp.msg_type == discovery_pb2.TYPE_UNREGISTER):
+                # this is a response to our unregister request
+                timeout = self.upcall_obj.unregister_response(disc_resp.register_resp)
 
             else:  # anything else is unrecognizable by this object
                 # raise an exception here
@@ -262,6 +287,42 @@ class PublisherMW():
         except Exception as e:
             raise e
 
+    ########################################
+    # unregister with the discovery service
+    #
+    # undoes our registration once we are done publishing so that the
+    # watchers of our topics disconnect from us
+    ########################################
+    def unregister(self, name, topiclist):
+        ''' unregister the appln with the discovery service '''
+
+        try:
+            self.logger.info("PublisherMW::unregister")
+
+            # we send what we registered
+            unregister_req = discovery_pb2.RegisterReq()  # allocate
+            unregister_req.role = discovery_pb2.ROLE_PUBLISHER  # we are a publisher
+            unregister_req.info.id = name  # our id
+            unregister_req.info.addr = self.addr  # our advertised IP addr
+            unregister_req.info.port = self.port  # port on which we published
+            unregister_req.topiclist[:] = topiclist
+
+            disc_req = discovery_pb2.DiscoveryReq()  # allocate
+            disc_req.msg_type = discovery_pb2.TYPE_UNREGISTER  # set message type
+            disc_req.unregister_req.CopyFrom(unregister_req)
+
+            buf2send = disc_req.SerializeToString()
+            self.logger.debug("Stringified serialized buf = {}".format(buf2send))
+
+            # now send this to our discovery service
+            self.req.send(buf2send)
+
+            # now go to our event loop to receive a response to this request
+            self.logger.info("PublisherMW::unregister - sent unregister message and now now wait for reply")
+
+        except Exception as e:
+            raise e
+
     ########################################
     # check if the discovery service gives us a green signal to proceed
     #
@@ -285,7 +346,9 @@ class PublisherMW():
             # first build a IsReady message
             self.logger.debug("PublisherMW::is_ready - populate the nested IsReady msg")
             isready_req = discovery_pb2.IsReadyReq()  # allocate
-            # actually, there is nothing inside that msg declaration.
+            # ask the discovery service to hold the request until it is ready
+            # instead of answering not ready right away
+            isready_req.wait = True
             self.logger.debug("PublisherMW::is_ready - done populating nested IsReady msg")
 
             # Build the outer layer Discovery Message
@@ -346,6 +409,7 @@ class PublisherMW():
 
             # send the info as bytes. See how we are providing an encoding of utf-8
             self.pub.send_multipart([bytes(topic, "utf-8"), buf2send])
+            self.metrics.inc("published_total", topic)
             # self.pub.send_string(send_str)
 
             self.logger.debug("PublisherMW::disseminate complete")
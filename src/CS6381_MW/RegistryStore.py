@@ -0,0 +1,126 @@
+###############################################
+#
+# Purpose: write-ahead log and snapshots of the registry of a discovery node
+#
+# Created: Distributed Systems Spring 2023
+#
+###############################################
+
+# A discovery node keeps its registry in memory. So that a restarted node does
+# not come up empty, every change is first appended to a log in its data
+# directory. Once the log holds snapshot_every records, the whole registry is
+# written as one RegistrySnapshot and the log starts over. On restart the
+# snapshot is parsed in one go from a memory map and only the records logged
+# after it are replayed.
+#
+# The log is a sequence of RegistryLogRecords, each preceded by its length as
+# a 4 byte little endian integer. A record cut short by a crash is dropped.
+# A new snapshot is written to a temporary file and renamed over the old one,
+# so there is always one complete snapshot on disk.
+
+import os  # files of the data directory
+import mmap  # to parse the snapshot without reading it into a copy first
+import struct  # length prefix of the log records
+
+# import serialization logic
+from CS6381_MW import discovery_pb2
+
+##################################
+#       RegistryStore class
+##################################
+class RegistryStore():
+
+    LENGTH = struct.Struct("<I")  # length prefix of a log record
+
+    ########################################
+    # constructor
+    ########################################
+    def __init__(self, logger, data_dir, name, snapshot_every=100000, fsync=False):
+        self.logger = logger  # internal logger for print statements
+        self.snapshot_path = os.path.join(data_dir, name + ".snapshot")
+        self.log_path = os.path.join(data_dir, name + ".wal")
+        self.snapshot_every = snapshot_every  # log records that trigger a new snapshot
+        self.fsync = fsync  # sync every record to disk, not only hand it to the OS
+        self.log_file = None  # the log, opened for appending once we loaded what is there
+        self.log_records = 0  # records in the log since the last snapshot
+        os.makedirs(data_dir, exist_ok=True)
+
+    ########################################
+    # what is on disk
+    #
+    # returns the snapshot, None if there is none, and the log records
+    # written after it
+    ########################################
+    def load(self):
+        snapshot = None
+        if os.path.exists(self.snapshot_path) and os.path.getsize(self.snapshot_path) > 0:
+            with open(self.snapshot_path, "rb") as f, \
+                    mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped, memoryview(mapped) as view:
+                snapshot = discovery_pb2.RegistrySnapshot()  # allocate
+                snapshot.ParseFromString(view)
+
+        records = []
+        good = 0  # end of the last complete record
+        if os.path.exists(self.log_path) and os.path.getsize(self.log_path) > 0:
+            with open(self.log_path, "rb") as f, \
+                    mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped, memoryview(mapped) as view:
+                size = len(view)
+                while good + RegistryStore.LENGTH.size <= size:
+                    (length,) = RegistryStore.LENGTH.unpack_from(view, good)
+                    end = good + RegistryStore.LENGTH.size + length
+                    if end > size:
+                        break
+                    records.append(discovery_pb2.RegistryLogRecord.FromString(view[good + RegistryStore.LENGTH.size:end]))
+                    good = end
+                if good < size:
+                    self.logger.warning("RegistryStore::load - dropping {} bytes of a torn log record".format(size - good))
+
+        # append after the last complete record from now on
+        self.log_file = open(self.log_path, "ab")
+        self.log_file.truncate(good)
+        self.log_records = len(records)
+        self.logger.info("RegistryStore::load - snapshot {}, {} log records".format(
+            "found" if snapshot is not None else "none", len(records)))
+        return snapshot, records
+
+    ########################################
+    # append a change of the registry to the log
+    ########################################
+    def append(self, op, key_type, reg_req, moved=False):
+        record = discovery_pb2.RegistryLogRecord()  # allocate
+        record.op = op
+        record.key_type = key_type
+        record.reg.CopyFrom(reg_req)
+        record.moved = moved
+        buf = record.SerializeToString()
+        self.log_file.write(RegistryStore.LENGTH.pack(len(buf)) + buf)
+        self.log_file.flush()
+        if self.fsync:
+            os.fsync(self.log_file.fileno())
+        self.log_records += 1
+
+    def snapshot_due(self):
+        ''' True once the log holds enough records to be replaced by a snapshot '''
+        return self.log_records >= self.snapshot_every
+
+    ########################################
+    # replace the log by a snapshot of the whole registry
+    ########################################
+    def write_snapshot(self, snapshot):
+        tmp_path = self.snapshot_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(snapshot.SerializeToString())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+
+        # the snapshot holds everything the log did
+        self.log_file.truncate(0)
+        self.log_records = 0
+        self.logger.info("RegistryStore::write_snapshot - {} pubs, {} subs, {} topic entries".format(
+            len(snapshot.pubs), len(snapshot.subs), len(snapshot.topic_entries)))
+
+    def close(self):
+        if self.log_file is not None:
+            self.log_file.close()
+            self.log_file = None
@@ -55,6 +55,10 @@ import csv
 # import serialization logic
 from CS6381_MW import discovery_pb2
 from CS6381_MW import topic_pb2
+from CS6381_MW.Common import RetryBackoff
+from CS6381_MW.DhtClient import DhtClient
+from CS6381_MW.Metrics import Metrics, LOOP_BUCKETS
+from CS6381_MW.PubWatch import PubWatch
 
 # from CS6381_MW import topic_pb2  # you will need this eventually
 
@@ -70,19 +74,23 @@ class SubscriberMW():
     ########################################
     def __init__(self, logger):
         self.logger = logger  # internal logger for print statements
-        self.req = None  # will be a ZMQ REQ socket to talk to Discovery service
+        self.req = None  # DhtClient sending our requests to the discovery nodes owning their keys
         self.sub = None  # will be a ZMQ SUB socket for consumption
         self.poller = None  # used to wait on incoming replies
         self.addr = None  # our advertised IP address
         self.port = None  # port num where we are going to listen for our topics
         self.upcall_obj = None  # handle to appln obj to handle appln-specific data
         self.handle_events = True  # in general we keep going thru the event loop
+        self.backoff = RetryBackoff()  # how long to wait when the discovery service sheds a request
+        self.metrics = Metrics("subscriber")  # runtime counters, served on a port of their own if configured
+        self.pub_watch = None  # publishers of our topics while we watch them, else None
 
 
     ########################################
     # configure/initialize
     ########################################
-    def configure(self, args):
+    def configure(self, args, dht_ring, bits, connections=4, broker_lookup=False, trace_rate=0.0,
+                  metrics_offset=0):
         ''' Initialize the object '''
 
         try:
@@ -101,33 +109,37 @@ class SubscriberMW():
             self.logger.debug("SubscriberMW::configure - obtain the poller")
             self.poller = zmq.Poller()
 
-            # Now acquire the REQ and SUB sockets
-            # REQ is needed because we are the client of the Discovery service
-            # SUB is needed because we subscribe to topic data
-            self.logger.debug("SubscriberMW::configure - obtain REQ and SUB sockets")
-            self.req = context.socket(zmq.REQ)
+            # Now acquire the SUB socket, needed because we subscribe to topic data
+            self.logger.debug("SubscriberMW::configure - obtain the SUB socket")
             self.sub = context.socket(zmq.SUB)
 
-            # Since are using the event loop approach, register the REQ and SUB sockets for incoming events
-            self.logger.debug("SubscriberMW::configure - register the REQ and SUB sockets for incoming replies")
-            self.poller.register(self.req, zmq.POLLIN)
+            # Since are using the event loop approach, register the SUB socket for incoming events
+            self.logger.debug("SubscriberMW::configure - register the SUB socket for incoming publications")
             self.poller.register(self.sub, zmq.POLLIN)
 
-            # Now connect ourselves to the discovery service. Recall that the IP/port were
-            # supplied in our argument parsing. Best practices of ZQM suggest that the
-            # one who maintains the REQ socket should do the "connect"
-            self.logger.debug("SubscriberMW::configure - connecting to Discovery service")
-            # For our assignments we will use TCP. The connect string is made up of
-            # tcp:// followed by IP addr:port number.
-            connect_str = "tcp://" + args.discovery
-            self.req.connect(connect_str)
-            self.logger.info(f"SubscriberMW::configure - connected to Discovery service - {connect_str}")
+            # We are the client of the Discovery service. Our requests go straight to the
+            # DHT node owning their keys, on DEALER sockets that register themselves with
+            # our poller as they are connected. With a broker, lookups go to its key.
+            self.logger.debug("SubscriberMW::configure - route to the Discovery service")
+            self.req = DhtClient(self.logger, context, self.poller, dht_ring, bits, args.name, broker_lookup, connections,
+                                 trace_rate, self.metrics)
+            self.logger.info(f"SubscriberMW::configure - routing discovery requests over {len(dht_ring)} ring positions")
 
 
             # Connect to the publisher ip/port
             self.logger.debug("SubscriberMW::configure - connect to the sub socket")
 
 
+            # our metrics, next to our port
+            self.metrics.counter("received_total", "Messages received by topic", ("topic",))
+            self.metrics.histogram("delivery_seconds", "Seconds from publishing a message to receiving it", labels=("topic",))
+            self.metrics.counter("discovery_shed_total", "Discovery requests we were told to send again later")
+            self.metrics.histogram("loop_seconds", "Seconds spent on the events of one wake-up of the event loop",
+                                   LOOP_BUCKETS)
+            if metrics_offset:
+                self.logger.debug("SubscriberMW::configure - metrics on port {}".format(self.port + metrics_offset))
+                self.metrics.start(self.port + metrics_offset)
+
             self.logger.info("SubscriberMW::configure completed")
 
         except Exception as e:
@@ -148,6 +160,17 @@ class SubscriberMW():
                 # poll for events. We give it an infinite timeout.
                 # The return value is a socket to event mask mapping
                 events = dict(self.poller.poll(timeout=timeout))
+                woke = time.perf_counter()
+
+                # a late answer on another connection to the discovery nodes is no event
+                # of ours; if it was the only one, go back to waiting
+                if self.req.discard_stale(events) and not events:
+                    continue
+
+                # publications are read by consume in the CONSUME state. The first ones
+                # may arrive before we get there, and more after it, when we only poll
+                # to move on; either way they are no event of the loop
+                events.pop(self.sub, None)
 
                 # Unlike the previous starter code, here we are never returning from
                 # the event loop but handle everything in the same locus of control
@@ -163,7 +186,7 @@ class SubscriberMW():
                     # object is in.
                     timeout = self.upcall_obj.invoke_operation()
 
-                elif self.req in events:  # this is the only socket on which we should be receiving replies
+                elif self.req.readable(events):  # this is the only socket on which we should be receiving replies
 
                     # handle the incoming reply from remote entity and return the result
                     timeout = self.handle_reply()
@@ -171,6 +194,8 @@ class SubscriberMW():
                 else:
                     raise Exception("Unknown event after poll")
 
+                self.metrics.observe("loop_seconds", time.perf_counter() - woke)
+
             self.logger.info("SubscriberMW::event_loop - out of the event loop")
         except Exception as e:
             raise e
@@ -193,6 +218,15 @@ class SubscriberMW():
             disc_resp = discovery_pb2.DiscoveryResp()
             disc_resp.ParseFromString(bytesRcvd)
 
+            # an overloaded discovery service did not serve the request. Returning the
+            # wait as timeout lets invoke_operation send it again from the same state.
+            if disc_resp.status == discovery_pb2.STATUS_CHECK_AGAIN:
+                self.metrics.inc("discovery_shed_total")
+                timeout = self.backoff.delay(disc_resp.retry_after)
+                self.logger.info("SubscriberMW::handle_reply - discovery service busy, retry in {} ms".format(timeout))
+                return timeout
+            self.backoff.reset()
+
             # demultiplex the message based on the message type but let the application
             # object handle the contents as it is best positioned to do so. See how we make
             # the upcall on the application object by using the saved handle to the appln object.
@@ -208,6 +242,10 @@ class SubscriberMW():
             elif (disc_resp.msg_type == discovery_pb2.TYPE_LOOKUP_PUB_BY_TOPIC):
                 self.logger.debug ("SubscriberMW::handle_reply TYPE_LOOKUP_PUB_BY_TOPIC")
                 timeout = self.upcall_obj.lookup_pubs_topics_response(disc_resp.lookup_resp)
+            elif (disc_resp.msg_type == discovery_pb2.TYPE_WATCH):
+                # a watch answer that came in after we stopped consuming
+                self.__watch_update(disc_resp, watch_on=False)
+                timeout = 0
             else:  # anything else is unrecognizable by this object
                 # raise an exception here
                 raise ValueError("SubscriberMW::handle_reply Unrecognized response message")
@@ -295,7 +333,9 @@ class SubscriberMW():
             # first build a IsReady message
             self.logger.debug("SubscriberMW::is_ready - populate the nested IsReady msg")
             isready_req = discovery_pb2.IsReadyReq()  # allocate
-            # actually, there is nothing inside that msg declaration.
+            # ask the discovery service to hold the request until it is ready
+            # instead of answering not ready right away
+            isready_req.wait = True
             self.logger.debug("SubscriberMW::is_ready - done populating nested IsReady msg")
 
             # Build the outer layer Discovery Message
@@ -379,6 +419,48 @@ class SubscriberMW():
             self.sub.setsockopt(zmq.SUBSCRIBE, bytes(topic, "utf-8"))
         self.logger.debug("SubscriberMW::subscribe complete")
 
+    ########################################
+    # watch the publishers of our topics
+    #
+    # keeps a watch request outstanding with the discovery service so that
+    # we connect to publishers that register after our lookup and leave the
+    # ones that are gone
+    ########################################
+    def watch(self, topics, publishers):
+        self.logger.debug("SubscriberMW::watch")
+        self.pub_watch = PubWatch(self.logger, topics, publishers)
+        self.req.send(self.pub_watch.request())
+
+    def __watch_update(self, disc_resp=None, watch_on=True):
+        ''' apply a watch answer to the SUB socket and watch on '''
+        if disc_resp is None:
+            disc_resp = discovery_pb2.DiscoveryResp()
+            disc_resp.ParseFromString(self.req.recv())
+
+        connect, disconnect = self.pub_watch.apply(disc_resp.watch_resp)
+        for connect_string in connect:
+            self.logger.info("SubscriberMW::watch - connect to {}".format(connect_string))
+            self.sub.connect(connect_string)
+        for connect_string in disconnect:
+            self.logger.info("SubscriberMW::watch - disconnect from {}".format(connect_string))
+            self.sub.disconnect(connect_string)
+
+        if watch_on:
+            self.req.send(self.pub_watch.request())
+
+    def __next_publication(self):
+        ''' wait for the next publication, applying watch answers meanwhile '''
+        if self.pub_watch is None:
+            return self.sub.recv_multipart()
+
+        while True:
+            events = dict(self.poller.poll())
+            self.req.discard_stale(events)
+            if self.req.readable(events):
+                self.__watch_update()
+            if self.sub in events:
+                return self.sub.recv_multipart()
+
     def consume(self, sub_name, writer):
         try:
             self.logger.debug("SubscriberMW::consume")
@@ -389,7 +471,7 @@ class SubscriberMW():
 
             # bytes_rcvd = self.sub.recv_multipart(flags=zmq.NOBLOCK)
 
-            bytes_rcvd = self.sub.recv_multipart()
+            bytes_rcvd = self.__next_publication()
             received_time = time.time()
 
             topic_info = topic_pb2.topic()
@@ -397,6 +479,8 @@ class SubscriberMW():
             pub_time = float(topic_info.timestamp)
             self.logger.debug("SubscriberMW::consume - pub time {}".format(pub_time))
             topic_info.latency = str(received_time - pub_time)
+            self.metrics.inc("received_total", topic_info.topic)
+            self.metrics.observe("delivery_seconds", received_time - pub_time, topic_info.topic)
 
             self.logger.debug("SubscriberMW::consume - {}".format(topic_info))
             self.logger.debug("SubscriberMW::consume - writing to csv")
@@ -1,37 +1,29 @@
-import hashlib
-import math
-from _hashlib import HASH
-
-from .hashgen import hashgen
 from .constants import *
-
+from .fingertable import FingerTable
+
+##################################
+# ChordLookup class
+# Purpose: Distributed Systems Spring 2023.
+# A virtual chord node: one DHT record with its finger table. The virtual nodes of a
+# ring are kept in a dictionary keyed by node id that every node shares, which lets a
+# lookup recurse from node to node in-process using the same routing logic as DiscoveryMW.
+##################################
 class ChordLookup:
-    def __init__(self, current_node, finger_table):
+    def __init__(self, current_node, finger_table: FingerTable, ring=None):
         self.current_node = current_node
         self.finger_table = finger_table
         self.data = {}
-        self.successor_node = finger_table[0][1]
+        self.successor_node = finger_table.successor
+        self.ring = ring if ring is not None else {}  # node id -> ChordLookup of every node in the ring
 
-    def find_successor(self, key) -> {}:
-        if self.current_node.get(HASH) == key:
-            return self.current_node
+    def find_successor(self, key, path=None) -> {}:
+        '''Recursively resolve the owner of key. When a path list is passed, every node
+        the lookup visits is appended to it.'''
+        if path is not None:
+            path.append(self.current_node)
 
-        if self.successor_node.get(HASH) == self.current_node.get(HASH):
+        node = self.finger_table.next_hop(key)
+        if node.get(ID) == self.current_node.get(ID):
             return self.current_node
 
-        if self.current_node.get(HASH) < key <= self.successor_node.get(HASH):
-            return self.successor_node
-
-        node = self.__closest_preceding_node(key)
-        if node.get(HASH) == self.current_node.get(HASH):
-            return self.successor_node
-
-        return node.find_successor(key)
-
-    def __closest_preceding_node(self, key):
-        for i in range(len(self.finger_table) - 1, -1, -1):
-            if self.finger_table[i][1].get(HASH) > self.current_node.get(HASH) and self.finger_table[i][1].get(HASH) < key:
-                return self.finger_table[i][1]
-        return self.current_node
-
-     
+        return self.ring[node.get(ID)].find_successor(key, path)
@@ -0,0 +1,195 @@
+import argparse
+import bisect
+import logging
+import os
+import random
+from array import array
+from collections import Counter
+
+from .constants import *
+from .chordutils import ChordUtils
+from .fingertablegen import FingerTableGen
+from .ChordLookup import ChordLookup
+
+
+##################################
+# ChordRing class
+# Purpose: Distributed Systems Spring 2023.
+# In-process Chord ring simulator. It instantiates one virtual node (ChordLookup) per
+# DHT node of a ring, routes lookups with the same next hop logic that DiscoveryMW uses
+# and reports hop-count distributions, per-node forwarding load and a modeled latency
+# obtained from per-link delays. This lets us study ring sizes and finger configurations
+# without Mininet.
+##################################
+class ChordRing():
+    logging.basicConfig(level=logging.INFO)
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, dht_nodes, bits, intra_host_delay=0.05, inter_host_delay=0.5, link_delays=None,
+                 proximity=False):
+        self.bits = bits
+        self.nodes = sorted(dht_nodes, key=lambda x: x[HASH])
+        self.hashes = [n[HASH] for n in self.nodes]
+        self.intra_host_delay = intra_host_delay  # one-way delay in ms between nodes on the same host
+        self.inter_host_delay = inter_host_delay  # one-way delay in ms between different hosts
+        self.link_delays = link_delays if link_delays is not None else {}  # host -> host -> delay in ms
+        # with proximity the fingers are chosen by the modeled link delay (proximity neighbor selection)
+        self.finger_tables = FingerTableGen.generate_all_finger_tables(self.nodes, bits,
+                                                                       self.link_delay if proximity else None)
+
+        # one virtual node per DHT node, all sharing the same view of the ring
+        self.virtual_nodes = {}
+        for node in self.nodes:
+            self.virtual_nodes[node[ID]] = ChordLookup(node, self.finger_tables[node[ID]], self.virtual_nodes)
+
+    @staticmethod
+    def from_json(json_path, bits=None, **kwargs):
+        '''Builds the ring from a dht json file like dht48.json'''
+        dht_json = ChordUtils.load_json_data(json_path)
+        dht_nodes = ChordUtils.to_sorted_dht_node_list(dht_json)
+        if bits is None:
+            bits = ChordUtils.ring_bits(dht_json)
+        return ChordRing(dht_nodes, bits, **kwargs)
+
+    def owner(self, key) -> {}:
+        '''The node that owns key, computed directly from the sorted ring'''
+        return self.nodes[bisect.bisect_left(self.hashes, key) % len(self.nodes)]
+
+    def link_delay(self, src, dst) -> float:
+        '''Modeled one-way delay in ms of the link from node src to node dst'''
+        delay = self.link_delays.get(src.get(HOST), {}).get(dst.get(HOST))
+        if delay is not None:
+            return delay
+        if src.get(HOST) == dst.get(HOST):
+            return self.intra_host_delay
+        return self.inter_host_delay
+
+    def lookup(self, start, key):
+        '''Routes key from the start node. Returns the owner, the number of hops and the
+        modeled latency in ms. Replies travel back along the same path, as in DiscoveryMW.'''
+        path = []
+        owner = self.virtual_nodes[start[ID]].find_successor(key, path)
+        latency = 0.0
+        for i in range(len(path) - 1):
+            latency += 2 * self.link_delay(path[i], path[i + 1])
+        return owner, len(path) - 1, latency
+
+    def simulate(self, num_lookups, seed=None) -> {}:
+        '''Runs num_lookups lookups for random keys from random start nodes'''
+        ChordRing.logger.info(f"chord_ring::simulate - {num_lookups} lookups over {len(self.nodes)} nodes")
+        rng = random.Random(seed)
+        tables = [self.finger_tables[n[ID]] for n in self.nodes]
+
+        # cache the delay of every link we traverse
+        delays = {}
+
+        hop_counts = Counter()
+        forward_load = Counter()
+        latencies = array('d')
+        misrouted = 0
+        for i in range(num_lookups):
+            key = rng.getrandbits(self.bits)
+            table = tables[rng.randrange(len(tables))]
+
+            # iterative version of ChordLookup.find_successor to keep millions of lookups fast
+            hops = 0
+            latency = 0.0
+            while True:
+                node = table.node
+                nxt = table.next_hop(key)
+                if nxt is node:
+                    break
+                link = (node[ID], nxt[ID])
+                delay = delays.get(link)
+                if delay is None:
+                    delay = delays[link] = 2 * self.link_delay(node, nxt)
+                latency += delay
+                forward_load[node[ID]] += 1
+                hops += 1
+                table = self.finger_tables[nxt[ID]]
+
+            if table.node is not self.owner(key):
+                misrouted += 1
+            hop_counts[hops] += 1
+            latencies.append(latency)
+
+        return {"lookups": num_lookups, "hop_counts": hop_counts, "forward_load": forward_load,
+                "latencies": latencies, "misrouted": misrouted}
+
+    def report(self, results):
+        '''Pretty print the results of simulate'''
+        num_lookups = results["lookups"]
+        hop_counts = results["hop_counts"]
+        latencies = sorted(results["latencies"])
+        mean_hops = sum(h * c for h, c in hop_counts.items()) / num_lookups
+
+        ChordRing.logger.info("*" * 60)
+        ChordRing.logger.info(f"Ring: {len(self.nodes)} nodes, {self.bits} bits, {num_lookups} lookups")
+        ChordRing.logger.info(f"Misrouted lookups: {results['misrouted']}")
+        ChordRing.logger.info("-" * 60)
+        ChordRing.logger.info("{:<6}  {:<10}  {:<8}".format("Hops", "Lookups", "Percent"))
+        for hops in sorted(hop_counts):
+            ChordRing.logger.info("{:<6}  {:<10}  {:<8.2f}".format(hops, hop_counts[hops],
+                                                                   100.0 * hop_counts[hops] / num_lookups))
+        ChordRing.logger.info(f"Mean hops: {mean_hops:.3f}")
+        ChordRing.logger.info("-" * 60)
+        ChordRing.logger.info("{:<8}  {:<20}  {:<10}  {:<8}".format("ID", "Hash", "Forwarded", "Percent"))
+        total_forwards = max(1, sum(results["forward_load"].values()))
+        for node in self.nodes:
+            forwarded = results["forward_load"][node[ID]]
+            ChordRing.logger.info("{:<8}  {:<20}  {:<10}  {:<8.2f}".format(node[ID], node[HASH], forwarded,
+                                                                           100.0 * forwarded / total_forwards))
+        ChordRing.logger.info("-" * 60)
+        ChordRing.logger.info("Modeled latency (ms): mean {:.3f}  p50 {:.3f}  p99 {:.3f}  max {:.3f}".format(
+            sum(latencies) / num_lookups, latencies[num_lookups // 2], latencies[int(num_lookups * 0.99)],
+            latencies[-1]))
+        ChordRing.logger.info("*" * 60)
+
+
+##################################
+#
+# Main program
+#
+###################################
+def main():
+    try:
+        parser = argparse.ArgumentParser(description="In-process Chord ring simulator")
+        parser.add_argument("-j", "--json_file", default=os.path.join(os.path.dirname(__file__), '..', 'Utils',
+                                                                      'dht48.json'),
+                            help="JSON file with the database of all DHT nodes, default dht48.json")
+        parser.add_argument("-b", "--bits", type=int, default=None,
+                            help="bits of the hash space, default derived from the json file")
+        parser.add_argument("-n", "--num_lookups", type=int, default=1000000, help="number of lookups, default 1M")
+        parser.add_argument("-d", "--intra_host_delay", type=float, default=0.05,
+                            help="one-way delay in ms between nodes on the same host, default 0.05")
+        parser.add_argument("-D", "--inter_host_delay", type=float, default=0.5,
+                            help="one-way delay in ms between hosts, default 0.5")
+        parser.add_argument("-L", "--link_delays", default=None,
+                            help="JSON file of per-link delays in ms keyed by host then host")
+        parser.add_argument("-P", "--proximity", action="store_true",
+                            help="choose fingers by link delay (proximity neighbor selection)")
+        parser.add_argument("-s", "--seed", type=int, default=None, help="random seed")
+        args = parser.parse_args()
+
+        link_delays = ChordUtils.load_json_data(args.link_delays) if args.link_delays else None
+        ring = ChordRing.from_json(args.json_file, args.bits, intra_host_delay=args.intra_host_delay,
+                                   inter_host_delay=args.inter_host_delay, link_delays=link_delays,
+                                   proximity=args.proximity)
+        ring.report(ring.simulate(args.num_lookups, args.seed))
+
+    except Exception as e:
+        logging.exception("Exception caught in main - {}".format(e))
+        return
+
+
+###################################
+#
+# Main entry point
+#
+###################################
+if __name__ == "__main__":
+    # set underlying default logging capabilities
+    logging.basicConfig(level=logging.DEBUG,
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    main()
@@ -45,6 +45,75 @@ class ChordUtils:
         ChordUtils.logger.debug(f"chord_utils::to_sorted_dht_node_list - sorted dht list: {sorted_dht_nodes}")
         return sorted_dht_nodes
 
+    @staticmethod
+    def parse_host_weights(spec: str) -> {}:
+        """Parses a host weight list like "h1:2,h3:0.5" into a dictionary of host to weight."""
+        weights = {}
+        if spec:
+            for item in spec.split(","):
+                host, weight = item.strip().split(":")
+                weights[host.strip()] = float(weight)
+        return weights
+
+    @staticmethod
+    def expand_virtual_nodes(dht_nodes: [], bits: int, vnodes: int = 1, host_weights: {} = None) -> []:
+        """Gives every physical DHT node several positions (virtual nodes) on the ring.
+
+        A node on a host of weight w gets round(vnodes * w) positions, at least one. The first
+        position keeps the id and hash of the json record so that a ring with a single virtual
+        node per instance is the ring we always had. The others are hashed from the id, IP and
+        port of the instance plus the virtual node number. Every record carries the id of its
+        physical node under PHYSICAL. Returns the records sorted by hash."""
+        host_weights = host_weights if host_weights is not None else {}
+        ring = []
+        seen = set()
+        for node in dht_nodes:
+            count = max(1, int(round(vnodes * host_weights.get(node.get(HOST), 1.0))))
+            for v in range(count):
+                vnode = dict(node)
+                vnode[PHYSICAL] = node[ID]
+                if v > 0:
+                    vnode[ID] = f"{node[ID]}#{v}"
+                    vnode[HASH] = hashgen(bits, f"{node[ID]}:{node.get(IP)}:{node.get(PORT)}#{v}")
+                if vnode[HASH] in seen:
+                    ChordUtils.logger.warning(f"chord_utils::expand_virtual_nodes - hash collision, dropping {vnode[ID]}")
+                    continue
+                seen.add(vnode[HASH])
+                ring.append(vnode)
+
+        ChordUtils.logger.debug(f"chord_utils::expand_virtual_nodes - {len(dht_nodes)} nodes, {len(ring)} positions")
+        return sorted(ring, key=lambda x: x[HASH])
+
+    @staticmethod
+    def host_proximity(src: {}, dst: {}) -> int:
+        """Proximity cost when no RTTs are known: 0 on the same host, 1 in the same /24 subnet, 2 otherwise."""
+        if src.get(HOST) == dst.get(HOST):
+            return 0
+        if str(src.get(IP)).rsplit(".", 1)[0] == str(dst.get(IP)).rsplit(".", 1)[0]:
+            return 1
+        return 2
+
+    @staticmethod
+    def rtt_proximity(rtts: {}, default: float = None):
+        """Proximity function from measured RTTs in ms keyed by host then host, e.g., loaded
+        from a json file. Host pairs that were not measured fall back to host_proximity,
+        scaled to the default RTT when one is given."""
+        def proximity(src: {}, dst: {}) -> float:
+            rtt = rtts.get(src.get(HOST), {}).get(dst.get(HOST))
+            if rtt is not None:
+                return rtt
+            cost = ChordUtils.host_proximity(src, dst)
+            return cost if default is None else cost * default / 2
+        return proximity
+
+    @staticmethod
+    def ring_bits(dht_json: object) -> int:
+        """Width of the hash space of a dht json file. Files written by exp_generator carry it
+        under "bits"; for older files we round the widest hash up to a whole number of bytes."""
+        if dht_json.get(BITS):
+            return int(dht_json[BITS])
+        return max(8, (max(n[HASH] for n in dht_json.get(DHT)).bit_length() + 7) // 8 * 8)
+
     @staticmethod
     def print_finger_table(node, finger_table):
         """ Pretty print Finger Table"""
@@ -55,8 +124,9 @@ class ChordUtils:
             ChordUtils.logger.info("-" * 50)
             ChordUtils.logger.info("{:<5}  {:<20}  {:<10}".format("Index", "Start", "Successor"))
             ChordUtils.logger.info("{:<5}{:<1}{:<20}{:<1}{:<10}".format("-" * 5, "+", "-" * 20, "+", "-" * 10))
-            for i, tuple in enumerate(finger_table):
-                ChordUtils.logger.info("{:<5}  {:<20}  {:<10}".format(i, tuple[0], tuple[1].get(ID)))
+            for i in range(len(finger_table)):
+                ChordUtils.logger.info("{:<5}  {:<20}  {:<10}".format(i, finger_table.start(i),
+                                                                      finger_table.successor_node(i).get(ID)))
             ChordUtils.logger.info("*" * 50)
 
         except Exception as e:
@@ -84,6 +154,39 @@ class ChordUtils:
         except Exception as e:
             raise e
 
+    @staticmethod
+    def distance(start: int, end: int, bits: int) -> int:
+        """Clockwise distance from start to end on a ring of 2^bits identifiers."""
+        return (end - start) % (1 << bits)
+
+    @staticmethod
+    def is_between(key: int, start: int, end: int) -> bool:
+        """Determines if key lies in the ring interval (start, end], wrapping past zero.
+        When start == end the interval is the whole ring."""
+        if start < end:
+            return start < key <= end
+        return key > start or key <= end
+
+    @staticmethod
+    def topic_key(bits: int, topic: str) -> int:
+        """DHT key under which the publishers of a topic are stored."""
+        return hashgen(bits, topic)
+
+    @staticmethod
+    def entity_key(bits: int, entity_id: str) -> int:
+        """DHT key under which the registration of a publisher, subscriber or broker is stored."""
+        return hashgen(bits, entity_id)
+
+    @staticmethod
+    def broker_key(bits: int) -> int:
+        """Well known DHT key under which the broker is stored, so that subscribers can find it without its id."""
+        return hashgen(bits, 'broker')
+
+    @staticmethod
+    def readiness_key(bits: int) -> int:
+        """Well known DHT key whose owner adds up the readiness counts of the ring and answers is_ready."""
+        return hashgen(bits, 'readiness')
+
     @staticmethod
     def registration_node_hash(bits: int) -> int:
         return hashgen(bits, 'Catch the Tea Pot')
@@ -4,3 +4,5 @@ HASH = 'hash'
 IP = 'IP'
 PORT = 'port'
 HOST = 'host'
+PHYSICAL = 'physical'
+BITS = 'bits'
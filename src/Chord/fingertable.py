@@ -0,0 +1,250 @@
+import bisect
+from array import array
+
+from .constants import *
+from .chordutils import ChordUtils
+
+
+##################################
+# FingerTable class
+# Purpose: Distributed Systems Spring 2023.
+# Compact finger table shared by the discovery middleware, the chord lookup and the
+# chord utilities. Each successor is a small index into a node-record table that is
+# interned, i.e., the same list of DHT node dictionaries is shared by every finger
+# table of a ring.
+#
+# With a wide hash space and few nodes most of the m fingers point at the same few
+# nodes, so by default the table only keeps one row per run of consecutive fingers
+# with the same successor (about log N rows) plus the first finger of every row. The
+# starts are not stored, they follow from the node hash. A table built with
+# compressed=False keeps one row per finger. Widths up to 64 bits use integer arrays,
+# wider hash spaces fall back to lists of Python ints.
+##################################
+class FingerTable():
+    __slots__ = ("node", "nodes", "bits", "size", "compressed", "row_first", "succ_hashes", "succ_index",
+                 "succ_dist", "predecessor", "monotonic")
+
+    def __init__(self, node, nodes, bits, succ_index, predecessor=None, compressed=True):
+        self.node = node  # DHT record of the node this table belongs to
+        self.nodes = nodes  # interned node-record table (DHT records sorted by hash)
+        self.bits = bits  # number of bits of the hash space
+        self.size = len(succ_index)  # number of (logical) fingers, normally bits
+        self.compressed = compressed  # one row per run of equal successors instead of one per finger
+        self.row_first = None  # first finger of each row
+        self.succ_index = None  # index of the successor of each row into nodes
+        self.succ_hashes = None  # hash of the successor of each row
+        self.succ_dist = None  # clockwise distance of the successor of each row from our node
+        self.predecessor = predecessor  # DHT record of our predecessor, if known
+        self.monotonic = True  # successor distances never decrease along the table
+        self.__build_rows(succ_index)
+
+    def __int_array(self, values):
+        # unsigned 64 bit arrays as long as the hash space fits, plain lists beyond that
+        return array('Q', values) if self.bits <= 64 else list(values)
+
+    def __build_rows(self, succ_index):
+        row_first = []
+        rows = []
+        for i, index in enumerate(succ_index):
+            if not self.compressed or not rows or rows[-1] != index:
+                row_first.append(i)
+                rows.append(index)
+        self.row_first = array('L', row_first)
+        self.succ_index = array('L', rows)
+        self.succ_hashes = self.__int_array([self.nodes[i][HASH] for i in rows])
+        self.__update_distances()
+
+    def __update_distances(self):
+        # Distances are non-decreasing along the table because every finger successor is at
+        # least 2^i away from us. A successor that wraps all the way around to ourselves
+        # counts as the largest distance there is, ring_size - 1, which no key distance
+        # exceeds, so it never precedes a key; a full circle would not fit 64 bits.
+        ring_size = 1 << self.bits
+        node_hash = self.node[HASH]
+        self.succ_dist = self.__int_array([(h - node_hash) % ring_size or ring_size - 1 for h in self.succ_hashes])
+        self.monotonic = all(self.succ_dist[i - 1] <= self.succ_dist[i] for i in range(1, len(self.succ_dist)))
+
+    def __row(self, i) -> int:
+        '''Row that holds finger i'''
+        if not self.compressed:
+            return i
+        return bisect.bisect_right(self.row_first, i) - 1
+
+    def set_finger(self, i, node):
+        '''Points finger i at node. Used by fix_fingers and stabilize while the ring changes.
+
+        The node is interned into the node-record table when it is not there yet. While fingers
+        are being refreshed one at a time the distances may briefly not be sorted; the lookup
+        then falls back to scanning the table.'''
+        index = None
+        for j, known in enumerate(self.nodes):
+            if known[ID] == node[ID]:
+                index = j
+                break
+        if index is None:
+            # copy the list first, it may be shared by the tables of other nodes
+            self.nodes = self.nodes + [node]
+            index = len(self.nodes) - 1
+        elif self.nodes[index] is not node:
+            self.nodes = list(self.nodes)
+            self.nodes[index] = node
+
+        # expand to one entry per finger, change it and build the rows again
+        succ_index = [self.succ_index[self.__row(k)] for k in range(self.size)]
+        succ_index[i] = index
+        self.__build_rows(succ_index)
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, i):
+        '''Returns the (start, successor node) tuple of finger i'''
+        return self.start(i), self.successor_node(i)
+
+    def __iter__(self):
+        for i in range(self.size):
+            yield self.start(i), self.successor_node(i)
+
+    def rows(self) -> int:
+        '''Number of rows actually stored'''
+        return len(self.succ_index)
+
+    def start(self, i) -> int:
+        return (self.node[HASH] + (1 << i)) % (1 << self.bits)
+
+    def successor_node(self, i) -> {}:
+        return self.nodes[self.succ_index[self.__row(i)]]
+
+    def eligible(self, i, node) -> bool:
+        '''True when node lies in the interval [start(i), start(i + 1)) of finger i. Any such node
+        keeps the O(log N) lookup bound, so proximity neighbor selection may pick among them.'''
+        start = self.start(i)
+        end = self.start(i + 1) if i + 1 < self.size else self.node[HASH]
+        ring_size = 1 << self.bits
+        return (node[HASH] - start) % ring_size < (end - start) % ring_size
+
+    @property
+    def successor(self) -> {}:
+        '''The immediate successor of the node, i.e., the first finger'''
+        return self.nodes[self.succ_index[0]]
+
+    def closest_preceding_node(self, key) -> {}:
+        '''Finger that most closely precedes key on the ring, or our own node if none does.
+
+        The finger successors are ordered by distance from us, so the answer is the last
+        row whose distance is smaller than the distance of the key (binary search).'''
+        key_dist = (key - self.node[HASH]) % (1 << self.bits)
+        if not self.monotonic:
+            for i in range(len(self.succ_dist) - 1, -1, -1):
+                if self.succ_dist[i] < key_dist:
+                    return self.nodes[self.succ_index[i]]
+            return self.node
+
+        i = bisect.bisect_left(self.succ_dist, key_dist) - 1
+        if i < 0:
+            return self.node
+        return self.nodes[self.succ_index[i]]
+
+    def next_hop(self, key) -> {}:
+        '''Node a lookup for key goes to next. Returns our own node when we own the key.'''
+        node_hash = self.node[HASH]
+        if key == node_hash:
+            return self.node
+
+        if self.predecessor is not None and ChordUtils.is_between(key, self.predecessor[HASH], node_hash):
+            return self.node
+
+        successor = self.successor
+        if ChordUtils.is_between(key, node_hash, successor[HASH]):
+            return successor
+
+        return self.closest_preceding_node(key)
+
+    def unique_successors(self) -> []:
+        '''Distinct successor nodes in finger order'''
+        seen = set()
+        unique = []
+        for i in self.succ_index:
+            if i not in seen:
+                seen.add(i)
+                unique.append(self.nodes[i])
+        return unique
+
+
+##################################
+# VirtualFingerTables class
+# Purpose: Distributed Systems Spring 2023.
+# The finger tables of all the virtual nodes hosted by one physical discovery instance.
+# It routes like a single FingerTable: next_hop returns the record of one of our own
+# virtual nodes when we own the key, else the best next hop over all our tables.
+##################################
+class VirtualFingerTables():
+    __slots__ = ("physical", "tables")
+
+    def __init__(self, physical, tables):
+        self.physical = physical  # id of the physical node hosting the virtual nodes
+        self.tables = sorted(tables, key=lambda t: t.node[HASH])  # one finger table per virtual node
+
+    def __len__(self):
+        return len(self.tables)
+
+    def __iter__(self):
+        return iter(self.tables)
+
+    def is_local(self, node) -> bool:
+        '''True when the (virtual) node record belongs to us'''
+        return node.get(PHYSICAL, node.get(ID)) == self.physical
+
+    @property
+    def successor(self) -> {}:
+        '''Successor of our first virtual node'''
+        return self.tables[0].successor
+
+    def table(self, vnode_id) -> FingerTable:
+        '''Finger table of our virtual node vnode_id, None if it is not ours'''
+        for table in self.tables:
+            if table.node[ID] == vnode_id:
+                return table
+        return None
+
+    def route(self, key) -> ():
+        '''Returns (node, owner): the node a lookup for key goes to next and whether that node owns key.
+
+        Every table proposes its own hop. A virtual node that owns the key, or whose successor
+        does, ends the search. Otherwise we pick the remote proposal closest to the key, which
+        is closer than any of our virtual nodes, so every physical hop makes progress.'''
+        best = None
+        best_dist = None
+        for table in self.tables:
+            node = table.next_hop(key)
+            if node is table.node:
+                return node, True
+            if ChordUtils.is_between(key, table.node[HASH], node[HASH]):
+                # node is the successor of this virtual node and owns the key
+                return node, True
+            if self.is_local(node):
+                # our own virtual node; its table proposes a closer hop
+                continue
+            dist = (key - node[HASH]) % (1 << table.bits)
+            if best is None or dist < best_dist:
+                best, best_dist = node, dist
+
+        if best is None:
+            return self.tables[0].node, True
+        return best, False
+
+    def next_hop(self, key) -> {}:
+        '''Node a lookup for key goes to next. Returns one of our own virtual nodes when we own the key.'''
+        return self.route(key)[0]
+
+    def unique_successors(self) -> []:
+        '''Distinct remote physical nodes our fingers point to, in finger order'''
+        seen = set()
+        unique = []
+        for table in self.tables:
+            for node in table.unique_successors():
+                physical = node.get(PHYSICAL, node.get(ID))
+                if physical != self.physical and physical not in seen:
+                    seen.add(physical)
+                    unique.append(node)
+        return unique
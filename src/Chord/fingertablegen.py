@@ -1,7 +1,12 @@
+import bisect
 import logging
 import os
+
+import numpy as np
+
 from .constants import *
 from .chordutils import ChordUtils
+from .fingertable import FingerTable, VirtualFingerTables
 
 
 ##################################
@@ -14,40 +19,106 @@ class FingerTableGen():
     logging.basicConfig(level=logging.INFO)
     logger = logging.getLogger(__name__)
 
+    # proximity neighbor selection looks at no more than this many nodes of a finger interval
+    PNS_CANDIDATES = 16
+    # and only takes one of them over the plain successor if it is at least this much cheaper
+    PNS_MARGIN = 0.2
+
+    @staticmethod
+    def __closest(node, ring, first, count, proximity) -> int:
+        '''Index into ring of the node with the lowest proximity cost among the count nodes
+        starting at index first (wrapping). Ties go to the earliest node. A node later in the
+        interval may overshoot the key a lookup is after and cost a hop, so the first node, the
+        plain successor, stays unless another one is cheaper by more than PNS_MARGIN of its cost.'''
+        successor = first % len(ring)
+        best, best_cost = successor, proximity(node, ring[successor]) * (1 - FingerTableGen.PNS_MARGIN)
+        for k in range(1, min(count, FingerTableGen.PNS_CANDIDATES)):
+            j = (first + k) % len(ring)
+            cost = proximity(node, ring[j])
+            if cost < best_cost:
+                best, best_cost = j, cost
+        return best
+
     @staticmethod
-    def generate_finger_table(node, successor_list, m) -> []:
-        '''Generates the finger table for the given node hash'''
+    def generate_finger_table(node, successor_list, m, proximity=None, compressed=True) -> FingerTable:
+        '''Generates the finger table for the given node hash.
+
+        With a proximity function (cost of the link between two node records, e.g., the RTT)
+        every finger but the first one points at the cheapest node of its interval
+        [n + 2^i, n + 2^(i+1)) instead of at the strict successor of n + 2^i. The first finger
+        stays our successor. Works for any hash width m.'''
         FingerTableGen.logger.debug(f"finger_table_gen::generate_finger_table for node {node.get(ID)}")
-        _finger_table = []
+        succ_index = []
 
         node_id = node[HASH]
         FingerTableGen.logger.debug(f"finger_table_gen::generate_finger_table - successor_list = {successor_list}")
+
+        # sort the ring once so that every finger is a binary search instead of a ring scan
+        ring = sorted(successor_list, key=lambda x: x[HASH])
+        ring_hashes = [n[HASH] for n in ring]
         for i in range(m):
             start = (node_id + 2 ** i) % 2 ** m
-            successor = FingerTableGen.__find_successor(start, successor_list)
-            _finger_table.append((start, successor))
-        return _finger_table
+            first = bisect.bisect_left(ring_hashes, start)
+            if proximity is not None and i > 0:
+                end = (node_id + 2 ** (i + 1)) % 2 ** m
+                count = (bisect.bisect_left(ring_hashes, end) - first) % len(ring)
+                if count > 1:
+                    succ_index.append(FingerTableGen.__closest(node, ring, first, count, proximity))
+                    continue
+            succ_index.append(first % len(ring))
+        predecessor = ring[bisect.bisect_left(ring_hashes, node_id) - 1]
+        return FingerTable(node, ring, m, succ_index, predecessor, compressed)
 
     @staticmethod
-    def __find_successor(key, successor_list):
-        '''Find the successor node for the key'''
-        FingerTableGen.logger.debug(f"finger_table_gen::find_successor - start")
-        FingerTableGen.logger.debug(f"finger_table_gen::find_successor - successor_list - {successor_list}")
-        for i in range(len(successor_list)):
-            if FingerTableGen.__is_between(key, successor_list[i].get(HASH),
-                                           successor_list[(i + 1) % len(successor_list)].get(HASH)):
-                return successor_list[i + 1 if i + 1 < len(successor_list) else 0]
-        return successor_list[0]
+    def generate_virtual_finger_tables(physical_id, ring, m, proximity=None) -> VirtualFingerTables:
+        '''Generates the finger tables of every virtual node of one physical node.
+
+        ring is the list returned by ChordUtils.expand_virtual_nodes.'''
+        FingerTableGen.logger.debug(f"finger_table_gen::generate_virtual_finger_tables for node {physical_id}")
+        ring = sorted(ring, key=lambda x: x[HASH])
+        tables = [FingerTableGen.generate_finger_table(vnode, ring, m, proximity) for vnode in ring
+                  if vnode.get(PHYSICAL, vnode.get(ID)) == physical_id]
+        return VirtualFingerTables(physical_id, tables)
 
     @staticmethod
-    def __is_between(key, start, end):
-        '''Determines if the key is between the start and end hash values'''
-        if start == end:
-            return True
-        if start < end:
-            return start < key <= end
-        else:
-            return key > start or key <= end
+    def generate_all_finger_tables(successor_list, m, proximity=None, compressed=True) -> {}:
+        '''Generates the finger tables of every node in the ring in one vectorized pass.
+
+        Returns a dictionary keyed by node id whose values are the same finger tables
+        that generate_finger_table produces for that node, proximity included. All the
+        tables share one node-record table.'''
+        FingerTableGen.logger.debug(f"finger_table_gen::generate_all_finger_tables - {len(successor_list)} nodes")
+
+        if m > 64:
+            # numpy has no wider unsigned integers; build the tables one at a time
+            return {node[ID]: FingerTableGen.generate_finger_table(node, successor_list, m, proximity, compressed)
+                    for node in successor_list}
+
+        ring = sorted(successor_list, key=lambda x: x[HASH])
+        ring_hashes = np.array([n[HASH] for n in ring], dtype=np.uint64)
+
+        # starts[n, i] = (hash_n + 2^i) mod 2^m. Unsigned adds wrap at 2^64 so masking
+        # with 2^m - 1 gives the modular result for every width up to 64 bits.
+        mask = np.uint64((1 << m) - 1)
+        offsets = np.array([1 << i for i in range(m)], dtype=np.uint64)
+        starts = (ring_hashes[:, None] + offsets[None, :]) & mask
+
+        # the successor of a start is the first node whose hash is >= start, wrapping to node 0
+        first = np.searchsorted(ring_hashes, starts, side="left")
+        succ_index = first % len(ring)
+
+        if proximity is not None:
+            # finger i may be any node of [start_i, start_i+1); the last interval ends at the node
+            ends = np.concatenate([starts[:, 1:], ring_hashes[:, None]], axis=1)
+            counts = (np.searchsorted(ring_hashes, ends, side="left") - first) % len(ring)
+            for n, i in zip(*np.nonzero(counts[:, 1:] > 1)):
+                succ_index[n, i + 1] = FingerTableGen.__closest(ring[n], ring, int(first[n, i + 1]),
+                                                                int(counts[n, i + 1]), proximity)
+
+        finger_tables = {}
+        for n, node in enumerate(ring):
+            finger_tables[node[ID]] = FingerTable(node, ring, m, succ_index[n].tolist(), ring[n - 1], compressed)
+        return finger_tables
 
 
 ##################################
@@ -72,9 +143,10 @@ def main():
         dht_node_list = ChordUtils.to_sorted_dht_node_list(
             ChordUtils.load_json_data(os.path.join(os.path.dirname(__file__), '..', 'Utils', f'dht{m}.json')))
 
+        # build every table of the ring at once
+        finger_tables = ft_gen.generate_all_finger_tables(dht_node_list, m)
         for node in dht_node_list:
-            finger_table = ft_gen.generate_finger_table(node, dht_node_list, m)
-            ChordUtils.print_finger_table(node, finger_table)
+            ChordUtils.print_finger_table(node, finger_tables[node.get(ID)])
 
         ChordUtils.print_dht_nodes(dht_node_list)
 
@@ -1,10 +1,49 @@
 import hashlib  # for the secure hash library
+from functools import lru_cache
 
-def hashgen(bits_hash:int, value_to_hash:str) -> int:
+import numpy as np
+
+# how many distinct (bits, string) pairs hashgen remembers. Topics, roles and entity ids
+# repeat on every registration and lookup, so a few thousand entries cover a whole experiment.
+HASH_CACHE_SIZE = 4096
+
+
+def hash_value(bits_hash:int, value_to_hash:str) -> int:
+    '''Uncached hash of value_to_hash reduced to bits_hash bits.
+
+    We take the leading bytes of the sha256 digest. For widths that are a multiple of 8 that
+    is simply the first bits_hash/8 bytes; otherwise we take one more byte and drop the extra
+    low bits so that the value always fits in bits_hash bits.'''
     # first get the digest from hashlib and then take the desired number of bytes from the
     # lower end of the 256 bits hash. Big or little endian does not matter.
-    hash_digest = hashlib.sha256(bytes(value_to_hash, "utf-8")).digest()  # this is how we get the digest or hash value
-    # figure out how many bytes to retrieve
-    num_bytes = int(bits_hash / 8)  # otherwise we get float which we cannot use below
-    hash_val = int.from_bytes(hash_digest[:num_bytes], "big")  # take lower N number of bytes
-    return hash_val
+    hash_digest = hashlib.sha256(value_to_hash.encode("utf-8")).digest()  # this is how we get the digest or hash value
+    if bits_hash & 7 == 0:
+        # fast path: whole bytes, no shift
+        return int.from_bytes(hash_digest[:bits_hash >> 3], "big")
+
+    num_bytes = (bits_hash + 7) >> 3
+    return int.from_bytes(hash_digest[:num_bytes], "big") >> (8 * num_bytes - bits_hash)
+
+
+@lru_cache(maxsize=HASH_CACHE_SIZE)
+def hashgen(bits_hash:int, value_to_hash:str) -> int:
+    '''Hash of value_to_hash reduced to bits_hash bits, memoized in a bounded LRU cache.
+    Use hashgen.cache_info() to see how well the cache does.'''
+    return hash_value(bits_hash, value_to_hash)
+
+
+def hashgen_batch(bits_hash:int, values) -> np.ndarray:
+    '''Hashes an iterable of strings into a numpy uint64 array (bits_hash up to 64).
+
+    The first 8 bytes of every digest are gathered into one buffer and decoded as big endian
+    64 bit integers in a single numpy call. Shifting right by 64 - bits_hash keeps the leading
+    bits_hash bits, which is exactly what hash_value returns for every width.'''
+    if not 0 < bits_hash <= 64:
+        raise ValueError(f"hashgen_batch supports 1 to 64 bits, got {bits_hash}")
+
+    sha256 = hashlib.sha256
+    buf = b"".join([sha256(v.encode("utf-8")).digest()[:8] for v in values])
+    hashes = np.frombuffer(buf, dtype=">u8").astype(np.uint64)
+    if bits_hash < 64:
+        hashes >>= np.uint64(64 - bits_hash)
+    return hashes
@@ -31,16 +31,22 @@
 
 import argparse  # for argument parsing
 import logging  # for logging. Use it in place of print statements.
+import signal  # to leave the ring gracefully when we are terminated
 from enum import Enum
 import configparser  # for configuration parsing
 # from Chord import constants
 # from Chord import fingertablegen
 import os
+import time  # to tell our incarnations apart and to time a restore
+import collections  # for the bounded logs of topic changes
+import gc  # paused while a registry is restored
 # Import our topic selector. Feel free to use alternate way to
 # get your topics of interest
 
 # Now import our CS6381 Middleware
 from CS6381_MW.DiscoveryMW import DiscoveryMW
+from CS6381_MW.AsyncDiscoveryMW import AsyncDiscoveryMW
+from CS6381_MW.RegistryStore import RegistryStore
 
 # We also need the message formats to handle incoming responses.
 from CS6381_MW import discovery_pb2
@@ -75,11 +81,28 @@ class DiscoveryAppln():
         self.num_subs = None  # the number of subscribers expected before the service is ready
         self.pub_dict = None  # Dictionary to contain the number of publishers registered
         self.sub_dict = None  # Dictionary to contain the number of subscribers registered
+        self.topic_dict = None  # publishers of the topics whose DHT key we own, keyed by publisher id
+        self.topic_index = None  # topic -> ids of the publishers in topic_dict that publish it
         self.broker = None
+        self.generation = 0  # bumped on every change of the registry, invalidates cached lookup answers
+        self.watch_owner = None  # our incarnation, stamped on the topic versions watchers keep
+        self.topic_versions = {}  # topic -> number of changes of its publishers stored here
+        self.topic_log = {}  # topic -> the latest (version, removed, RegistrantInfo) changes
+        self.watch_log_size = 256  # changes kept per topic for watchers that fell behind
+        self.replicas = {}  # (key type, topic) -> (owner, [RegistrantInfo]) copied to us by the owner of the key
+        self.ring_counts = {}  # virtual node of another instance -> ReadinessCount it last announced
+        self.own_counts = {}  # our virtual node -> ReadinessCount we last announced for it
+        self.ring_arcs = []  # (virtual node, start, end) of the arcs (start, end] our virtual nodes own
+        self.own_counts_cache = None  # (generations, entries) own_ring_counts last computed
+        self.counts_generation = 0  # bumped when new counts arrived or our arcs changed
+        self.store = None  # write-ahead log and snapshots of the registry, None keeps it in memory only
+        self.restoring = False  # replaying the store, so changes are not logged again
         self.dissemination = None  # direct or via broker
         self.json_file = None
         self.finger_table = None
         self.dht_nodes = None
+        self.dht_ring = None  # positions of all the virtual nodes on the ring
+        self.num_vnodes = None  # virtual nodes per discovery instance before host weights
         self.num_ft_entries = None
         self.dht_info = None
 
@@ -102,11 +125,31 @@ class DiscoveryAppln():
             self.num_subs = args.num_subs  # num of subscribers expected
             self.pub_dict = {}
             self.sub_dict = {}
+            self.topic_dict = {}
+            self.topic_index = {}
+            self.topic_versions = {}
+            self.topic_log = {}
+            self.replicas = {}
+            # a restarted node numbers the changes of a topic from scratch again
+            self.watch_owner = "{}@{}".format(self.name, time.time_ns())
+
+            # Now, get the configuration object
+            self.logger.debug("DiscoveryAppln::configure - parsing config.ini")
+            config = configparser.ConfigParser()
+            config.read(args.config)
+
+            self.dissemination = config["Dissemination"]["Strategy"]
+            self.watch_log_size = config.getint("Discovery", "WatchLog", fallback=256)
 
             # chord configs
-            self.dht_nodes = ChordUtils.to_sorted_dht_node_list(
-                ChordUtils.load_json_data(os.path.join(os.path.dirname(__file__), 'Utils', args.json_file)))
-            self.num_ft_entries = 48
+            dht_json = ChordUtils.load_json_data(os.path.join(os.path.dirname(__file__), 'Utils', args.json_file))
+            self.dht_nodes = ChordUtils.to_sorted_dht_node_list(dht_json)
+            # one finger per bit of the hash space the ring was generated with
+            self.num_ft_entries = ChordUtils.ring_bits(dht_json)
+            if self.num_ft_entries > 64:
+                # keys travel as uint64 in ChordMsg and DiscoveryReq
+                raise ValueError("ring of {} bits does not fit the 64 bit keys of the protocol".format(self.num_ft_entries))
+            self.logger.debug("DiscoveryAppln::configure - {} bit ring, {} finger entries".format(self.num_ft_entries, self.num_ft_entries))
 
             # Find the DHT information for this node
             # Iterate over the list of dictionaries
@@ -118,23 +161,76 @@ class DiscoveryAppln():
                     # Exit the loop since we have found the first matching item
                     break
 
-            if self.json_file is not None and self.dht_info is None:
+            if self.dht_info is None and args.join:
+                # a new node joining a running ring; hash it the way exp_generator does
+                self.dht_info = {ID: self.name, HASH: hashgen(self.num_ft_entries, f"{self.name}:{args.addr}:{args.port}"),
+                                 IP: args.addr, PORT: args.port, HOST: args.addr}
+            if self.dht_info is None:
                 raise ValueError(f"Cannot fild DHT Node information for Node: {self.name}")
 
-            self.finger_table = FingerTableGen.generate_finger_table(self.dht_info, self.dht_nodes, self.num_ft_entries)
-
-            # Now, get the configuration object
-            self.logger.debug("DiscoveryAppln::configure - parsing config.ini")
-            config = configparser.ConfigParser()
-            config.read(args.config)
-
-            self.dissemination = config["Dissemination"]["Strategy"]
+            # every instance may own several positions (virtual nodes) on the ring, more of
+            # them on hosts with a higher weight
+            self.num_vnodes = config.getint("Chord", "VirtualNodes", fallback=1)
+            host_weights = ChordUtils.parse_host_weights(config.get("Chord", "HostWeights", fallback=""))
+            if args.join:
+                # we only know ourselves; the ring is learnt through the join protocol
+                self.dht_ring = ChordUtils.expand_virtual_nodes([self.dht_info], self.num_ft_entries,
+                                                                self.num_vnodes, host_weights)
+            else:
+                self.dht_ring = ChordUtils.expand_virtual_nodes(self.dht_nodes, self.num_ft_entries,
+                                                                self.num_vnodes, host_weights)
+
+            # proximity neighbor selection: pick fingers by measured RTT, or by host and
+            # subnet when no RTT file is given
+            proximity = None
+            if config.getboolean("Chord", "ProximityFingers", fallback=False):
+                rtt_file = config.get("Chord", "RTTFile", fallback="")
+                rtts = ChordUtils.load_json_data(os.path.join(os.path.dirname(__file__), 'Utils', rtt_file)) \
+                    if rtt_file else {}
+                proximity = ChordUtils.rtt_proximity(rtts)
+            self.finger_table = FingerTableGen.generate_virtual_finger_tables(self.name, self.dht_ring,
+                                                                              self.num_ft_entries, proximity)
+            if args.join:
+                for table in self.finger_table:
+                    table.predecessor = None
+            self.logger.info("DiscoveryAppln::configure - {} virtual nodes on a ring of {} positions".format(
+                len(self.finger_table), len(self.dht_ring)))
+
+            # come back with the registry we had before a restart
+            data_dir = config.get("Discovery", "DataDir", fallback="")
+            if data_dir:
+                self.store = RegistryStore(self.logger, os.path.join(os.path.dirname(__file__), data_dir), self.name,
+                                           config.getint("Discovery", "SnapshotEvery", fallback=100000),
+                                           config.getboolean("Discovery", "WalFsync", fallback=False))
+                self.restore()
 
             # Now setup up our underlying middleware object to which we delegate
+            # requests served per wake-up of the ROUTER
+            ingress_queue = config.getint("Discovery", "IngressQueue", fallback=256)
+            if ingress_queue < 1:
+                # the ROUTER would stay readable without anybody ever reading it
+                raise ValueError("IngressQueue of {} serves no requests, it has to be at least 1".format(ingress_queue))
+
             # everything
             self.logger.debug("DiscoveryAppln::configure - initialize the middleware object")
-            self.mw_obj = DiscoveryMW(self.logger)
-            self.mw_obj.configure(args, self.dht_info, self.num_ft_entries, self.finger_table)
+            self.mw_obj = AsyncDiscoveryMW(self.logger) if args.asyncio else DiscoveryMW(self.logger)
+            self.mw_obj.configure(args, self.dht_info, self.num_ft_entries, self.finger_table,
+                                  config.getint("Chord", "StabilizeInterval", fallback=1000),
+                                  config.getint("Chord", "FixFingers", fallback=4),
+                                  config.getint("Chord", "ForwardTimeout", fallback=5000),
+                                  config.getint("Discovery", "LookupCache", fallback=4096),
+                                  config.getint("Discovery", "IsReadyWait", fallback=30000),
+                                  config.getint("Discovery", "WatchWait", fallback=30000),
+                                  config.getint("Discovery", "Replicas", fallback=0),
+                                  config.get("Discovery", "ReadConsistency", fallback="owner"),
+                                  config.getint("Discovery", "RouterHWM", fallback=1000),
+                                  ingress_queue,
+                                  config.getint("Discovery", "MaxInFlight", fallback=1024),
+                                  config.getint("Discovery", "RetryAfter", fallback=100),
+                                  config.getint("Discovery", "Workers", fallback=0),
+                                  config.getint("Chord", "PeerConnections", fallback=64),
+                                  config.getint("Discovery", "IOThreads", fallback=1),
+                                  config.getint("Metrics", "PortOffset", fallback=0))
 
             self.logger.info("DiscoveryAppln::configure - configuration complete")
 
@@ -166,6 +262,9 @@ class DiscoveryAppln():
             self.logger.debug("DiscoveryAppln::driver - upcall handle")
             self.mw_obj.set_upcall_handle(self)
 
+            # with a worker pool, each worker starts from a copy of our registry
+            self.mw_obj.start_workers()
+
             # the next thing we should be doing is to determine if the discovery
             # service is ready. But because we are simply delegating everything to an event loop
             # that will call us back, we will need to know when we get called back as to
@@ -207,7 +306,9 @@ class DiscoveryAppln():
             if (self.state == self.State.REGISTERING):
                 # send a register msg to discovery service
                 # self.logger.debug("DiscoveryAppln::invoke_operation - listening for registrations")
-                return 0
+                # nothing to do until the next request arrives, so block in the poll
+                # (the middleware still wakes up for ring maintenance)
+                return None
             else:
                 raise ValueError("Undefined state of the appln object")
 
@@ -223,30 +324,483 @@ class DiscoveryAppln():
     # of the message and what should be done. So it becomes the job
     # of the application. Hence, this upcall is made to us.
     ########################################
-    def register_request(self, reg_req):
+    def register_request(self, reg_req, key_type=discovery_pb2.KEY_ENTITY):
         ''' handle register response '''
 
         self.logger.info("DiscoveryAppln::register_request")
-        if (reg_req.role == discovery_pb2.ROLE_BOTH):
+        self.persist(discovery_pb2.TYPE_REGISTER, key_type, reg_req)
+        self.generation += 1
+        if key_type == discovery_pb2.KEY_TOPIC:
+            # we own the key of these topics, so remember that this publisher publishes them
+            self.logger.debug("registering topics {} of Pub = {}".format(reg_req.topiclist, reg_req.info.id))
+            entry = self.topic_dict.get(reg_req.info.id)
+            if entry is None:
+                entry = discovery_pb2.RegisterReq()  # allocate
+                entry.role = reg_req.role
+                entry.info.CopyFrom(reg_req.info)
+                self.topic_dict[reg_req.info.id] = entry
+            for topic in reg_req.topiclist:
+                pub_ids = self.topic_index.setdefault(topic, set())
+                if reg_req.info.id not in pub_ids:
+                    pub_ids.add(reg_req.info.id)
+                    entry.topiclist.append(topic)
+                    self.log_topic_change(topic, False, entry.info)
+        elif (reg_req.role == discovery_pb2.ROLE_BOTH):
             self.logger.debug("registering Broker = {}".format(reg_req.info.id))
             self.logger.debug("registering values = {}".format(reg_req.info))
             self.broker = reg_req
-            return 0
         elif reg_req.role == discovery_pb2.ROLE_PUBLISHER:
             self.logger.debug("registering Pub = {}".format(reg_req.info.id))
             self.logger.debug("registering values = {}".format(reg_req.info))
             self.pub_dict[reg_req.info.id] = reg_req
-            return 0
         elif reg_req.role == discovery_pb2.ROLE_SUBSCRIBER:
-            self.logger.debug("registering Pub = {}".format(reg_req.info.id))
+            self.logger.debug("registering Sub = {}".format(reg_req.info.id))
             self.logger.debug("registering values = {}".format(reg_req.info))
             self.sub_dict[reg_req.info.id] = reg_req
-            return 0
         else:
             self.logger.debug("DiscoveryAppln::register_request - unknown registration role {}".format(
                 reg_req.role))
             raise Exception("Unknown Role for registrant")
 
+        self.load_report()
+        self.snapshot_if_due()
+        return 0
+
+    ########################################
+    # handle unregister request method called as part of upcall
+    #
+    # Undoes the part of a registration stored under one of our keys.
+    ########################################
+    def unregister_request(self, reg_req, key_type=discovery_pb2.KEY_ENTITY):
+        ''' handle unregister request '''
+
+        self.logger.info("DiscoveryAppln::unregister_request")
+        self.persist(discovery_pb2.TYPE_UNREGISTER, key_type, reg_req)
+        self.generation += 1
+        if key_type == discovery_pb2.KEY_TOPIC:
+            self.logger.debug("unregistering topics {} of Pub = {}".format(reg_req.topiclist, reg_req.info.id))
+            for topic in reg_req.topiclist:
+                self.drop_topic_entry(reg_req.info.id, topic)
+        elif reg_req.role == discovery_pb2.ROLE_BOTH:
+            self.logger.debug("unregistering Broker = {}".format(reg_req.info.id))
+            if self.broker is not None and self.broker.info.id == reg_req.info.id:
+                self.broker = None
+        elif reg_req.role == discovery_pb2.ROLE_PUBLISHER:
+            self.logger.debug("unregistering Pub = {}".format(reg_req.info.id))
+            self.pub_dict.pop(reg_req.info.id, None)
+        elif reg_req.role == discovery_pb2.ROLE_SUBSCRIBER:
+            self.logger.debug("unregistering Sub = {}".format(reg_req.info.id))
+            self.sub_dict.pop(reg_req.info.id, None)
+        else:
+            raise Exception("Unknown Role for registrant")
+
+        self.load_report()
+        self.snapshot_if_due()
+        return 0
+
+    ########################################
+    # report how much of the registry this node stores
+    #
+    # One line per change in the log so that the load across the
+    # ring can be compared from the results/*.out files with
+    # Utils/load_report.py
+    ########################################
+    def load_report(self):
+        ''' log the per-node load '''
+
+        # counting the topics walks the whole registry; skip it when nobody reads the line
+        if self.restoring or not self.logger.isEnabledFor(logging.INFO):
+            return
+
+        topics = set()
+        for reg_req in self.topic_dict.values():
+            topics.update(reg_req.topiclist)
+
+        self.logger.info("DiscoveryAppln::load_report - node={} hash={} pubs={} subs={} broker={} topics={} topic_entries={}".format(
+            self.name, self.dht_info.get(HASH), len(self.pub_dict), len(self.sub_dict),
+            0 if self.broker is None else 1, len(topics), sum(len(r.topiclist) for r in self.topic_dict.values())))
+
+    ########################################
+    # hand over registrations to a new owner
+    #
+    # Upcall made by the middleware when the ring changes: a node joined
+    # in front of one of our virtual nodes or we are leaving. Removes and
+    # returns the (key, key type, RegisterReq) of every record whose DHT
+    # key lies in (start, end].
+    ########################################
+    def migrate_registrations(self, start, end):
+        ''' remove and return the registrations with keys in (start, end] '''
+
+        self.logger.info("DiscoveryAppln::migrate_registrations - keys in ({}, {}]".format(start, end))
+        moved = []
+        for registry in (self.pub_dict, self.sub_dict):
+            for entity_id in list(registry):
+                key = ChordUtils.entity_key(self.num_ft_entries, entity_id)
+                if ChordUtils.is_between(key, start, end):
+                    moved.append((key, discovery_pb2.KEY_ENTITY, registry.pop(entity_id)))
+
+        if self.broker is not None:
+            key = ChordUtils.broker_key(self.num_ft_entries)
+            if ChordUtils.is_between(key, start, end):
+                moved.append((key, discovery_pb2.KEY_ENTITY, self.broker))
+                self.broker = None
+
+        # topic entries move one topic at a time
+        for topic in list(self.topic_index):
+            key = ChordUtils.topic_key(self.num_ft_entries, topic)
+            if not ChordUtils.is_between(key, start, end):
+                continue
+            for pub_id in list(self.topic_index[topic]):
+                entry = self.topic_dict[pub_id]
+                topic_req = discovery_pb2.RegisterReq()  # allocate
+                topic_req.role = entry.role
+                topic_req.info.CopyFrom(entry.info)
+                topic_req.topiclist.append(topic)
+                moved.append((key, discovery_pb2.KEY_TOPIC, topic_req))
+                self.drop_topic_entry(pub_id, topic, removed=False)
+
+        for key, key_type, reg_req in moved:
+            self.persist(discovery_pb2.TYPE_UNREGISTER, key_type, reg_req, moved=True)
+        if moved:
+            self.generation += 1
+            self.load_report()
+            self.snapshot_if_due()
+        return moved
+
+    ########################################
+    # durable registry
+    #
+    # With a DataDir every change is logged before it is applied, and
+    # the log is replaced by a snapshot of the whole registry every
+    # SnapshotEvery records. A restarted node loads the snapshot
+    # straight into its dictionaries and replays the few records
+    # logged after it.
+    ########################################
+    def persist(self, op, key_type, reg_req, moved=False):
+        ''' log a change of the registry before it is applied '''
+
+        if self.store is not None and not self.restoring:
+            self.store.append(op, key_type, reg_req, moved)
+
+    def snapshot_if_due(self):
+        ''' replace the log by a snapshot once it grew long enough '''
+
+        if self.store is None or self.restoring or not self.store.snapshot_due():
+            return
+        snapshot = discovery_pb2.RegistrySnapshot()  # allocate
+        snapshot.pub_ids.extend(self.pub_dict.keys())
+        snapshot.pubs.extend(self.pub_dict.values())
+        snapshot.sub_ids.extend(self.sub_dict.keys())
+        snapshot.subs.extend(self.sub_dict.values())
+        if self.broker is not None:
+            snapshot.broker.CopyFrom(self.broker)
+        snapshot.entry_ids.extend(self.topic_dict.keys())
+        snapshot.topic_entries.extend(self.topic_dict.values())
+        for topic, pub_ids in self.topic_index.items():
+            index_entry = snapshot.topic_index.add()
+            index_entry.topic = topic
+            index_entry.pub_ids.extend(pub_ids)
+        self.store.write_snapshot(snapshot)
+
+    def restore(self):
+        ''' load the registry we had before a restart '''
+
+        start = time.perf_counter()
+        snapshot, records = self.store.load()
+        self.restoring = True
+        # millions of new objects would set off the garbage collector over and over
+        collecting = gc.isenabled()
+        gc.disable()
+        try:
+            if snapshot is not None:
+                # the id columns spare us looking into every record for its key
+                self.pub_dict = dict(zip(snapshot.pub_ids, snapshot.pubs))
+                self.sub_dict = dict(zip(snapshot.sub_ids, snapshot.subs))
+                self.broker = snapshot.broker if snapshot.HasField("broker") else None
+                self.topic_dict = dict(zip(snapshot.entry_ids, snapshot.topic_entries))
+                self.topic_index = {index_entry.topic: set(index_entry.pub_ids) for index_entry in snapshot.topic_index}
+                self.generation += 1
+
+            for record in records:
+                if record.op == discovery_pb2.TYPE_REGISTER:
+                    self.register_request(record.reg, record.key_type)
+                else:
+                    self.unregister_request(record.reg, record.key_type)
+        finally:
+            self.restoring = False
+            if collecting:
+                gc.enable()
+
+        self.logger.info("DiscoveryAppln::restore - {} pubs, {} subs, {} topic entries in {:.3f} s".format(
+            len(self.pub_dict), len(self.sub_dict), len(self.topic_dict), time.perf_counter() - start))
+        self.load_report()
+
+    ########################################
+    # forget that a publisher publishes a topic
+    #
+    # Keeps topic_dict and topic_index in step; the entry of the
+    # publisher goes away with its last topic. Watchers see the
+    # publisher removed, unless the entry only moved to another
+    # owner (removed=False) and they have to ask that owner.
+    ########################################
+    def drop_topic_entry(self, pub_id, topic, removed=True):
+        ''' remove one (publisher, topic) entry '''
+
+        pub_ids = self.topic_index.get(topic)
+        if pub_ids is None or pub_id not in pub_ids:
+            return
+        pub_ids.discard(pub_id)
+        self.generation += 1
+        if not pub_ids:
+            del self.topic_index[topic]
+
+        entry = self.topic_dict[pub_id]
+        if removed:
+            self.log_topic_change(topic, True, entry.info)
+        else:
+            self.forget_topic_changes(topic)
+        entry.topiclist.remove(topic)
+        if not entry.topiclist:
+            del self.topic_dict[pub_id]
+
+    ########################################
+    # the changes of the publishers of a topic, for its watchers
+    #
+    # Every change of the publishers of a topic we own gets the next
+    # version of the topic. A watcher sends the version it has seen
+    # and gets the changes after it from the log; one that fell
+    # further behind than the log reaches, or that saw the versions
+    # of another owner, starts from scratch.
+    ########################################
+    def log_topic_change(self, topic, removed, info):
+        ''' record that a publisher was added to or removed from topic '''
+
+        version = self.topic_versions.get(topic, 0) + 1
+        self.topic_versions[topic] = version
+        log = self.topic_log.get(topic)
+        if log is None:
+            log = self.topic_log[topic] = collections.deque(maxlen=self.watch_log_size)
+        log.append((version, removed, info))
+
+    def forget_topic_changes(self, topic):
+        ''' make every watcher of topic start from scratch '''
+
+        self.topic_versions[topic] = self.topic_versions.get(topic, 0) + 1
+        self.topic_log.pop(topic, None)
+
+    def watch_request(self, watch_req):
+        ''' changes of the publishers of the watched topics since the versions the watcher has seen '''
+
+        try:
+            self.logger.debug("DiscoveryAppln::watch_request")
+            watch_resp = discovery_pb2.WatchResp()  # allocate
+            seen = {v.topic: v for v in watch_req.versions}
+            for topic in watch_req.topiclist:
+                version = self.topic_versions.get(topic, 0)
+                cursor = seen.get(topic)
+                log = self.topic_log.get(topic, ())
+                if cursor is not None and cursor.owner == self.watch_owner and cursor.version == version:
+                    pass  # nothing new
+                elif cursor is not None and cursor.owner == self.watch_owner and cursor.version < version \
+                        and log and log[0][0] <= cursor.version + 1:
+                    for change, removed, info in log:
+                        if change > cursor.version:
+                            delta = watch_resp.deltas.add()
+                            delta.topic = topic
+                            delta.removed = removed
+                            delta.info.CopyFrom(info)
+                else:
+                    watch_resp.reset.append(topic)
+                    for pub_id in self.topic_index.get(topic, ()):
+                        delta = watch_resp.deltas.add()
+                        delta.topic = topic
+                        delta.info.CopyFrom(self.topic_dict[pub_id].info)
+
+                topic_version = watch_resp.versions.add()
+                topic_version.topic = topic
+                topic_version.owner = self.watch_owner
+                topic_version.version = version
+
+            return watch_resp
+
+        except Exception as e:
+            raise e
+
+    ########################################
+    # replicas of the entries we own
+    #
+    # The publishers of a topic and the broker record are what lookups
+    # read, so these are copied to the successors of their owner. A
+    # copy always holds everything stored under its key and replaces
+    # the previous one. The middleware pushes the copies; here we only
+    # hand out our entries and keep the copies we received.
+    ########################################
+    def replica_entries(self, key_type, topic):
+        ''' what we store under the key of topic, or the broker key for an empty topic '''
+
+        if key_type == discovery_pb2.KEY_TOPIC:
+            return [self.topic_dict[pub_id].info for pub_id in self.topic_index.get(topic, ())]
+        return [] if self.broker is None else [self.broker.info]
+
+    def replica_records(self):
+        ''' (key, key type, topic, entries) of everything we own that is replicated '''
+
+        records = []
+        for topic in self.topic_index:
+            records.append((ChordUtils.topic_key(self.num_ft_entries, topic), discovery_pb2.KEY_TOPIC, topic,
+                            self.replica_entries(discovery_pb2.KEY_TOPIC, topic)))
+        if self.broker is not None:
+            records.append((ChordUtils.broker_key(self.num_ft_entries), discovery_pb2.KEY_ENTITY, "",
+                            self.replica_entries(discovery_pb2.KEY_ENTITY, "")))
+        return records
+
+    def store_replica(self, replica_msg):
+        ''' keep the copy of the entries of a key owned by one of our predecessors '''
+
+        self.logger.debug("DiscoveryAppln::store_replica - {} pubs of '{}' from {}".format(
+            len(replica_msg.pubs), replica_msg.topic, replica_msg.owner))
+        self.generation += 1
+        self.replicas[(replica_msg.key_type, replica_msg.topic)] = (replica_msg.owner, list(replica_msg.pubs))
+
+    def replica_lookup(self, lookup_req):
+        ''' the answer to a lookup from our replicas, None unless we hold a copy for every topic '''
+
+        if self.is_broker_dissemination():
+            replica = self.replicas.get((discovery_pb2.KEY_ENTITY, ""))
+            return None if replica is None else replica[1]
+
+        pubs = {}
+        for topic in lookup_req.topiclist:
+            replica = self.replicas.get((discovery_pb2.KEY_TOPIC, topic))
+            if replica is None:
+                return None
+            for info in replica[1]:
+                pubs.setdefault(info.id, info)
+        self.logger.debug("DiscoveryAppln::replica_lookup found {} pubs for topic".format(len(pubs)))
+        return list(pubs.values())
+
+    ########################################
+    # readiness counts of the whole ring
+    #
+    # Registrations are spread over the ring, so the number of publishers,
+    # subscribers and brokers is the sum over all virtual nodes. Each of
+    # our virtual nodes counts the records with keys on its arc, and the
+    # entries that changed are sent to the owner of the readiness key
+    # (see DiscoveryMW), which answers is_ready from the table of all of
+    # them without asking anybody.
+    #
+    # Records move between arcs when the ring changes, and the entries
+    # of the old and the new owner do not arrive together. A record can
+    # only be counted by two entries whose arcs both hold its key, so of
+    # entries with overlapping arcs only the latest is summed. A move
+    # may thus count too few for a moment, never too many.
+    ########################################
+    def set_ring_arcs(self, arcs):
+        ''' the (virtual node, start, end) of the arcs (start, end] of keys our virtual nodes own '''
+
+        self.ring_arcs = list(arcs)
+        # the entries we sum may change with our arcs
+        self.counts_generation += 1
+
+    def own_ring_counts(self):
+        ''' entries counting the records on each of our arcs as they are now '''
+
+        # is_ready asks after every registration; count again only when something changed
+        generation = (self.generation, self.counts_generation)
+        if self.own_counts_cache is not None and self.own_counts_cache[0] == generation:
+            return self.own_counts_cache[1]
+
+        pub_keys = [ChordUtils.entity_key(self.num_ft_entries, entity_id) for entity_id in self.pub_dict]
+        sub_keys = [ChordUtils.entity_key(self.num_ft_entries, entity_id) for entity_id in self.sub_dict]
+        broker_keys = [] if self.broker is None else [ChordUtils.broker_key(self.num_ft_entries)]
+        entries = []
+        for node, start, end in self.ring_arcs:
+            counts = tuple(sum(1 for key in keys if ChordUtils.is_between(key, start, end))
+                           for keys in (pub_keys, sub_keys, broker_keys))
+            known = self.own_counts.get(node)
+            if known is not None and (known.arc_start, known.arc_end, known.pubs, known.subs, known.brokers) == \
+                    (start, end) + counts:
+                entries.append(known)
+                continue
+            entry = discovery_pb2.ReadinessCount()  # allocate
+            entry.node = node
+            # a restarted instance announces with a later version than before it went down
+            entry.version = max(time.time_ns(), known.version + 1 if known is not None else 0)
+            entry.pubs, entry.subs, entry.brokers = counts
+            entry.arc_start, entry.arc_end = start, end
+            entries.append(entry)
+        self.own_counts_cache = (generation, entries)
+        return entries
+
+    def update_ring_count(self, refresh=False):
+        ''' refresh the entries of our virtual nodes; returns those that changed, or all with refresh, to announce '''
+
+        changed = [entry for entry in self.own_ring_counts() if refresh or self.own_counts.get(entry.node) is not entry]
+        for entry in changed:
+            self.own_counts[entry.node] = entry
+        return changed
+
+    def merge_ring_counts(self, counts):
+        ''' keep the entries newer than what we know; returns True if any was '''
+
+        changed = False
+        for count in counts:
+            known = self.ring_counts.get(count.node)
+            # we know the counts of our own virtual nodes best
+            if self.finger_table.table(count.node) is not None or \
+                    (known is not None and known.version >= count.version):
+                continue
+            entry = discovery_pb2.ReadinessCount()  # allocate
+            entry.CopyFrom(count)
+            self.ring_counts[count.node] = entry
+            changed = True
+        if changed:
+            # lookups are not affected, so the cached answers stay valid
+            self.counts_generation += 1
+        return changed
+
+    def known_ring_counts(self):
+        ''' every entry we know, ours as last announced included, e.g., to hand to a new owner '''
+
+        return list(self.ring_counts.values()) + list(self.own_counts.values())
+
+    def ring_totals(self):
+        ''' (pubs, subs, brokers) registered across the ring as far as we know '''
+
+        # our own counts as they are now, even if not announced yet
+        entries = self.own_ring_counts() + list(self.ring_counts.values())
+        latest = lambda entry: (entry.version, entry.node)
+        pubs = subs = brokers = 0
+        for entry in entries:
+            if any(latest(other) > latest(entry) and self.arcs_overlap(entry, other) for other in entries):
+                continue  # its records moved to a newer arc, or they are on their way
+            pubs += entry.pubs
+            subs += entry.subs
+            brokers += entry.brokers
+        return pubs, subs, brokers
+
+    @staticmethod
+    def arcs_overlap(entry, other):
+        ''' True when the arcs of two entries share a key; then one of them holds the end of the other '''
+
+        return ChordUtils.is_between(entry.arc_end, other.arc_start, other.arc_end) or \
+            ChordUtils.is_between(other.arc_end, entry.arc_start, entry.arc_end)
+
+    ########################################
+    # leave the ring
+    ########################################
+    def leave(self):
+        ''' hand our registrations over and leave the ring '''
+
+        self.logger.info("DiscoveryAppln::leave")
+        self.logger.info("DiscoveryAppln::leave - lookup cache {}".format(self.mw_obj.cache_stats()))
+        self.logger.info("DiscoveryAppln::leave - lookups answered from replicas {}".format(self.mw_obj.replica_reads))
+        self.logger.info("DiscoveryAppln::leave - client requests {}".format(self.mw_obj.admission_stats()))
+        self.logger.info("DiscoveryAppln::leave - dealers to other DHT nodes {}".format(self.mw_obj.peer_stats()))
+        self.mw_obj.leave()
+        if self.store is not None:
+            self.store.close()
+
     ########################################
     # handle isready request method called as part of upcall
     #
@@ -262,27 +816,30 @@ class DiscoveryAppln():
             min_subs_met = False
             broker_met = True
 
-            self.logger.debug("registered Pubs = {}".format(len(self.pub_dict)))
-            if self.num_pubs <= len(self.pub_dict):
+            # the counts of the whole ring, not only of the registrations stored here
+            pubs, subs, brokers = self.ring_totals()
+
+            self.logger.debug("registered Pubs = {}".format(pubs))
+            if self.num_pubs <= pubs:
                 min_pubs_met = True
 
-            self.logger.debug("registered Subs = {}".format(len(self.sub_dict)))
-            if self.num_subs <= len(self.sub_dict):
+            self.logger.debug("registered Subs = {}".format(subs))
+            if self.num_subs <= subs:
                 min_subs_met = True
 
-            if self.is_broker_dissemination() and self.broker == None:
+            if self.is_broker_dissemination() and brokers == 0:
                 broker_met = False
 
             if min_pubs_met and min_subs_met and broker_met:
                 self.logger.info("Discovery Service Ready")
-                self.logger.info(f"Pubs: {len(self.pub_dict)}, Subs: {len(self.sub_dict)}")
+                self.logger.info(f"Pubs: {pubs}, Subs: {subs}")
                 return True
 
             self.logger.info("Discovery Service Not Ready")
             if (self.is_broker_dissemination()):
-                self.logger.info(f"Pubs: {len(self.pub_dict)}, Subs: {len(self.sub_dict)}, Broker: {self.broker}")
+                self.logger.info(f"Pubs: {pubs}, Subs: {subs}, Brokers: {brokers}")
             else:
-                self.logger.info(f"Pubs: {len(self.pub_dict)}, Subs: {len(self.sub_dict)}")
+                self.logger.info(f"Pubs: {pubs}, Subs: {subs}")
 
             return False
 
@@ -293,24 +850,16 @@ class DiscoveryAppln():
         try:
             self.logger.info("DiscoveryAppln::lookup_pubs_topic_request")
 
-            pubs_matching_topics = []
-
             if self.is_broker_dissemination():
+                # only the owner of the broker key knows the broker
+                if self.broker is None:
+                    return []
                 self.logger.info("Sending Broker as Pub".format(self.broker))
                 return [self.broker.info]
             else:
-                self.logger.info("Evaluating {} pubs".format(len(self.pub_dict)))
-                for pub in self.pub_dict:
-                    # self.logger.debug(x)
-                    # self.logger.debug(self.pub_dict[x])
-
-                    self.logger.debug("evaluating pub_dict")
-                    self.logger.debug(
-                        "DiscoveryAppln::lookup_pubs_topic_request evaluating pub: {}".format(self.pub_dict[pub]))
-                    if any(x in lookup_req.topiclist for x in self.pub_dict[pub].topiclist):
-                        self.logger.debug(
-                            f"DiscoveryAppln::lookup_pubs_topic_request appending pub: {self.pub_dict[pub]}")
-                        pubs_matching_topics.append(self.pub_dict[pub].info)
+                # the publishers of any of the topics, straight from the topic index
+                pub_ids = set().union(*[self.topic_index.get(topic, ()) for topic in lookup_req.topiclist])
+                pubs_matching_topics = [self.topic_dict[pub_id].info for pub_id in pub_ids]
 
                 self.logger.info("DiscoveryAppln::lookup_pubs_topic_request found {} pubs for topic".format(
                     len(pubs_matching_topics)))
@@ -345,10 +894,12 @@ class DiscoveryAppln():
             self.logger.info("     Name: {}".format(self.name))
             self.logger.info("     Num Publishers: {}".format(self.num_pubs))
             self.logger.info("     Num Subscribers: : {}".format(self.num_subs))
+            self.logger.info("     Num Virtual Nodes: {}".format(len(self.finger_table)))
             self.logger.info("**********************************")
 
             if self.dht_info is not None:
-                ChordUtils.print_finger_table(self.dht_info, self.finger_table)
+                for table in self.finger_table:
+                    ChordUtils.print_finger_table(table.node, table)
         except Exception as e:
             raise e
 
@@ -391,6 +942,13 @@ def parseCmdLineArgs():
     parser.add_argument("-j", "--json_file", default="dht48.json",
                         help="JSON file with the database of all DHT nodes, default dht8.json")
 
+    parser.add_argument("-A", "--asyncio", action="store_true",
+                        help="serve requests, forwarded DHT hops and timers as asyncio tasks instead of one poll loop")
+
+    parser.add_argument("-J", "--join", default=None,
+                        help="addr:port of any discovery node of a running ring to join through; "
+                             "we need not be in the JSON file then")
+
     return parser.parse_args()
 
 
@@ -422,9 +980,16 @@ def main():
         logger.debug("Main: configure the publisher appln object")
         dis_app.configure(args)
 
+        # leave the ring gracefully when we are stopped or killed
+        signal.signal(signal.SIGTERM, signal.default_int_handler)
+
         # now invoke the driver program
         logger.debug("Main: invoke the publisher appln driver")
-        dis_app.driver()
+        try:
+            dis_app.driver()
+        except KeyboardInterrupt:
+            logger.info("Main: leaving the ring")
+            dis_app.leave()
 
     except Exception as e:
         logger.exception("Exception caught in main - {}".format(e))
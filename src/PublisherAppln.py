@@ -56,6 +56,7 @@ from topic_selector import TopicSelector
 
 # Now import our CS6381 Middleware
 from CS6381_MW.PublisherMW import PublisherMW
+from CS6381_MW.Common import RetryBackoff
 # We also need the message formats to handle incoming responses.
 from CS6381_MW import discovery_pb2
 
@@ -78,7 +79,8 @@ class PublisherAppln ():
     REGISTER = 2,
     ISREADY = 3,
     DISSEMINATE = 4,
-    COMPLETED = 5
+    UNREGISTER = 5,
+    COMPLETED = 6
 
   ########################################
   # constructor
@@ -93,6 +95,8 @@ class PublisherAppln ():
     self.num_topics = None # total num of topics we publish
     self.lookup = None # one of the diff ways we do lookup
     self.dissemination = None # direct or via broker
+    self.retry_after = None  # milliseconds to wait at least before asking is ready again
+    self.isready_backoff = RetryBackoff ()  # how long to wait after a not ready answer
     self.mw_obj = None # handle to the underlying Middleware object
     self.logger = logger  # internal logger for print statements
 
@@ -116,13 +120,6 @@ class PublisherAppln ():
       self.num_topics = args.num_topics  # total num of topics we publish
       self.port = args.port
 
-      # Choose a discovery node.  Start with the first one to make sure things are wired properly.
-      dht_nodes = ChordUtils.to_sorted_dht_node_list(
-        ChordUtils.load_json_data(os.path.join(os.path.dirname(__file__), 'Utils', args.json_file)))
-      discover_node =  dht_nodes[0]
-      args.discovery = f"{discover_node.get(IP)}:{discover_node.get(PORT)}"
-      self.logger.info(f"PublisherAppln::configure - discovery set to {discover_node} - {args.discovery}")
-
       # Now, get the configuration object
       try:
         self.logger.debug ("PublisherAppln::configure - parsing config.ini")
@@ -134,6 +131,7 @@ class PublisherAppln ():
         self.lookup = config["Discovery"]["Strategy"]
         self.logger.debug ("PublisherAppln::configure - config.ini dissemination")
         self.dissemination = config["Dissemination"]["Strategy"]
+        self.retry_after = config.getint ("Discovery", "RetryAfter", fallback=100)
       except Exception as e:
         self.logger.error ("PublisherAppln::configure - Exception {}".format(e))
         self.logger.exception ("PublisherAppln::configure - Trace {}".format(e))
@@ -147,7 +145,17 @@ class PublisherAppln ():
       # everything
       self.logger.debug ("PublisherAppln::configure - initialize the middleware object")
       self.mw_obj = PublisherMW (self.logger)
-      self.mw_obj.configure (args) # pass remainder of the args to the m/w object
+
+      # Discovery requests go straight to the DHT nodes owning their keys, so we need
+      # the ring as the discovery nodes were started with it, virtual nodes included
+      dht_json = ChordUtils.load_json_data (os.path.join (os.path.dirname (__file__), 'Utils', args.json_file))
+      bits = ChordUtils.ring_bits (dht_json)
+      dht_ring = ChordUtils.expand_virtual_nodes (ChordUtils.to_sorted_dht_node_list (dht_json), bits,
+                                                  config.getint ("Chord", "VirtualNodes", fallback=1),
+                                                  ChordUtils.parse_host_weights (config.get ("Chord", "HostWeights", fallback="")))
+      self.mw_obj.configure (args, dht_ring, bits, config.getint ("Discovery", "ClientConnections", fallback=4),
+                             config.getfloat ("Discovery", "TraceRate", fallback=0.0),
+                             config.getint ("Metrics", "PortOffset", fallback=0)) # pass remainder of the args to the m/w object
       
       self.logger.info ("PublisherAppln::configure - configuration complete")
       
@@ -270,12 +278,21 @@ class PublisherAppln ():
 
         self.logger.debug ("PublisherAppln::invoke_operation - Dissemination completed")
 
-        # we are done. So we move to the completed state
-        self.state = self.State.COMPLETED
+        # we are done. So we leave the discovery service before we complete
+        self.state = self.State.UNREGISTER
 
         # return a timeout of zero so that the event loop sends control back to us right away.
         return 0
         
+      elif (self.state == self.State.UNREGISTER):
+        # tell the discovery service we are gone so that subscribers watching
+        # our topics disconnect from us
+        self.logger.debug ("PublisherAppln::invoke_operation - unregister with the discovery service")
+        self.mw_obj.unregister (self.name, self.topiclist)
+
+        # the very next thing we expect is the response to our unregister request
+        return None
+
       elif (self.state == self.State.COMPLETED):
         self.logger.info ("PublisherAppln::invoke_operation: complete.  Shutting down...")
         # we are done. Time to break the event loop. So we created this special method on the
@@ -320,6 +337,26 @@ class PublisherAppln ():
     except Exception as e:
       raise e
 
+  ########################################
+  # handle unregister response method called as part of upcall
+  ########################################
+  def unregister_response (self, unreg_resp):
+    ''' handle unregister response '''
+
+    try:
+      self.logger.info ("PublisherAppln::unregister_response")
+      if unreg_resp.status != discovery_pb2.STATUS_SUCCESS:
+        # we are shutting down anyway; watchers miss our leaving at worst
+        self.logger.warning ("PublisherAppln::unregister_response - unregister failed with reason {}".format (unreg_resp.reason))
+
+      self.state = self.State.COMPLETED
+
+      # return timeout of 0 so event loop calls us back in the invoke_operation
+      return 0
+
+    except Exception as e:
+      raise e
+
   ########################################
   # handle isready response method called as part of upcall
   #
@@ -331,13 +368,15 @@ class PublisherAppln ():
     try:
       self.logger.info ("PublisherAppln::isready_response")
 
-      # Notice how we get that loop effect with the sleep (10)
-      # by an interaction between the event loop and these
-      # upcall methods.
+      # Notice how we get that loop effect by an interaction between the
+      # event loop and these upcall methods. The discovery service usually
+      # holds our request until it is ready, but with IsReadyWait 0 it answers
+      # not ready at once, so we wait a little (and longer each time) before
+      # we ask again instead of flooding it.
       if not isready_resp.status:
         # discovery service is not ready yet
         self.logger.debug ("PublisherAppln::driver - Not ready yet; check again")
-        time.sleep (10)  # sleep between calls so that we don't make excessive calls
+        return self.isready_backoff.delay (self.retry_after)
 
       else:
         # we got the go ahead
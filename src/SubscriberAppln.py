@@ -34,7 +34,6 @@
 # import the needed packages
 import os  # for OS functions
 import sys  # for syspath and system exception
-import time  # for sleep
 import argparse  # for argument parsing
 import configparser  # for configuration parsing
 import logging  # for logging. Use it in place of print statements.
@@ -47,6 +46,7 @@ from topic_selector import TopicSelector
 
 # Now import our CS6381 Middleware
 from CS6381_MW.SubscriberMW import SubscriberMW
+from CS6381_MW.Common import RetryBackoff
 # We also need the message formats to handle incoming responses.
 from CS6381_MW import discovery_pb2
 
@@ -84,6 +84,8 @@ class SubscriberAppln():
         self.num_topics = None  # total num of topics we consume
         self.lookup = None  # one of the diff ways we do lookup
         self.dissemination = None  # direct or via broker
+        self.retry_after = None  # milliseconds to wait at least before asking is ready again
+        self.isready_backoff = RetryBackoff()  # how long to wait after a not ready answer
         self.mw_obj = None  # handle to the underlying Middleware object
         self.logger = logger  # internal logger for print statements
         ########################################
@@ -106,19 +108,13 @@ class SubscriberAppln():
             self.frequency = args.frequency # frequency with which topics are disseminated
             self.num_topics = args.num_topics  # total num of topics we publish
 
-            # Choose a discovery node.  Start with the first one to make sure things are wired properly.
-            dht_nodes = ChordUtils.to_sorted_dht_node_list(
-                ChordUtils.load_json_data(os.path.join(os.path.dirname(__file__), 'Utils', args.json_file)))
-            discover_node = dht_nodes[0]
-            args.discovery = f"{discover_node.get(IP)}:{discover_node.get(PORT)}"
-            self.logger.info(f"SubscriberAppln::configure - discovery set to {discover_node} - {args.discovery}")
-
             # Now, get the configuration object
             self.logger.debug("SubscriberAppln::configure - parsing config.ini")
             config = configparser.ConfigParser()
             config.read(args.config)
             self.lookup = config["Discovery"]["Strategy"]
             self.dissemination = config["Dissemination"]["Strategy"]
+            self.retry_after = config.getint("Discovery", "RetryAfter", fallback=100)
 
             # Now get our topic list of interest
             self.logger.debug("SubscriberAppln::configure - selecting our topic list")
@@ -129,7 +125,18 @@ class SubscriberAppln():
             # everything
             self.logger.debug("SubscriberAppln::configure - initialize the middleware object")
             self.mw_obj = SubscriberMW(self.logger)
-            self.mw_obj.configure(args)  # pass remainder of the args to the m/w object
+
+            # Discovery requests go straight to the DHT nodes owning their keys, so we need
+            # the ring as the discovery nodes were started with it, virtual nodes included
+            dht_json = ChordUtils.load_json_data(os.path.join(os.path.dirname(__file__), 'Utils', args.json_file))
+            bits = ChordUtils.ring_bits(dht_json)
+            dht_ring = ChordUtils.expand_virtual_nodes(ChordUtils.to_sorted_dht_node_list(dht_json), bits,
+                                                       config.getint("Chord", "VirtualNodes", fallback=1),
+                                                       ChordUtils.parse_host_weights(config.get("Chord", "HostWeights", fallback="")))
+            self.mw_obj.configure(args, dht_ring, bits, config.getint("Discovery", "ClientConnections", fallback=4),
+                                  self.dissemination == "Broker",
+                                  config.getfloat("Discovery", "TraceRate", fallback=0.0),
+                                  config.getint("Metrics", "PortOffset", fallback=0))  # pass remainder of the args to the m/w object
             self.logger.info("SubscriberAppln::configure - configuration complete")
 
         except Exception as e:
@@ -298,13 +305,15 @@ class SubscriberAppln():
         try:
             self.logger.info ("SubscriberAppln::isready_response")
 
-            # Notice how we get that loop effect with the sleep (10)
-            # by an interaction between the event loop and these
-            # upcall methods.
+            # Notice how we get that loop effect by an interaction between the
+            # event loop and these upcall methods. The discovery service usually
+            # holds our request until it is ready, but with IsReadyWait 0 it answers
+            # not ready at once, so we wait a little (and longer each time) before
+            # we ask again instead of flooding it.
             if not isready_resp.status:
                 # discovery service is not ready yet
                 self.logger.debug ("SubscriberAppln::driver - Not ready yet; check again")
-                time.sleep (10)  # sleep between calls so that we don't make excessive calls
+                return self.isready_backoff.delay (self.retry_after)
 
             else:
                 # we got the go ahead
@@ -325,6 +334,10 @@ class SubscriberAppln():
 
             self.mw_obj.subscribe(self.topiclist, lookup_resp.pubs)
 
+            # publishers that register later, or leave, reach us as watch answers
+            if self.dissemination == "Direct":
+                self.mw_obj.watch(self.topiclist, lookup_resp.pubs)
+
             self.state = self.State.CONSUME
 
             # return timeout of 0 so event loop calls us back in the invoke_operation
@@ -16,14 +16,20 @@
 # a 48 bit hash. So this may be an attractive hash function to use for PA2 that is going to use Chord.
 
 import os
+import sys
 import random # random number generation
-import hashlib  # for the secure hash library
 import argparse # argument parsing
 import logging # for logging. Use it in place of print statements.
 
+# the Chord package lives one level up
+sys.path.insert (0, os.path.join (os.path.dirname (os.path.abspath (__file__)), ".."))
+
+from Chord.hashgen import hashgen_batch
+
 class HashCollisionTester ():
   # This is a class variable
   prefixes = ["pub", "sub", "disc"]  # our ids always start with one of these
+  batch_size = 10000  # ids hashed per call to hashgen_batch
 
   #################
   # constructor
@@ -76,47 +82,42 @@ class HashCollisionTester ():
     # We run this code for very large number of iterations (default 1 M)
     i = 0
     while (i < self.iters):  # test for very high number of runs
-      # now generate an id that we hope to use in our DHT when we supply it to our hash
-      # function. It will be of the form: some prefix like pub or sub or disc, followed by
+      # now generate ids that we hope to use in our DHT when we supply them to our hash
+      # function. Each will be of the form: some prefix like pub or sub or disc, followed by
       # entity number, followed by its IP address on which it runs, followed by port num
       # it uses. Here, we do not care about reuse of port num on the same host (which is
       # what it really should be checked for)
       #
-      # We could have used
-      id = random.choice (HashCollisionTester.prefixes) \
-          + str (random.randint (1, self.num_entities)) \
-          + ":10.0.0." \
-          + str (random.randint (1, self.num_hosts)) \
-          + ":" \
-          + str (random.randint (self.lower_port, self.upper_port)) 
-      
-      if i % 10000 == 0:
-        # since we are running so many iterations, just to inform us that the program is
-        # running so that we don't panic :-), we print something once in a while
-        self.logger.debug ("iteration num {}".format (i))
-
-      # first get the digest from hashlib and then take the desired number of bytes from the
-      # lower end of the 256 bits hash. Big or little endian does not matter.
-      hash_digest = hashlib.sha256 (bytes (id, "utf-8")).digest ()  # this is how we get the digest or hash value
-      # figure out how many bytes to retrieve
-      num_bytes = int(self.bits_hash/8)  # otherwise we get float which we cannot use below
-      hash_val = int.from_bytes (hash_digest[:num_bytes], "big")  # take lower N number of bytes
-
-      # now check if this hash val exists in our dictionary, which means collision occurred
-      # for these generated ids. But note that because we are generating an id using random
-      # number generation, we could also end up generating the same id and such an id will
-      # obviously collide. So we ignore that and do not increment our loop counter.
-      if hash_val in self.name_dict.keys ():
-        # since our random generation of a string may result in duplicates, clearly this will
-        # cause a collision. We do not count these collisions.
-        if id != self.name_dict[hash_val]:
-          self.logger.debug ("*******Collision occurred for {} bit hash {}, id {} and existing entry {}".format (self.bits_hash, hash_val, id, self.name_dict[hash_val]))
+      # The ids are hashed a batch at a time. A batch never holds more ids than the
+      # iterations left, and every id advances i by at most one.
+      ids = [random.choice (HashCollisionTester.prefixes) \
+             + str (random.randint (1, self.num_entities)) \
+             + ":10.0.0." \
+             + str (random.randint (1, self.num_hosts)) \
+             + ":" \
+             + str (random.randint (self.lower_port, self.upper_port)) \
+             for j in range (min (HashCollisionTester.batch_size, self.iters - i))]
+
+      # since we are running so many iterations, just to inform us that the program is
+      # running so that we don't panic :-), we print something once in a while
+      self.logger.debug ("iteration num {}".format (i))
+
+      for id, hash_val in zip (ids, hashgen_batch (self.bits_hash, ids).tolist ()):
+        # now check if this hash val exists in our dictionary, which means collision occurred
+        # for these generated ids. But note that because we are generating an id using random
+        # number generation, we could also end up generating the same id and such an id will
+        # obviously collide. So we ignore that and do not increment our loop counter.
+        if hash_val in self.name_dict:
+          # since our random generation of a string may result in duplicates, clearly this will
+          # cause a collision. We do not count these collisions.
+          if id != self.name_dict[hash_val]:
+            self.logger.debug ("*******Collision occurred for {} bit hash {}, id {} and existing entry {}".format (self.bits_hash, hash_val, id, self.name_dict[hash_val]))
+            i += 1
+            num_collisions += 1
+        else:
+          # this hash value was seen the first time. Save the entry
+          self.name_dict[hash_val] = id  # save this entry here for this hash value as this is the first time it is seen
           i += 1
-          num_collisions += 1
-      else:
-        # this hash value was seen the first time. Save the entry
-        self.name_dict[hash_val] = id  # save this entry here for this hash value as this is the first time it is seen
-        i += 1
 
     self.logger.debug ("\n********\tNumber of collisions found = {} **********".format (num_collisions))
       
@@ -0,0 +1,274 @@
+# Purpose:
+#
+# Load test of the discovery ring with the poll loop of DiscoveryMW against the asyncio
+# middleware (DiscoveryAppln -A, AsyncDiscoveryMW). For every mode we start a ring of
+# discovery nodes on this machine, then let many concurrent clients (1000 by default,
+# spread over a few client processes) each send a series of requests the way the
+# publisher and subscriber middleware do: a REQ socket, one request at a time. Every
+# other request is a publisher registration with two topics, the rest are lookups of
+# three topics, so both forwarded registrations and scatter-gather lookups are exercised.
+# The clients are spread over the nodes of the ring.
+#
+# For each mode we report the throughput of the whole ring and the latency percentiles
+# seen by the clients. The discovery nodes log at WARNING level so that log formatting
+# does not dominate the numbers.
+
+import os
+import sys
+import time
+import json
+import random # random number generation
+import asyncio
+import tempfile
+import configparser
+import subprocess
+import multiprocessing
+import argparse # argument parsing
+import logging # for logging. Use it in place of print statements.
+
+import zmq
+import zmq.asyncio
+
+# the Chord and CS6381_MW packages live one level up
+sys.path.insert (0, os.path.join (os.path.dirname (os.path.abspath (__file__)), ".."))
+
+from Chord.constants import *
+from Chord.hashgen import hashgen
+from CS6381_MW import discovery_pb2
+
+##################################
+# client side, runs in the client processes
+##################################
+async def run_client (client_id, endpoint, num_requests, num_topics, latencies, failures):
+  socket = zmq.asyncio.Context.instance ().socket (zmq.REQ)
+  socket.connect (endpoint)
+  rng = random.Random (client_id)
+  for i in range (num_requests):
+    disc_req = discovery_pb2.DiscoveryReq ()
+    if i % 2 == 0:
+      disc_req.msg_type = discovery_pb2.TYPE_REGISTER
+      register_req = disc_req.register_req
+      register_req.role = discovery_pb2.ROLE_PUBLISHER
+      register_req.info.id = "pub{}-{}".format (client_id, i)
+      register_req.info.addr = "10.0.0.1"
+      register_req.info.port = 5000 + i
+      register_req.topiclist.extend (["topic{}".format (rng.randrange (num_topics)) for t in range (2)])
+    else:
+      disc_req.msg_type = discovery_pb2.TYPE_LOOKUP_PUB_BY_TOPIC
+      disc_req.lookup_req.topiclist.extend (["topic{}".format (rng.randrange (num_topics)) for t in range (3)])
+
+    start = time.perf_counter ()
+    await socket.send (disc_req.SerializeToString ())
+    disc_resp = discovery_pb2.DiscoveryResp ()
+    disc_resp.ParseFromString (await socket.recv ())
+    latencies.append (time.perf_counter () - start)
+    if disc_resp.msg_type == discovery_pb2.TYPE_REGISTER and disc_resp.register_resp.status != discovery_pb2.STATUS_SUCCESS:
+      failures.append (disc_resp.register_resp.reason)
+  socket.close (linger=0)
+
+async def run_clients (first, endpoints, num_clients, num_requests, num_topics):
+  latencies = []
+  failures = []
+  await asyncio.gather (*[run_client (c, endpoints[c % len (endpoints)], num_requests, num_topics, latencies, failures)
+                          for c in range (first, first + num_clients)])
+  return latencies, failures
+
+def client_process (args):
+  first, endpoints, num_clients, num_requests, num_topics = args
+  return asyncio.run (run_clients (first, endpoints, num_clients, num_requests, num_topics))
+
+class DiscoveryLoad ():
+
+  #################
+  # constructor
+  #################
+  def __init__ (self, logger):
+    self.num_nodes = None  # discovery nodes in the ring
+    self.num_clients = None  # concurrent clients
+    self.num_requests = None  # requests per client
+    self.num_procs = None  # client processes
+    self.num_topics = None  # distinct topics
+    self.modes = None  # event loops to compare
+    self.base_port = None  # first port of the ring
+    self.forward_timeout = None  # ForwardTimeout of the ring in ms
+    self.logger = logger
+
+  #################
+  # configuration
+  #################
+  def configure (self, args):
+    self.logger.debug ("DiscoveryLoad::configure")
+
+    self.num_nodes = args.num_nodes
+    self.num_clients = args.num_clients
+    self.num_requests = args.num_requests
+    self.num_procs = args.num_procs
+    self.num_topics = args.num_topics
+    self.modes = args.modes.split (",")
+    self.base_port = args.base_port
+    self.forward_timeout = args.forward_timeout
+
+  #################
+  # start a ring of discovery nodes
+  #################
+  def start_ring (self, workdir, mode, base_port):
+    nodes = []
+    for i in range (self.num_nodes):
+      port = base_port + i
+      nodes.append ({ID: "disc{}".format (i + 1), HASH: hashgen (48, "disc{}:127.0.0.1:{}".format (i + 1, port)),
+                     IP: "127.0.0.1", PORT: port, HOST: "h1"})
+    json_file = os.path.join (workdir, "ring-{}.json".format (mode))
+    with open (json_file, "w") as f:
+      json.dump ({BITS: 48, DHT: nodes}, f)
+
+    # the ring runs with the config.ini of the src directory, except that forwarded requests
+    # may wait as long as the clients are queued; a loaded machine must not turn into timeouts
+    src_dir = os.path.join (os.path.dirname (os.path.abspath (__file__)), "..")
+    config = configparser.ConfigParser ()
+    config.read (os.path.join (src_dir, "config.ini"))
+    config["Chord"]["ForwardTimeout"] = str (self.forward_timeout)
+    config_file = os.path.join (workdir, "config-{}.ini".format (mode))
+    with open (config_file, "w") as f:
+      config.write (f)
+
+    procs = []
+    for node in nodes:
+      cmd = [sys.executable, os.path.join (src_dir, "DiscoveryAppln.py"), "-n", node[ID], "-a", "127.0.0.1",
+             "-p", str (node[PORT]), "-j", json_file, "-c", config_file, "-l", "30"]
+      if mode == "asyncio":
+        cmd.append ("-A")
+      out = open (os.path.join (workdir, "{}-{}.out".format (mode, node[ID])), "w")
+      procs.append (subprocess.Popen (cmd, stdout=out, stderr=subprocess.STDOUT, cwd=src_dir))
+    return ["tcp://127.0.0.1:{}".format (n[PORT]) for n in nodes], procs
+
+  #################
+  # run the clients against one mode
+  #################
+  def run_mode (self, workdir, mode, base_port):
+    endpoints, procs = self.start_ring (workdir, mode, base_port)
+    try:
+      # give the nodes time to bind and connect to each other
+      time.sleep (2)
+
+      per_proc = [self.num_clients // self.num_procs + (1 if p < self.num_clients % self.num_procs else 0)
+                  for p in range (self.num_procs)]
+      jobs = []
+      first = 0
+      for count in per_proc:
+        jobs.append ((first, endpoints, count, self.num_requests, self.num_topics))
+        first += count
+
+      start = time.perf_counter ()
+      with multiprocessing.Pool (self.num_procs) as pool:
+        results = pool.map (client_process, jobs)
+      elapsed = time.perf_counter () - start
+    finally:
+      # no graceful leave; it would only migrate the registrations between dying nodes
+      for proc in procs:
+        proc.kill ()
+      for proc in procs:
+        proc.wait ()
+
+    latencies = sorted (l for res in results for l in res[0])
+    failures = sum (len (res[1]) for res in results)
+    pct = lambda q: 1000.0 * latencies[min (len (latencies) - 1, int (q * len (latencies)))]
+    self.logger.info ("{:<8} {:>8} {:>9.0f} {:>9.2f} {:>9.2f} {:>9.2f} {:>9.2f} {:>9}".format (
+      mode, len (latencies), len (latencies) / elapsed, 1000.0 * sum (latencies) / len (latencies),
+      pct (0.5), pct (0.99), 1000.0 * latencies[-1], failures))
+
+  #################
+  # Driver program
+  #################
+  def driver (self):
+    self.logger.debug ("DiscoveryLoad::driver")
+
+    self.logger.info ("{} discovery nodes, {} clients x {} requests from {} processes".format (
+      self.num_nodes, self.num_clients, self.num_requests, self.num_procs))
+    self.logger.info ("{:<8} {:>8} {:>9} {:>9} {:>9} {:>9} {:>9} {:>9}".format (
+      "Mode", "requests", "req/s", "mean ms", "p50 ms", "p99 ms", "max ms", "failures"))
+
+    with tempfile.TemporaryDirectory () as workdir:
+      for i, mode in enumerate (self.modes):
+        # a fresh set of ports per mode so that we do not race the previous ring shutting down
+        self.run_mode (workdir, mode, self.base_port + 100 * i)
+
+###################################
+#
+# Parse command line arguments
+#
+###################################
+def parseCmdLineArgs ():
+  # instantiate a ArgumentParser object
+  parser = argparse.ArgumentParser (description="Discovery ring load test, poll loop vs. asyncio")
+
+  parser.add_argument ("-N", "--num_nodes", type=int, default=3, help="Discovery nodes in the ring, default 3")
+
+  parser.add_argument ("-c", "--num_clients", type=int, default=1000, help="Concurrent clients, default 1000")
+
+  parser.add_argument ("-r", "--num_requests", type=int, default=20, help="Requests per client, default 20")
+
+  parser.add_argument ("-P", "--num_procs", type=int, default=min (4, os.cpu_count ()), help="Client processes, default 4 or the number of CPUs if less")
+
+  parser.add_argument ("-t", "--num_topics", type=int, default=50, help="Distinct topics, default 50")
+
+  parser.add_argument ("-m", "--modes", default="poll,asyncio", help="Comma separated event loops to compare, default poll,asyncio")
+
+  parser.add_argument ("-T", "--forward_timeout", type=int, default=120000, help="ForwardTimeout of the discovery nodes in ms, default 120000")
+
+  parser.add_argument ("-b", "--base_port", type=int, default=7001, help="Port of the first discovery node, default 7001")
+
+  parser.add_argument ("-l", "--loglevel", type=int, default=logging.INFO, choices=[logging.DEBUG,logging.INFO,logging.WARNING,logging.ERROR,logging.CRITICAL], help="logging level, choices 10,20,30,40,50: default 20=logging.INFO")
+
+  return parser.parse_args()
+
+
+###################################
+#
+# Main program
+#
+###################################
+def main ():
+  try:
+    # obtain a system wide logger and initialize it to debug level to begin with
+    logging.info ("Main - acquire a child logger and then log messages in the child")
+    logger = logging.getLogger ("DiscoveryLoad")
+
+    # first parse the arguments
+    logger.debug ("Main: parse command line arguments")
+    args = parseCmdLineArgs ()
+
+    # reset the log level to as specified
+    logger.debug ("Main: resetting log level to {}".format (args.loglevel))
+    logger.setLevel (args.loglevel)
+    logger.debug ("Main: effective log level is {}".format (logger.getEffectiveLevel ()))
+
+    # Obtain the load test object
+    logger.debug ("Main: obtain the DiscoveryLoad object")
+    load_obj = DiscoveryLoad (logger)
+
+    # configure the object
+    logger.debug ("Main: configure the load test object")
+    load_obj.configure (args)
+
+    # now invoke the driver program
+    logger.debug ("Main: invoke the load test driver")
+    load_obj.driver ()
+
+  except Exception as e:
+    logger.error ("Exception caught in main - {}".format (e))
+    return
+
+
+###################################
+#
+# Main entry point
+#
+###################################
+if __name__ == "__main__":
+
+  # set underlying default logging capabilities
+  logging.basicConfig (level=logging.DEBUG,
+                       format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+
+  main ()
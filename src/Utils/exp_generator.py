@@ -24,12 +24,17 @@
 # scenario.
 
 import os
+import sys
 import random # random number generation
-import hashlib  # for the secure hash library
 import argparse # argument parsing
 import json # for JSON
 import logging # for logging. Use it in place of print statements.
 
+# the Chord package lives one level up
+sys.path.insert (0, os.path.join (os.path.dirname (os.path.abspath (__file__)), ".."))
+
+from Chord.hashgen import hashgen
+
 ##########################
 #
 # ExperimentGenerator class.
@@ -123,14 +128,8 @@ class ExperimentGenerator ():
   def hash_func (self, id):
     self.logger.debug ("ExperimentGenerator::hash_func")
 
-    # first get the digest from hashlib and then take the desired number of bytes from the
-    # lower end of the 256 bits hash. Big or little endian does not matter.
-    hash_digest = hashlib.sha256 (bytes (id, "utf-8")).digest ()  # this is how we get the digest or hash value
-    # figure out how many bytes to retrieve
-    num_bytes = int(self.bits_hash/8)  # otherwise we get float which we cannot use below
-    hash_val = int.from_bytes (hash_digest[:num_bytes], "big")  # take lower N number of bytes
-
-    return hash_val
+    # same hash function that the DHT nodes use at run time
+    return hashgen (self.bits_hash, id)
 
   #################
   # gen dictionary values
@@ -325,6 +324,7 @@ class ExperimentGenerator ():
     # first get an in-memory representation of our DHT DB, which is a
     # dictionary with key dht
     dht_db = {}  # empty dictionary
+    dht_db["bits"] = self.bits_hash  # so that the DHT nodes know the width of the hash space
     dht_db["dht"] = []
     for i in range (self.num_mn_nodes):
       host = "h" + str (i+1)
@@ -381,7 +381,7 @@ def parseCmdLineArgs ():
   
   # Now specify all the optional arguments we support
   #
-  parser.add_argument ("-b", "--bits_hash", type=int, choices=[8,16,24,32,40,48,56,64], default=48, help="Number of bits of hash value to test for collision: allowable values between 6 and 64 in increments of 8 bytes, default 48")
+  parser.add_argument ("-b", "--bits_hash", type=int, choices=range (1, 65), metavar="[1-64]", default=48, help="Number of bits of hash value to test for collision: any width between 1 and 64 (the ring messages carry 64 bit keys), default 48")
 
   parser.add_argument ("-D", "--num_disc_dht", type=int, default=20, help="Number of Discovery DHT instances, default 20")
 
@@ -0,0 +1,164 @@
+# Purpose:
+#
+# Summarize how the registry is spread over the discovery nodes of a Chord experiment.
+# Every DiscoveryAppln logs a line of the form
+#
+#    DiscoveryAppln::load_report - node=disc3 hash=123 pubs=2 subs=1 broker=0 topics=3 topic_entries=4
+#
+# whenever its share of the registry changes. We scan the *.out files of a results
+# directory (e.g., Experiments/ChordDHT/Direct/results), keep the last report of every
+# node and print a per-node table followed by the coefficient of variation (stddev/mean)
+# of the number of records stored per node. A CoV close to zero means the registrations
+# are evenly spread across the ring.
+
+import os
+import re
+import glob
+import math
+import argparse # argument parsing
+import logging # for logging. Use it in place of print statements.
+
+class LoadReport ():
+  # This is a class variable
+  pattern = re.compile (r"DiscoveryAppln::load_report - (.*)$")
+  fields = ["pubs", "subs", "broker", "topics", "topic_entries"]
+
+  #################
+  # constructor
+  #################
+  def __init__ (self, logger):
+    self.results_dir = None  # directory with the *.out files of an experiment
+    self.reports = {}  # node name -> last load report of that node
+    self.logger = logger
+
+  #################
+  # configuration
+  #################
+  def configure (self, args):
+    self.logger.debug ("LoadReport::configure")
+
+    self.results_dir = args.results_dir
+
+  #################
+  # parse one log file
+  #################
+  def parse_file (self, path):
+    report = None
+    with open (path, "r") as f:
+      for line in f:
+        match = LoadReport.pattern.search (line)
+        if match:
+          report = dict (kv.split ("=", 1) for kv in match.group (1).split ())
+
+    if report is not None:
+      self.reports[report["node"]] = report
+
+  #################
+  # coefficient of variation
+  #################
+  @staticmethod
+  def cov (values):
+    if not values:
+      return 0.0
+    mean = sum (values) / len (values)
+    if mean == 0:
+      return 0.0
+    var = sum ((v - mean) ** 2 for v in values) / len (values)
+    return math.sqrt (var) / mean
+
+  #################
+  # Driver program
+  #################
+  def driver (self):
+    self.logger.debug ("LoadReport::driver")
+
+    for path in sorted (glob.glob (os.path.join (self.results_dir, "*.out"))):
+      self.parse_file (path)
+
+    if not self.reports:
+      self.logger.info ("No load reports found in {}".format (self.results_dir))
+      return
+
+    self.logger.info ("{:<10} {:>20} {:>6} {:>6} {:>7} {:>7} {:>14} {:>8}".format (
+      "Node", "Hash", "pubs", "subs", "broker", "topics", "topic_entries", "records"))
+
+    records = []
+    for name in sorted (self.reports, key=lambda x: int (self.reports[x]["hash"])):
+      report = self.reports[name]
+      counts = [int (report[f]) for f in LoadReport.fields]
+      # records stored at the node: entity records plus one per (publisher, topic) entry
+      total = counts[0] + counts[1] + counts[2] + counts[4]
+      records.append (total)
+      self.logger.info ("{:<10} {:>20} {:>6} {:>6} {:>7} {:>7} {:>14} {:>8}".format (
+        name, report["hash"], *counts, total))
+
+    self.logger.info ("Nodes reporting: {}, records: {}, max/mean: {:.2f}, CoV: {:.3f}".format (
+      len (records), sum (records), max (records) / max (1e-9, sum (records) / len (records)),
+      LoadReport.cov (records)))
+
+###################################
+#
+# Parse command line arguments
+#
+###################################
+def parseCmdLineArgs ():
+  # instantiate a ArgumentParser object
+  parser = argparse.ArgumentParser (description="Per-node registry load of a Chord experiment")
+
+  parser.add_argument ("-d", "--results_dir", default="results", help="Directory with the *.out files of the discovery nodes, default results")
+
+  parser.add_argument ("-l", "--loglevel", type=int, default=logging.INFO, choices=[logging.DEBUG,logging.INFO,logging.WARNING,logging.ERROR,logging.CRITICAL], help="logging level, choices 10,20,30,40,50: default 20=logging.INFO")
+
+  return parser.parse_args()
+
+
+###################################
+#
+# Main program
+#
+###################################
+def main ():
+  try:
+    # obtain a system wide logger and initialize it to debug level to begin with
+    logging.info ("Main - acquire a child logger and then log messages in the child")
+    logger = logging.getLogger ("LoadReport")
+
+    # first parse the arguments
+    logger.debug ("Main: parse command line arguments")
+    args = parseCmdLineArgs ()
+
+    # reset the log level to as specified
+    logger.debug ("Main: resetting log level to {}".format (args.loglevel))
+    logger.setLevel (args.loglevel)
+    logger.debug ("Main: effective log level is {}".format (logger.getEffectiveLevel ()))
+
+    # Obtain the report object
+    logger.debug ("Main: obtain the LoadReport object")
+    report_obj = LoadReport (logger)
+
+    # configure the object
+    logger.debug ("Main: configure the report object")
+    report_obj.configure (args)
+
+    # now invoke the driver program
+    logger.debug ("Main: invoke the report driver")
+    report_obj.driver ()
+
+  except Exception as e:
+    logger.error ("Exception caught in main - {}".format (e))
+    return
+
+
+###################################
+#
+# Main entry point
+#
+###################################
+if __name__ == "__main__":
+
+  # set underlying default logging capabilities
+  logging.basicConfig (level=logging.DEBUG,
+                       format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+
+  main ()
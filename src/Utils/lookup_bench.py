@@ -0,0 +1,277 @@
+# Purpose:
+#
+# Microbenchmark for the Chord routing core. For each ring size we build a ring of
+# discovery nodes the same way exp_generator.py does (ids of the form disc3:10.0.0.5:5555
+# hashed to the configured number of bits), generate all finger tables and then time the
+# closest preceding finger lookup:
+#
+#    linear  - the original scan over all fingers comparing hash > self and hash < key
+#    bisect  - FingerTable.closest_preceding_node, modular distances + binary search, on a
+#              table that keeps one row per finger
+#    rows    - the same on the default compressed table that keeps one row per distinct
+#              successor; we also report the average number of rows it stores
+#
+# We also route random keys from random start nodes to their owners with both versions
+# and report the hop counts and how often the linear version ends up at the wrong owner
+# (which happens whenever the key interval wraps past zero).
+#
+# A ring can also be read from a dht json file (e.g., dht48.json) with the -j option.
+#
+# Last, two node rings at 63 and 64 bits check the widest tables: there a finger of the
+# node halfway round wraps back to the node itself.
+
+import os
+import sys
+import time
+import random # random number generation
+import bisect
+import argparse # argument parsing
+import logging # for logging. Use it in place of print statements.
+
+# the Chord package lives one level up
+sys.path.insert (0, os.path.join (os.path.dirname (os.path.abspath (__file__)), ".."))
+
+from Chord.constants import *
+from Chord.hashgen import hashgen
+from Chord.chordutils import ChordUtils
+from Chord.fingertablegen import FingerTableGen
+
+class LookupBenchmark ():
+
+  #################
+  # constructor
+  #################
+  def __init__ (self, logger):
+    self.ring_sizes = None  # list of ring sizes to benchmark
+    self.bits_hash = None  # number of bits in the hash
+    self.iters = None  # number of timed lookups per ring
+    self.num_routes = None  # number of routed lookups per ring for hop counts
+    self.json_file = None  # optional dht json file to benchmark as well
+    self.logger = logger
+
+  #################
+  # configuration
+  #################
+  def configure (self, args):
+    self.logger.debug ("LookupBenchmark::configure")
+
+    self.ring_sizes = [int (x) for x in args.ring_sizes.split (",")]
+    self.bits_hash = args.bits_hash
+    self.iters = args.iters
+    self.num_routes = args.num_routes
+    self.json_file = args.json_file
+
+  #################
+  # build a synthetic ring of the given size
+  #################
+  def gen_ring (self, num_nodes):
+    nodes = []
+    seen = set ()
+    i = 0
+    while len (nodes) < num_nodes:
+      i += 1
+      host = random.randint (1, 250)
+      port = 5555 + random.randint (0, 3)
+      hash_val = hashgen (self.bits_hash, "disc{}:10.0.0.{}:{}".format (i, host, port))
+      if hash_val in seen:
+        continue
+      seen.add (hash_val)
+      nodes.append ({ID: "disc" + str (i), HASH: hash_val, IP: "10.0.0." + str (host), PORT: port, HOST: "h" + str (host)})
+
+    return sorted (nodes, key=lambda x: x[HASH])
+
+  #################
+  # the original closest preceding node logic
+  #################
+  @staticmethod
+  def linear_closest_preceding (table, key):
+    succ_hashes = table.succ_hashes
+    node_hash = table.node[HASH]
+    for i in range (len (succ_hashes) - 1, -1, -1):
+      if node_hash < succ_hashes[i] < key:
+        return table.successor_node (i)
+    return table.node
+
+  #################
+  # the original find successor logic
+  #################
+  @staticmethod
+  def linear_next_hop (table, key):
+    node_hash = table.node[HASH]
+    if node_hash == key:
+      return table.node
+    successor = table.successor
+    if node_hash < key <= successor[HASH]:
+      return successor
+    return LookupBenchmark.linear_closest_preceding (table, key)
+
+  #################
+  # route a key from start node, return (owner, hops)
+  #################
+  @staticmethod
+  def route (tables, start, key, next_hop, max_hops=64):
+    node = start
+    for hops in range (max_hops):
+      nxt = next_hop (tables[node[ID]], key)
+      if nxt is node:
+        return node, hops
+      # the original code has no notion of owning a key other than matching it exactly,
+      # so we stop it once it hands the key to its successor
+      if next_hop is LookupBenchmark.linear_next_hop and nxt is tables[node[ID]].successor:
+        return nxt, hops + 1
+      node = nxt
+    return node, max_hops
+
+  #################
+  # benchmark one ring
+  #################
+  def bench_ring (self, name, nodes, bits):
+    tables = FingerTableGen.generate_all_finger_tables (nodes, bits, compressed=False)
+    compressed = FingerTableGen.generate_all_finger_tables (nodes, bits)
+    compressed_list = [compressed[n[ID]] for n in nodes]
+    hashes = [n[HASH] for n in nodes]
+    table_list = [tables[n[ID]] for n in nodes]
+    keys = [random.getrandbits (bits) for i in range (self.iters)]
+    picks = [random.randrange (len (table_list)) for i in range (self.iters)]
+    starts = [table_list[i] for i in picks]
+    compressed_starts = [compressed_list[i] for i in picks]
+
+    # time both closest preceding finger variants on identical inputs
+    linear = LookupBenchmark.linear_closest_preceding
+    t0 = time.perf_counter ()
+    for table, key in zip (starts, keys):
+      linear (table, key)
+    linear_ns = (time.perf_counter () - t0) * 1e9 / self.iters
+
+    t0 = time.perf_counter ()
+    for table, key in zip (starts, keys):
+      table.closest_preceding_node (key)
+    bisect_ns = (time.perf_counter () - t0) * 1e9 / self.iters
+
+    t0 = time.perf_counter ()
+    for table, key in zip (compressed_starts, keys):
+      table.closest_preceding_node (key)
+    rows_ns = (time.perf_counter () - t0) * 1e9 / self.iters
+    rows = sum (t.rows () for t in compressed_list) / len (compressed_list)
+
+    # now route keys to their owners with both versions
+    stats = {}
+    for label, next_hop in (("linear", LookupBenchmark.linear_next_hop), ("bisect", lambda t, k: t.next_hop (k))):
+      total_hops = 0
+      max_hops = 0
+      wrong = 0
+      for i in range (self.num_routes):
+        key = keys[i % len (keys)]
+        owner = nodes[bisect.bisect_left (hashes, key) % len (nodes)]
+        found, hops = LookupBenchmark.route (tables, starts[i % len (starts)].node, key, next_hop)
+        total_hops += hops
+        max_hops = max (max_hops, hops)
+        if found is not owner:
+          wrong += 1
+      stats[label] = (total_hops / self.num_routes, max_hops, 100.0 * wrong / self.num_routes)
+
+    self.logger.info ("{:<12} {:>7} {:>5} {:>12.1f} {:>12.1f} {:>10.1f} {:>6.1f} {:>10.2f} {:>6} {:>8.2f} {:>10.2f} {:>6} {:>8.2f}".format (
+      name, len (nodes), bits, linear_ns, bisect_ns, rows_ns, rows,
+      stats["linear"][0], stats["linear"][1], stats["linear"][2],
+      stats["bisect"][0], stats["bisect"][1], stats["bisect"][2]))
+
+  #################
+  # Driver program
+  #################
+  def driver (self):
+    self.logger.debug ("LookupBenchmark::driver")
+
+    random.seed (6381)
+
+    self.logger.info ("{:<12} {:>7} {:>5} {:>12} {:>12} {:>10} {:>6} {:>10} {:>6} {:>8} {:>10} {:>6} {:>8}".format (
+      "Ring", "Nodes", "bits", "linear ns", "bisect ns", "rows ns", "rows", "lin hops", "max", "wrong%", "bis hops", "max", "wrong%"))
+
+    if self.json_file:
+      dht_json = ChordUtils.load_json_data (self.json_file)
+      nodes = ChordUtils.to_sorted_dht_node_list (dht_json)
+      bits = ChordUtils.ring_bits (dht_json)
+      self.bench_ring (os.path.basename (self.json_file), nodes, bits)
+
+    for num_nodes in self.ring_sizes:
+      self.bench_ring ("synthetic", self.gen_ring (num_nodes), self.bits_hash)
+
+    # the fingers of the node at 2^(bits-1) beyond the other one wrap back to itself
+    for bits in (63, 64):
+      nodes = [{ID: "disc1", HASH: 5, IP: "10.0.0.1", PORT: 5555, HOST: "h1"},
+               {ID: "disc2", HASH: 1 << (bits - 1), IP: "10.0.0.2", PORT: 5555, HOST: "h2"}]
+      self.bench_ring ("wrap", nodes, bits)
+
+###################################
+#
+# Parse command line arguments
+#
+###################################
+def parseCmdLineArgs ():
+  # instantiate a ArgumentParser object
+  parser = argparse.ArgumentParser (description="Chord lookup microbenchmark")
+
+  parser.add_argument ("-N", "--ring_sizes", default="8,48,1000,10000", help="Comma separated ring sizes, default 8,48,1000,10000")
+
+  parser.add_argument ("-b", "--bits_hash", type=int, choices=[8,16,24,32,40,48,56,64], default=48, help="Number of bits of hash value, default 48")
+
+  parser.add_argument ("-i", "--iters", type=int, default=200000, help="Number of timed lookups per ring, default 200000")
+
+  parser.add_argument ("-r", "--num_routes", type=int, default=20000, help="Number of routed lookups per ring for hop counts, default 20000")
+
+  parser.add_argument ("-j", "--json_file", default=None, help="Also benchmark the ring in this dht json file, e.g., dht48.json")
+
+  parser.add_argument ("-l", "--loglevel", type=int, default=logging.INFO, choices=[logging.DEBUG,logging.INFO,logging.WARNING,logging.ERROR,logging.CRITICAL], help="logging level, choices 10,20,30,40,50: default 20=logging.INFO")
+
+  return parser.parse_args()
+
+
+###################################
+#
+# Main program
+#
+###################################
+def main ():
+  try:
+    # obtain a system wide logger and initialize it to debug level to begin with
+    logging.info ("Main - acquire a child logger and then log messages in the child")
+    logger = logging.getLogger ("LookupBenchmark")
+
+    # first parse the arguments
+    logger.debug ("Main: parse command line arguments")
+    args = parseCmdLineArgs ()
+
+    # reset the log level to as specified
+    logger.debug ("Main: resetting log level to {}".format (args.loglevel))
+    logger.setLevel (args.loglevel)
+    logger.debug ("Main: effective log level is {}".format (logger.getEffectiveLevel ()))
+
+    # Obtain the benchmark object
+    logger.debug ("Main: obtain the LookupBenchmark object")
+    bench_obj = LookupBenchmark (logger)
+
+    # configure the object
+    logger.debug ("Main: configure the benchmark object")
+    bench_obj.configure (args)
+
+    # now invoke the driver program
+    logger.debug ("Main: invoke the benchmark driver")
+    bench_obj.driver ()
+
+  except Exception as e:
+    logger.error ("Exception caught in main - {}".format (e))
+    return
+
+
+###################################
+#
+# Main entry point
+#
+###################################
+if __name__ == "__main__":
+
+  # set underlying default logging capabilities
+  logging.basicConfig (level=logging.DEBUG,
+                       format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+
+  main ()
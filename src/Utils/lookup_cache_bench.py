@@ -0,0 +1,239 @@
+# Purpose:
+#
+# Cost of answering a topic lookup in DiscoveryMW with and without the cache of serialized
+# lookup answers (LookupCache in the [Discovery] section of config.ini). We configure a
+# single discovery node on a local port, so that it owns every key, register the requested
+# number of publishers through DiscoveryAppln and then feed the same lookups straight into
+# DiscoveryMW.process_request, the way the event loop does once a request arrived. The
+# answers go out on the ROUTER to a client that is not connected and are dropped by ZMQ,
+# so what we time is parsing, the registry lookup, building and serializing the answer
+# (or the cache hit) and the send. Every lookup is repeated the given number of times
+# which is what the subscribers of a running system do.
+#
+# With the cache we also report the hits and misses, and check that the cached answers
+# list the same publishers as freshly built ones.
+
+import os
+import sys
+import time
+import random # random number generation
+import argparse # argument parsing
+import logging # for logging. Use it in place of print statements.
+
+# the application, middleware and Chord packages live one level up
+sys.path.insert (0, os.path.join (os.path.dirname (os.path.abspath (__file__)), ".."))
+
+from Chord.constants import *
+from Chord.hashgen import hashgen
+from Chord.chordutils import ChordUtils
+from Chord.fingertablegen import FingerTableGen
+from CS6381_MW import discovery_pb2
+from CS6381_MW.DiscoveryMW import DiscoveryMW
+from DiscoveryAppln import DiscoveryAppln
+
+class LookupCacheBenchmark ():
+
+  #################
+  # constructor
+  #################
+  def __init__ (self, logger):
+    self.num_pubs = None  # number of publishers
+    self.num_topics = None  # size of the topic universe
+    self.topics_per_pub = None  # topics published by each publisher
+    self.topics_per_lookup = None  # list of topic counts per lookup
+    self.num_lookups = None  # distinct lookups per configuration
+    self.repeat = None  # times every lookup is asked
+    self.port = None  # port of the discovery node
+    self.logger = logger
+
+  #################
+  # configuration
+  #################
+  def configure (self, args):
+    self.logger.debug ("LookupCacheBenchmark::configure")
+
+    self.num_pubs = args.num_pubs
+    self.num_topics = args.num_topics
+    self.topics_per_pub = args.topics_per_pub
+    self.topics_per_lookup = [int (x) for x in args.topics_per_lookup.split (",")]
+    self.num_lookups = args.num_lookups
+    self.repeat = args.repeat
+    self.port = args.port
+
+  #################
+  # a one node ring holding the whole registry
+  #################
+  def build_node (self, port, cache_size):
+    # the application and the middleware log every request at INFO level; keep them quiet
+    node_logger = logging.getLogger ("DiscoveryNode")
+    node_logger.setLevel (logging.WARNING)
+
+    bits = 48
+    dht_info = {ID: "disc1", HASH: hashgen (bits, "disc1:127.0.0.1:{}".format (port)), IP: "127.0.0.1", PORT: port}
+    ring = ChordUtils.expand_virtual_nodes ([dht_info], bits, 1)
+    finger_table = FingerTableGen.generate_virtual_finger_tables ("disc1", ring, bits)
+
+    appln = DiscoveryAppln (node_logger)
+    appln.name = "disc1"
+    appln.dissemination = "Direct"
+    appln.num_ft_entries = bits
+    appln.dht_info = dht_info
+    appln.pub_dict = {}
+    appln.sub_dict = {}
+    appln.topic_dict = {}
+    appln.topic_index = {}
+
+    mw = DiscoveryMW (node_logger)
+    args = argparse.Namespace (addr="127.0.0.1", port=port, join=None)
+    mw.configure (args, dht_info, bits, finger_table, stabilize_interval=0, cache_size=cache_size)
+    mw.set_upcall_handle (appln)
+    appln.mw_obj = mw
+
+    # registrations go through the middleware like those of real publishers
+    for i in range (self.num_pubs):
+      disc_req = discovery_pb2.DiscoveryReq ()
+      disc_req.msg_type = discovery_pb2.TYPE_REGISTER
+      reg_req = disc_req.register_req
+      reg_req.role = discovery_pb2.ROLE_PUBLISHER
+      reg_req.info.id = "pub{}".format (i)
+      reg_req.info.addr = "10.0.{}.{}".format (i // 250 % 250, i % 250 + 1)
+      reg_req.info.port = 5577
+      reg_req.topiclist.extend ("topic{}".format (t) for t in random.sample (range (self.num_topics), self.topics_per_pub))
+      mw.process_request ([b"pub", b"", disc_req.SerializeToString ()])
+    return mw, appln
+
+  #################
+  # time the lookups against one node
+  #################
+  def time_lookups (self, mw, requests):
+    t0 = time.perf_counter ()
+    for i in range (self.repeat):
+      for buf in requests:
+        mw.process_request ([b"sub", b"", buf])
+    return (time.perf_counter () - t0) * 1e6 / (self.repeat * len (requests))
+
+  #################
+  # Driver program
+  #################
+  def driver (self):
+    self.logger.debug ("LookupCacheBenchmark::driver")
+
+    random.seed (6381)
+    plain, plain_appln = self.build_node (self.port, 0)
+    random.seed (6381)
+    cached, cached_appln = self.build_node (self.port + 1, 4096)
+
+    self.logger.info ("{} publishers x {} topics of {}, every lookup asked {} times".format (
+      self.num_pubs, self.topics_per_pub, self.num_topics, self.repeat))
+    self.logger.info ("{:>7} {:>13} {:>13} {:>9} {:>8} {:>8} {:>10}".format (
+      "topics", "no cache us", "cache us", "speedup", "hits", "misses", "mismatch"))
+
+    try:
+      for count in self.topics_per_lookup:
+        lookups = []
+        for i in range (self.num_lookups):
+          disc_req = discovery_pb2.DiscoveryReq ()
+          disc_req.msg_type = discovery_pb2.TYPE_LOOKUP_PUB_BY_TOPIC
+          disc_req.lookup_req.topiclist.extend ("topic{}".format (t) for t in random.sample (range (self.num_topics), count))
+          lookups.append (disc_req)
+        requests = [disc_req.SerializeToString () for disc_req in lookups]
+
+        plain_us = self.time_lookups (plain, requests)
+        hits, misses = cached.cache_hits, cached.cache_misses
+        cached_us = self.time_lookups (cached, requests)
+        hits, misses = cached.cache_hits - hits, cached.cache_misses - misses
+
+        # the cached bytes must list what the registry lists now
+        mismatch = 0
+        for disc_req in lookups:
+          disc_resp = discovery_pb2.DiscoveryResp ()
+          disc_resp.ParseFromString (cached.lookup_cache[(disc_req.msg_type, tuple (sorted (set (disc_req.lookup_req.topiclist))))])
+          expected = set (p.id for p in plain_appln.lookup_pubs_topic_request (disc_req.lookup_req))
+          if set (p.id for p in disc_resp.lookup_resp.pubs) != expected:
+            mismatch += 1
+
+        self.logger.info ("{:>7} {:>13.1f} {:>13.1f} {:>8.1f}x {:>8} {:>8} {:>10}".format (
+          count, plain_us, cached_us, plain_us / cached_us, hits, misses, mismatch))
+    finally:
+      for mw in (plain, cached):
+        mw.router_socket.close (linger=0)
+        mw.context.term ()
+
+###################################
+#
+# Parse command line arguments
+#
+###################################
+def parseCmdLineArgs ():
+  # instantiate a ArgumentParser object
+  parser = argparse.ArgumentParser (description="Topic lookup cost with and without the lookup cache")
+
+  parser.add_argument ("-p", "--num_pubs", type=int, default=1000, help="Number of publishers, default 1000")
+
+  parser.add_argument ("-t", "--num_topics", type=int, default=100, help="Number of distinct topics, default 100")
+
+  parser.add_argument ("-k", "--topics_per_pub", type=int, default=3, help="Topics published by each publisher, default 3")
+
+  parser.add_argument ("-q", "--topics_per_lookup", default="1,3,10", help="Comma separated topics per lookup, default 1,3,10")
+
+  parser.add_argument ("-n", "--num_lookups", type=int, default=50, help="Distinct lookups per configuration, default 50")
+
+  parser.add_argument ("-r", "--repeat", type=int, default=20, help="Times every lookup is asked, default 20")
+
+  parser.add_argument ("-P", "--port", type=int, default=7401, help="Port of the discovery node without cache, the next one is used by the one with cache, default 7401")
+
+  parser.add_argument ("-l", "--loglevel", type=int, default=logging.INFO, choices=[logging.DEBUG,logging.INFO,logging.WARNING,logging.ERROR,logging.CRITICAL], help="logging level, choices 10,20,30,40,50: default 20=logging.INFO")
+
+  return parser.parse_args()
+
+
+###################################
+#
+# Main program
+#
+###################################
+def main ():
+  try:
+    # obtain a system wide logger and initialize it to debug level to begin with
+    logging.info ("Main - acquire a child logger and then log messages in the child")
+    logger = logging.getLogger ("LookupCacheBenchmark")
+
+    # first parse the arguments
+    logger.debug ("Main: parse command line arguments")
+    args = parseCmdLineArgs ()
+
+    # reset the log level to as specified
+    logger.debug ("Main: resetting log level to {}".format (args.loglevel))
+    logger.setLevel (args.loglevel)
+    logger.debug ("Main: effective log level is {}".format (logger.getEffectiveLevel ()))
+
+    # Obtain the benchmark object
+    logger.debug ("Main: obtain the LookupCacheBenchmark object")
+    bench_obj = LookupCacheBenchmark (logger)
+
+    # configure the object
+    logger.debug ("Main: configure the benchmark object")
+    bench_obj.configure (args)
+
+    # now invoke the driver program
+    logger.debug ("Main: invoke the benchmark driver")
+    bench_obj.driver ()
+
+  except Exception as e:
+    logger.error ("Exception caught in main - {}".format (e))
+    return
+
+
+###################################
+#
+# Main entry point
+#
+###################################
+if __name__ == "__main__":
+
+  # set underlying default logging capabilities
+  logging.basicConfig (level=logging.DEBUG,
+                       format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+
+  main ()
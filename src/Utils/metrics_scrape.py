@@ -0,0 +1,158 @@
+# Purpose:
+#
+# Fetch the metrics of running discovery nodes, publishers, subscribers and brokers. With
+# PortOffset > 0 in the [Metrics] section of config.ini every process answers any request
+# on a ZMQ REP socket at its port plus that offset with its counters, gauges and histograms
+# in the Prometheus text format, e.g.
+#
+#    python3 Utils/metrics_scrape.py -e tcp://10.0.0.1:6555,tcp://10.0.0.2:6577
+#
+# prints them once. With -o the answer of every endpoint goes to a <host>_<port>.prom file in
+# that directory instead, e.g., for the textfile collector of the Prometheus node exporter,
+# and with -i that is repeated every so many seconds.
+
+import os
+import time
+import argparse # argument parsing
+import logging # for logging. Use it in place of print statements.
+
+import zmq
+
+class MetricsScrape ():
+
+  #################
+  # constructor
+  #################
+  def __init__ (self, logger):
+    self.endpoints = None  # metrics endpoints of the processes
+    self.out_dir = None  # directory of the .prom files, None prints them
+    self.interval = None  # seconds between scrapes, 0 scrapes once
+    self.timeout = None  # milliseconds we wait for an endpoint
+    self.context = None
+    self.logger = logger
+
+  #################
+  # configuration
+  #################
+  def configure (self, args):
+    self.logger.debug ("MetricsScrape::configure")
+
+    self.endpoints = args.endpoints.split (",")
+    self.out_dir = args.out_dir
+    self.interval = args.interval
+    self.timeout = args.timeout
+    self.context = zmq.Context ()
+
+  #################
+  # the metrics of one endpoint, None if it did not answer in time
+  #################
+  def scrape (self, endpoint):
+    # a fresh REQ socket each time; one that got no answer cannot send again
+    socket = self.context.socket (zmq.REQ)
+    socket.setsockopt (zmq.LINGER, 0)
+    socket.connect (endpoint)
+    try:
+      socket.send (b"")
+      if not socket.poll (timeout=self.timeout):
+        return None
+      return socket.recv ().decode ()
+    finally:
+      socket.close ()
+
+  #################
+  # Driver program
+  #################
+  def driver (self):
+    self.logger.debug ("MetricsScrape::driver")
+
+    while True:
+      for endpoint in self.endpoints:
+        text = self.scrape (endpoint)
+        if text is None:
+          self.logger.warning ("No answer from {} within {} ms".format (endpoint, self.timeout))
+        elif self.out_dir is None:
+          print ("# {}\n{}".format (endpoint, text), end="")
+        else:
+          name = endpoint.split ("//", 1)[-1].replace (":", "_")
+          # written aside and renamed so that nobody reads half a file
+          path = os.path.join (self.out_dir, name + ".prom")
+          with open (path + ".tmp", "w") as f:
+            f.write (text)
+          os.replace (path + ".tmp", path)
+
+      if self.interval <= 0:
+        break
+      time.sleep (self.interval)
+
+###################################
+#
+# Parse command line arguments
+#
+###################################
+def parseCmdLineArgs ():
+  # instantiate a ArgumentParser object
+  parser = argparse.ArgumentParser (description="Fetch the metrics of running discovery, publisher, subscriber and broker processes")
+
+  parser.add_argument ("-e", "--endpoints", required=True, help="Comma separated metrics endpoints, e.g., tcp://10.0.0.1:6555")
+
+  parser.add_argument ("-o", "--out_dir", default=None, help="Directory to write a .prom file per endpoint to, default print them")
+
+  parser.add_argument ("-i", "--interval", type=float, default=0, help="Seconds between scrapes, default 0 scrapes once")
+
+  parser.add_argument ("-t", "--timeout", type=int, default=2000, help="Milliseconds to wait for an endpoint, default 2000")
+
+  parser.add_argument ("-l", "--loglevel", type=int, default=logging.INFO, choices=[logging.DEBUG,logging.INFO,logging.WARNING,logging.ERROR,logging.CRITICAL], help="logging level, choices 10,20,30,40,50: default 20=logging.INFO")
+
+  return parser.parse_args()
+
+
+###################################
+#
+# Main program
+#
+###################################
+def main ():
+  try:
+    # obtain a system wide logger and initialize it to debug level to begin with
+    logging.info ("Main - acquire a child logger and then log messages in the child")
+    logger = logging.getLogger ("MetricsScrape")
+
+    # first parse the arguments
+    logger.debug ("Main: parse command line arguments")
+    args = parseCmdLineArgs ()
+
+    # reset the log level to as specified
+    logger.debug ("Main: resetting log level to {}".format (args.loglevel))
+    logger.setLevel (args.loglevel)
+    logger.debug ("Main: effective log level is {}".format (logger.getEffectiveLevel ()))
+
+    # Obtain the scrape object
+    logger.debug ("Main: obtain the MetricsScrape object")
+    scrape_obj = MetricsScrape (logger)
+
+    # configure the object
+    logger.debug ("Main: configure the scrape object")
+    scrape_obj.configure (args)
+
+    # now invoke the driver program
+    logger.debug ("Main: invoke the scrape driver")
+    scrape_obj.driver ()
+
+  except Exception as e:
+    logger.error ("Exception caught in main - {}".format (e))
+    return
+
+
+###################################
+#
+# Main entry point
+#
+###################################
+if __name__ == "__main__":
+
+  # set underlying default logging capabilities
+  logging.basicConfig (level=logging.DEBUG,
+                       format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+
+  main ()
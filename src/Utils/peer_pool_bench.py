@@ -0,0 +1,270 @@
+# Purpose:
+#
+# Dealers and startup time of a discovery node by ring size. For every ring size we write a
+# ring of that many discovery instances (bits 48, VirtualNodes as given) and bring
+# up the first one in this process with DiscoveryAppln.configure, under PeerConnections as
+# given. The other instances are ROUTER sockets of a helper process that answer every
+# forwarded part with an empty answer, so that every dealer ends up with a real TCP
+# connection and goes idle once its answers are in.
+#
+#    eager   - what configure used to add: one DEALER per distinct finger, opened up front
+#    lazy    - configure as it is now, then the client lookups of random topics that we feed
+#              to the node, each forwarded to the owners of its topics over dealers
+#              opened on first use
+#
+# For both we report the file descriptors the process holds beyond the ones it had before
+# the node came up, as every ZMQ socket and connection takes at least one.
+
+import os
+import sys
+import time
+import json
+import random # random number generation
+import tempfile
+import argparse # argument parsing
+import configparser
+import multiprocessing
+import logging # for logging. Use it in place of print statements.
+
+import zmq
+
+# the application and middleware packages live one level up
+sys.path.insert (0, os.path.join (os.path.dirname (os.path.abspath (__file__)), ".."))
+
+from Chord.constants import *
+from Chord.hashgen import hashgen
+from CS6381_MW import discovery_pb2
+from DiscoveryAppln import DiscoveryAppln
+
+def open_fds ():
+  return len (os.listdir ("/proc/self/fd"))
+
+##################################
+# the other instances of the ring, runs in a helper process
+##################################
+def sink (ports, parent):
+  context = zmq.Context ()
+  context.set (zmq.MAX_SOCKETS, len (ports) + 16)
+  poller = zmq.Poller ()
+  for port in ports:
+    socket = context.socket (zmq.ROUTER)
+    socket.bind ("tcp://127.0.0.1:{}".format (port))
+    poller.register (socket, zmq.POLLIN)
+  while os.getppid () == parent:
+    for socket, event in poller.poll (timeout=1000):
+      rcv_parts = socket.recv_multipart ()
+      disc_req = discovery_pb2.DiscoveryReq.FromString (rcv_parts[-1])
+      if disc_req.req_id:
+        disc_resp = discovery_pb2.DiscoveryResp (msg_type=disc_req.msg_type, req_id=disc_req.req_id)
+        disc_resp.lookup_resp.SetInParent ()
+        socket.send_multipart (rcv_parts[:-1] + [disc_resp.SerializeToString ()])
+
+class PeerPoolBenchmark ():
+
+  #################
+  # constructor
+  #################
+  def __init__ (self, logger):
+    self.ring_sizes = None  # discovery instances per ring
+    self.peer_connections = None  # PeerConnections of the node under test
+    self.vnodes = None  # VirtualNodes of every instance
+    self.num_lookups = None  # client lookups fed to the node
+    self.base_port = None  # port of the first instance
+    self.logger = logger
+
+  #################
+  # configuration
+  #################
+  def configure (self, args):
+    self.logger.debug ("PeerPoolBenchmark::configure")
+
+    self.ring_sizes = [int (n) for n in args.ring_sizes.split (",")]
+    self.peer_connections = args.peer_connections
+    self.vnodes = args.vnodes
+    self.num_lookups = args.num_lookups
+    self.base_port = args.base_port
+
+  #################
+  # bring up the first instance of a ring of the given size
+  #################
+  def build_appln (self, workdir, size):
+    nodes = [{ID: "disc{}".format (i), HASH: hashgen (48, "disc{}:127.0.0.1:{}".format (i, self.base_port + i)),
+              IP: "127.0.0.1", PORT: self.base_port + i, HOST: "h{}".format (i)} for i in range (size)]
+    json_file = os.path.join (workdir, "ring-{}.json".format (size))
+    with open (json_file, "w") as f:
+      json.dump ({BITS: 48, DHT: nodes}, f)
+
+    # no ring maintenance, we only want to see what the lookups need
+    src_dir = os.path.join (os.path.dirname (os.path.abspath (__file__)), "..")
+    config = configparser.ConfigParser ()
+    config.optionxform = str
+    config.read (os.path.join (src_dir, "config.ini"))
+    config["Chord"]["StabilizeInterval"] = "0"
+    config["Chord"]["PeerConnections"] = str (self.peer_connections)
+    config["Chord"]["VirtualNodes"] = str (self.vnodes)
+    config["Discovery"]["Replicas"] = "0"
+    config["Discovery"]["DataDir"] = ""
+    config["Discovery"]["Workers"] = "0"
+    config_file = os.path.join (workdir, "config.ini")
+    with open (config_file, "w") as f:
+      config.write (f)
+
+    # the application logs every request at INFO level; keep it quiet
+    appln_logger = logging.getLogger ("DiscoveryAppln")
+    appln_logger.setLevel (logging.WARNING)
+    appln = DiscoveryAppln (appln_logger)
+    args = argparse.Namespace (name="disc0", addr="127.0.0.1", port=self.base_port, num_pubs=1, num_subs=1,
+                               config=config_file, json_file=json_file, asyncio=False, join=None)
+    start = time.perf_counter ()
+    appln.configure (args)
+    elapsed = time.perf_counter () - start
+    appln.mw_obj.set_upcall_handle (appln)
+    return appln, elapsed
+
+  #################
+  # feed the node client lookups of random topics, one at a time
+  #################
+  def lookups (self, appln):
+    mw = appln.mw_obj
+    rng = random.Random (6381)
+    for i in range (self.num_lookups):
+      disc_req = discovery_pb2.DiscoveryReq ()
+      disc_req.msg_type = discovery_pb2.TYPE_LOOKUP_PUB_BY_TOPIC
+      disc_req.lookup_req.topiclist.extend (["topic{}".format (rng.randrange (10 * self.num_lookups)) for t in range (3)])
+      mw.process_request ([b"client", b"", disc_req.SerializeToString ()])
+      # the answers of the other instances; ours goes to a client that is not there
+      while mw.pending:
+        for socket in dict (mw.poller.poll (timeout=1000)):
+          if socket in mw.dealer_sockets:
+            mw.handle_reply (socket)
+
+  #################
+  # one ring size
+  #################
+  def run_size (self, workdir, size):
+    ports = range (self.base_port + 1, self.base_port + size)
+    others = multiprocessing.Process (target=sink, args=(ports, os.getpid ()), daemon=True)
+    others.start ()
+    # give it time to bind
+    time.sleep (1 + size / 500)
+
+    before = open_fds ()
+    appln, startup = self.build_appln (workdir, size)
+    mw = appln.mw_obj
+    lazy_fds = open_fds () - before
+
+    # what configure used to do on top
+    start = time.perf_counter ()
+    eager = [mw.context.socket (zmq.DEALER) for node in appln.finger_table.unique_successors ()]
+    for dealer_socket, node in zip (eager, appln.finger_table.unique_successors ()):
+      dealer_socket.connect ("tcp://{}:{}".format (node[IP], node[PORT]))
+    eager_time = time.perf_counter () - start
+    eager_fds = open_fds () - before
+    for dealer_socket in eager:
+      dealer_socket.close (linger=0)
+
+    self.lookups (appln)
+    stats = mw.peer_stats ()
+    used_fds = open_fds () - before
+
+    for dealer_socket in list (mw.dealer_sockets):
+      dealer_socket.close (linger=0)
+    mw.router_socket.close (linger=0)
+    mw.context.term ()
+    others.terminate ()
+    others.join ()
+    return (len (appln.dht_ring), startup, len (eager), eager_time, eager_fds, lazy_fds,
+            stats["open"], stats["opened"], used_fds)
+
+  #################
+  # Driver program
+  #################
+  def driver (self):
+    self.logger.debug ("PeerPoolBenchmark::driver")
+
+    self.logger.info ("VirtualNodes {}, PeerConnections {}, {} client lookups of 3 random topics".format (
+      self.vnodes, self.peer_connections or "unlimited", self.num_lookups))
+    self.logger.info ("{:>6} {:>6} {:>10} | {:>7} {:>9} {:>5} | {:>5} {:>5} {:>7} {:>5}".format (
+      "nodes", "vnodes", "startup ms", "dealers", "eager ms", "fds", "fds", "open", "opened", "fds"))
+    self.logger.info ("{:>25} | {:^23} | {:^5} {:^19}".format ("", "eager", "idle", "after the lookups"))
+    with tempfile.TemporaryDirectory () as workdir:
+      for size in self.ring_sizes:
+        vnodes, startup, dealers, eager_time, eager_fds, lazy_fds, open_dealers, opened, used_fds = \
+          self.run_size (workdir, size)
+        self.logger.info ("{:>6} {:>6} {:>10.1f} | {:>7} {:>9.2f} {:>5} | {:>5} {:>5} {:>7} {:>5}".format (
+          size, vnodes, 1000 * startup, dealers, 1000 * eager_time, eager_fds, lazy_fds, open_dealers, opened, used_fds))
+
+###################################
+#
+# Parse command line arguments
+#
+###################################
+def parseCmdLineArgs ():
+  # instantiate a ArgumentParser object
+  parser = argparse.ArgumentParser (description="Dealers and startup time of a discovery node by ring size")
+
+  parser.add_argument ("-r", "--ring_sizes", default="16,64,256,1024", help="Comma separated numbers of discovery instances, default 16,64,256,1024")
+
+  parser.add_argument ("-k", "--peer_connections", type=int, default=64, help="PeerConnections of the node under test, 0 for no limit, default 64")
+
+  parser.add_argument ("-v", "--vnodes", type=int, default=1, help="VirtualNodes of every discovery instance, default 1")
+
+  parser.add_argument ("-n", "--num_lookups", type=int, default=2000, help="Client lookups fed to the node, default 2000")
+
+  parser.add_argument ("-b", "--base_port", type=int, default=7401, help="Port of the first discovery instance, default 7401")
+
+  parser.add_argument ("-l", "--loglevel", type=int, default=logging.INFO, choices=[logging.DEBUG,logging.INFO,logging.WARNING,logging.ERROR,logging.CRITICAL], help="logging level, choices 10,20,30,40,50: default 20=logging.INFO")
+
+  return parser.parse_args()
+
+
+###################################
+#
+# Main program
+#
+###################################
+def main ():
+  try:
+    # obtain a system wide logger and initialize it to debug level to begin with
+    logging.info ("Main - acquire a child logger and then log messages in the child")
+    logger = logging.getLogger ("PeerPoolBenchmark")
+
+    # first parse the arguments
+    logger.debug ("Main: parse command line arguments")
+    args = parseCmdLineArgs ()
+
+    # reset the log level to as specified
+    logger.debug ("Main: resetting log level to {}".format (args.loglevel))
+    logger.setLevel (args.loglevel)
+    logger.debug ("Main: effective log level is {}".format (logger.getEffectiveLevel ()))
+
+    # Obtain the benchmark object
+    logger.debug ("Main: obtain the PeerPoolBenchmark object")
+    bench_obj = PeerPoolBenchmark (logger)
+
+    # configure the object
+    logger.debug ("Main: configure the benchmark object")
+    bench_obj.configure (args)
+
+    # now invoke the driver program
+    logger.debug ("Main: invoke the benchmark driver")
+    bench_obj.driver ()
+
+  except Exception as e:
+    logger.error ("Exception caught in main - {}".format (e))
+    return
+
+
+###################################
+#
+# Main entry point
+#
+###################################
+if __name__ == "__main__":
+
+  # set underlying default logging capabilities
+  logging.basicConfig (level=logging.DEBUG,
+                       format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+
+  main ()
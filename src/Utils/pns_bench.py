@@ -0,0 +1,200 @@
+# Purpose:
+#
+# End-to-end lookup latency with and without proximity neighbor selection (PNS).
+# With PNS every finger but the successor points at the node of its interval
+# [n + 2^i, n + 2^(i+1)) with the lowest link delay instead of at the strict successor
+# of n + 2^i. We run the same random lookups through the Chord.chordring simulator on
+# both kinds of finger tables and report hops and the modeled latency.
+#
+# Two delay models are used:
+#
+#    flat    - the simulator defaults: a fixed delay between nodes on the same host and a
+#              larger fixed delay between hosts (what Mininet gives us out of the box)
+#    spread  - hosts are scattered over a plane and the delay between two hosts grows with
+#              their distance, like a wide area deployment
+#
+# The rings are dht48.json (several discovery nodes share a host, e.g., h8 runs four) and
+# synthetic rings of the requested sizes with several nodes per host.
+
+import os
+import sys
+import math
+import random # random number generation
+import argparse # argument parsing
+import logging # for logging. Use it in place of print statements.
+
+# the Chord package lives one level up
+sys.path.insert (0, os.path.join (os.path.dirname (os.path.abspath (__file__)), ".."))
+
+from Chord.constants import *
+from Chord.hashgen import hashgen
+from Chord.chordutils import ChordUtils
+from Chord.chordring import ChordRing
+
+class ProximityBenchmark ():
+
+  #################
+  # constructor
+  #################
+  def __init__ (self, logger):
+    self.json_file = None  # dht json file to benchmark
+    self.ring_sizes = None  # list of synthetic ring sizes
+    self.nodes_per_host = None  # discovery nodes per host in the synthetic rings
+    self.bits_hash = None  # number of bits in the hash
+    self.num_lookups = None  # number of lookups per configuration
+    self.logger = logger
+
+  #################
+  # configuration
+  #################
+  def configure (self, args):
+    self.logger.debug ("ProximityBenchmark::configure")
+
+    self.json_file = args.json_file
+    self.ring_sizes = [int (x) for x in args.ring_sizes.split (",")] if args.ring_sizes else []
+    self.nodes_per_host = args.nodes_per_host
+    self.bits_hash = args.bits_hash
+    self.num_lookups = args.num_lookups
+
+  #################
+  # build a synthetic ring
+  #################
+  def gen_ring (self, num_nodes):
+    num_hosts = max (1, num_nodes // self.nodes_per_host)
+    nodes = []
+    for i in range (num_nodes):
+      host = random.randint (1, num_hosts)
+      port = 5555 + i % 16
+      nodes.append ({ID: "disc" + str (i + 1), HASH: hashgen (self.bits_hash, "disc{}:10.0.0.{}:{}".format (i + 1, host, port)),
+                     IP: "10.0.0." + str (host), PORT: port, HOST: "h" + str (host)})
+    return nodes
+
+  #################
+  # delays between hosts scattered over a plane
+  #################
+  @staticmethod
+  def spread_delays (nodes):
+    hosts = sorted (set (n[HOST] for n in nodes))
+    coords = {h: (random.random (), random.random ()) for h in hosts}
+    delays = {}
+    for a in hosts:
+      delays[a] = {}
+      for b in hosts:
+        # 0.05 ms on the same host, up to about 20 ms across the plane
+        delays[a][b] = 0.05 if a == b else 0.5 + 14.0 * math.dist (coords[a], coords[b])
+    return delays
+
+  #################
+  # run one configuration
+  #################
+  def run (self, name, nodes, bits, model, link_delays):
+    row = [name, len (nodes), model]
+    results = []
+    for proximity in (False, True):
+      ring = ChordRing (nodes, bits, link_delays=link_delays, proximity=proximity)
+      res = ring.simulate (self.num_lookups, seed=6381)
+      latencies = sorted (res["latencies"])
+      mean_hops = sum (h * c for h, c in res["hop_counts"].items ()) / self.num_lookups
+      results.append ((mean_hops, sum (latencies) / len (latencies), latencies[int (len (latencies) * 0.99)], res["misrouted"]))
+
+    base, pns = results
+    self.logger.info ("{:<12} {:>6} {:>7} {:>8.2f} {:>8.2f} {:>10.3f} {:>10.3f} {:>9.1f} {:>10.3f} {:>10.3f} {:>9}".format (
+      *row, base[0], pns[0], base[1], pns[1], 100.0 * (base[1] - pns[1]) / base[1], base[2], pns[2], base[3] + pns[3]))
+
+  #################
+  # Driver program
+  #################
+  def driver (self):
+    self.logger.debug ("ProximityBenchmark::driver")
+
+    random.seed (6381)
+    self.logger.info ("{:<12} {:>6} {:>7} {:>8} {:>8} {:>10} {:>10} {:>9} {:>10} {:>10} {:>9}".format (
+      "Ring", "Nodes", "Delays", "hops", "PNS hops", "mean ms", "PNS mean", "gain %", "p99 ms", "PNS p99", "misrouted"))
+
+    rings = []
+    if self.json_file:
+      dht_json = ChordUtils.load_json_data (self.json_file)
+      nodes = ChordUtils.to_sorted_dht_node_list (dht_json)
+      bits = ChordUtils.ring_bits (dht_json)
+      rings.append ((os.path.basename (self.json_file), nodes, bits))
+    for num_nodes in self.ring_sizes:
+      rings.append (("synthetic", self.gen_ring (num_nodes), self.bits_hash))
+
+    for name, nodes, bits in rings:
+      self.run (name, nodes, bits, "flat", None)
+      self.run (name, nodes, bits, "spread", ProximityBenchmark.spread_delays (nodes))
+
+###################################
+#
+# Parse command line arguments
+#
+###################################
+def parseCmdLineArgs ():
+  # instantiate a ArgumentParser object
+  parser = argparse.ArgumentParser (description="Lookup latency with proximity neighbor selection")
+
+  parser.add_argument ("-j", "--json_file", default=os.path.join (os.path.dirname (os.path.abspath (__file__)), "dht48.json"), help="JSON file with the database of all DHT nodes, default dht48.json")
+
+  parser.add_argument ("-N", "--ring_sizes", default="200,1000", help="Comma separated sizes of synthetic rings, default 200,1000")
+
+  parser.add_argument ("-H", "--nodes_per_host", type=int, default=4, help="Discovery nodes per host in the synthetic rings, default 4")
+
+  parser.add_argument ("-b", "--bits_hash", type=int, choices=[8,16,24,32,40,48,56,64], default=48, help="Number of bits of hash value, default 48")
+
+  parser.add_argument ("-n", "--num_lookups", type=int, default=50000, help="Number of lookups per configuration, default 50000")
+
+  parser.add_argument ("-l", "--loglevel", type=int, default=logging.INFO, choices=[logging.DEBUG,logging.INFO,logging.WARNING,logging.ERROR,logging.CRITICAL], help="logging level, choices 10,20,30,40,50: default 20=logging.INFO")
+
+  return parser.parse_args()
+
+
+###################################
+#
+# Main program
+#
+###################################
+def main ():
+  try:
+    # obtain a system wide logger and initialize it to debug level to begin with
+    logging.info ("Main - acquire a child logger and then log messages in the child")
+    logger = logging.getLogger ("ProximityBenchmark")
+
+    # first parse the arguments
+    logger.debug ("Main: parse command line arguments")
+    args = parseCmdLineArgs ()
+
+    # reset the log level to as specified
+    logger.debug ("Main: resetting log level to {}".format (args.loglevel))
+    logger.setLevel (args.loglevel)
+    logger.debug ("Main: effective log level is {}".format (logger.getEffectiveLevel ()))
+
+    # Obtain the benchmark object
+    logger.debug ("Main: obtain the ProximityBenchmark object")
+    bench_obj = ProximityBenchmark (logger)
+
+    # configure the object
+    logger.debug ("Main: configure the benchmark object")
+    bench_obj.configure (args)
+
+    # now invoke the driver program
+    logger.debug ("Main: invoke the benchmark driver")
+    bench_obj.driver ()
+
+  except Exception as e:
+    logger.error ("Exception caught in main - {}".format (e))
+    return
+
+
+###################################
+#
+# Main entry point
+#
+###################################
+if __name__ == "__main__":
+
+  # set underlying default logging capabilities
+  logging.basicConfig (level=logging.DEBUG,
+                       format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+
+  main ()
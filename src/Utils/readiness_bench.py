@@ -0,0 +1,228 @@
+# Purpose:
+#
+# Time to first publication: how long after the last publisher or subscriber was started
+# does the first publication reach a subscriber? Publishers and subscribers only start
+# disseminating and looking up publishers once the discovery service says it is ready,
+# i.e., once the expected number of publishers and subscribers registered, so this is
+# mostly the time it takes the service to tell them.
+#
+# For every run we start one discovery node (a one node ring) on this machine, then the
+# subscribers and publishers one after the other, a stagger interval apart, so that the
+# early ones find the service not ready yet. The subscribers log at DEBUG level, which
+# includes the publication timestamp of every message they consume; the first one
+# of all subscribers minus the start of the last process is the time to first publication.
+#
+# The script can run the processes of another checkout (-s), e.g., to compare against a
+# version before a change.
+
+import os
+import sys
+import time
+import json
+import tempfile
+import statistics
+import subprocess
+import argparse # argument parsing
+import logging # for logging. Use it in place of print statements.
+
+# the Chord package lives one level up
+sys.path.insert (0, os.path.join (os.path.dirname (os.path.abspath (__file__)), ".."))
+
+from Chord.constants import *
+from Chord.hashgen import hashgen
+
+class ReadinessBenchmark ():
+
+  #################
+  # constructor
+  #################
+  def __init__ (self, logger):
+    self.src_dir = None  # directory with the DiscoveryAppln, PublisherAppln, ... to run
+    self.num_pubs = None  # publishers per run
+    self.num_subs = None  # subscribers per run
+    self.stagger = None  # seconds between starting two processes
+    self.num_runs = None  # runs to take the statistics over
+    self.max_wait = None  # seconds to wait for the first publication
+    self.port = None  # port of the discovery node
+    self.logger = logger
+
+  #################
+  # configuration
+  #################
+  def configure (self, args):
+    self.logger.debug ("ReadinessBenchmark::configure")
+
+    self.src_dir = os.path.abspath (args.src_dir)
+    self.num_pubs = args.num_pubs
+    self.num_subs = args.num_subs
+    self.stagger = args.stagger
+    self.num_runs = args.num_runs
+    self.max_wait = args.max_wait
+    self.port = args.port
+
+  #################
+  # first publication consumed by any subscriber, None if there is none yet
+  #################
+  @staticmethod
+  def first_publication (out_files):
+    first = None
+    for out_file in out_files:
+      with open (out_file) as f:
+        for line in f:
+          if "SubscriberMW::consume - pub time" in line:
+            pub_time = float (line.rsplit (" ", 1)[1])
+            first = pub_time if first is None else min (first, pub_time)
+            break
+    return first
+
+  #################
+  # one run
+  #################
+  def run (self, workdir):
+    # the subscribers write their results/<name>.csv relative to where they run
+    os.makedirs (os.path.join (workdir, "results"), exist_ok=True)
+    json_file = os.path.join (workdir, "ring.json")
+    with open (json_file, "w") as f:
+      json.dump ({BITS: 48, DHT: [{ID: "disc1", HASH: hashgen (48, "disc1:127.0.0.1:{}".format (self.port)),
+                                   IP: "127.0.0.1", PORT: self.port, HOST: "h1"}]}, f)
+    config_file = os.path.join (self.src_dir, "config.ini")
+    discovery = "127.0.0.1:{}".format (self.port)
+
+    cmds = [["SubscriberAppln.py", "-n", "sub{}".format (i + 1), "-T", "9", "-l", "10"] for i in range (self.num_subs)]
+    cmds += [["PublisherAppln.py", "-n", "pub{}".format (i + 1), "-p", str (self.port + 1 + i), "-T", "9", "-f", "20", "-l", "20"]
+             for i in range (self.num_pubs)]
+
+    procs = []
+    sub_outs = []
+    try:
+      disc_cmd = [sys.executable, os.path.join (self.src_dir, "DiscoveryAppln.py"), "-n", "disc1", "-a", "127.0.0.1",
+                  "-p", str (self.port), "-P", str (self.num_pubs), "-S", str (self.num_subs), "-j", json_file,
+                  "-c", config_file, "-l", "30"]
+      procs.append (subprocess.Popen (disc_cmd, stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT, cwd=workdir))
+      time.sleep (1)
+
+      last_start = None
+      for cmd in cmds:
+        out_file = os.path.join (workdir, "{}.out".format (cmd[2]))
+        if cmd[0].startswith ("Subscriber"):
+          sub_outs.append (out_file)
+        full_cmd = [sys.executable, os.path.join (self.src_dir, cmd[0])] + cmd[1:] + \
+                   ["-a", "127.0.0.1", "-d", discovery, "-c", config_file, "-j", json_file]
+        with open (out_file, "w") as out:
+          procs.append (subprocess.Popen (full_cmd, stdout=out, stderr=subprocess.STDOUT, cwd=workdir))
+        last_start = time.time ()
+        time.sleep (self.stagger)
+
+      deadline = last_start + self.max_wait
+      while time.time () < deadline:
+        first = ReadinessBenchmark.first_publication (sub_outs)
+        if first is not None:
+          return first - last_start
+        time.sleep (0.1)
+      return None
+    finally:
+      for proc in procs:
+        proc.kill ()
+      for proc in procs:
+        proc.wait ()
+
+  #################
+  # Driver program
+  #################
+  def driver (self):
+    self.logger.debug ("ReadinessBenchmark::driver")
+
+    self.logger.info ("{} publishers and {} subscribers started {} s apart, processes of {}".format (
+      self.num_pubs, self.num_subs, self.stagger, self.src_dir))
+    results = []
+    for i in range (self.num_runs):
+      with tempfile.TemporaryDirectory () as workdir:
+        ttfp = self.run (workdir)
+      if ttfp is None:
+        self.logger.info ("run {}: no publication within {} s".format (i + 1, self.max_wait))
+      else:
+        self.logger.info ("run {}: first publication {:.3f} s after the last process started".format (i + 1, ttfp))
+        results.append (ttfp)
+
+    if results:
+      self.logger.info ("time to first publication: median {:.3f} s, min {:.3f} s, max {:.3f} s over {} runs".format (
+        statistics.median (results), min (results), max (results), len (results)))
+
+###################################
+#
+# Parse command line arguments
+#
+###################################
+def parseCmdLineArgs ():
+  # instantiate a ArgumentParser object
+  parser = argparse.ArgumentParser (description="Time from start-up to the first publication")
+
+  parser.add_argument ("-s", "--src_dir", default=os.path.join (os.path.dirname (os.path.abspath (__file__)), ".."), help="Directory with the applications to run, default the src directory of this checkout")
+
+  parser.add_argument ("-P", "--num_pubs", type=int, choices=range(1, 10), default=2, help="Publishers, default 2")
+
+  parser.add_argument ("-S", "--num_subs", type=int, choices=range(1, 10), default=2, help="Subscribers, default 2")
+
+  parser.add_argument ("-g", "--stagger", type=float, default=0.5, help="Seconds between starting two processes, default 0.5")
+
+  parser.add_argument ("-r", "--num_runs", type=int, default=5, help="Number of runs, default 5")
+
+  parser.add_argument ("-w", "--max_wait", type=float, default=60, help="Seconds to wait for the first publication, default 60")
+
+  parser.add_argument ("-p", "--port", type=int, default=7501, help="Port of the discovery node, the publishers use the ones after it, default 7501")
+
+  parser.add_argument ("-l", "--loglevel", type=int, default=logging.INFO, choices=[logging.DEBUG,logging.INFO,logging.WARNING,logging.ERROR,logging.CRITICAL], help="logging level, choices 10,20,30,40,50: default 20=logging.INFO")
+
+  return parser.parse_args()
+
+
+###################################
+#
+# Main program
+#
+###################################
+def main ():
+  try:
+    # obtain a system wide logger and initialize it to debug level to begin with
+    logging.info ("Main - acquire a child logger and then log messages in the child")
+    logger = logging.getLogger ("ReadinessBenchmark")
+
+    # first parse the arguments
+    logger.debug ("Main: parse command line arguments")
+    args = parseCmdLineArgs ()
+
+    # reset the log level to as specified
+    logger.debug ("Main: resetting log level to {}".format (args.loglevel))
+    logger.setLevel (args.loglevel)
+    logger.debug ("Main: effective log level is {}".format (logger.getEffectiveLevel ()))
+
+    # Obtain the benchmark object
+    logger.debug ("Main: obtain the ReadinessBenchmark object")
+    bench_obj = ReadinessBenchmark (logger)
+
+    # configure the object
+    logger.debug ("Main: configure the benchmark object")
+    bench_obj.configure (args)
+
+    # now invoke the driver program
+    logger.debug ("Main: invoke the benchmark driver")
+    bench_obj.driver ()
+
+  except Exception as e:
+    logger.error ("Exception caught in main - {}".format (e))
+    return
+
+
+###################################
+#
+# Main entry point
+#
+###################################
+if __name__ == "__main__":
+
+  # set underlying default logging capabilities
+  logging.basicConfig (level=logging.DEBUG,
+                       format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+
+  main ()
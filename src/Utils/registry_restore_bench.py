@@ -0,0 +1,205 @@
+# Purpose:
+#
+# Restart time of a discovery node with a durable registry. We register the requested
+# number of publishers with a DiscoveryAppln that logs to a temporary data directory,
+# each publisher with its entity record and a few topic entries (as if this node owned
+# every key), and then time how long a fresh DiscoveryAppln takes to come back with
+#
+#    log       - only the write-ahead log, every registration replayed
+#    snapshot  - a snapshot of the whole registry, loaded straight into the dictionaries
+#
+# Both must come back with the same publishers and topic entries; mismatches are reported.
+
+import os
+import sys
+import time
+import random # random number generation
+import tempfile
+import argparse # argument parsing
+import logging # for logging. Use it in place of print statements.
+
+# the application and middleware packages live one level up
+sys.path.insert (0, os.path.join (os.path.dirname (os.path.abspath (__file__)), ".."))
+
+from CS6381_MW import discovery_pb2
+from CS6381_MW.RegistryStore import RegistryStore
+from DiscoveryAppln import DiscoveryAppln
+
+class RegistryRestoreBenchmark ():
+
+  #################
+  # constructor
+  #################
+  def __init__ (self, logger):
+    self.num_pubs = None  # number of publishers
+    self.num_topics = None  # size of the topic universe
+    self.topics_per_pub = None  # topics published by each publisher
+    self.logger = logger
+
+  #################
+  # configuration
+  #################
+  def configure (self, args):
+    self.logger.debug ("RegistryRestoreBenchmark::configure")
+
+    self.num_pubs = args.num_pubs
+    self.num_topics = args.num_topics
+    self.topics_per_pub = args.topics_per_pub
+
+  #################
+  # a discovery application with a store in data_dir
+  #################
+  def build_appln (self, data_dir, snapshot_every):
+    # the application logs every registration at INFO level; keep it quiet
+    appln_logger = logging.getLogger ("DiscoveryAppln")
+    appln_logger.setLevel (logging.WARNING)
+    appln = DiscoveryAppln (appln_logger)
+    appln.name = "disc1"
+    appln.dissemination = "Direct"
+    appln.pub_dict = {}
+    appln.sub_dict = {}
+    appln.topic_dict = {}
+    appln.topic_index = {}
+    appln.store = RegistryStore (appln_logger, data_dir, appln.name, snapshot_every)
+    return appln
+
+  #################
+  # register the publishers, logging every registration
+  #################
+  def fill (self, appln):
+    for i in range (self.num_pubs):
+      reg_req = discovery_pb2.RegisterReq ()
+      reg_req.role = discovery_pb2.ROLE_PUBLISHER
+      reg_req.info.id = "pub{}".format (i)
+      reg_req.info.addr = "10.0.{}.{}".format (i // 250 % 250, i % 250 + 1)
+      reg_req.info.port = 5577
+      appln.register_request (reg_req, discovery_pb2.KEY_ENTITY)
+
+      topic_req = discovery_pb2.RegisterReq ()
+      topic_req.role = discovery_pb2.ROLE_PUBLISHER
+      topic_req.info.CopyFrom (reg_req.info)
+      topic_req.topiclist.extend ("topic{}".format (t) for t in random.sample (range (self.num_topics), self.topics_per_pub))
+      appln.register_request (topic_req, discovery_pb2.KEY_TOPIC)
+
+  #################
+  # time the restart of a fresh application from data_dir
+  #################
+  def restart (self, data_dir):
+    appln = self.build_appln (data_dir, 1 << 62)
+    t0 = time.perf_counter ()
+    appln.restore ()
+    elapsed = time.perf_counter () - t0
+    appln.store.close ()
+    return appln, elapsed
+
+  #################
+  # Driver program
+  #################
+  def driver (self):
+    self.logger.debug ("RegistryRestoreBenchmark::driver")
+
+    random.seed (6381)
+    with tempfile.TemporaryDirectory () as log_dir, tempfile.TemporaryDirectory () as snapshot_dir:
+      # the same registrations, once left in the log and once compacted into a snapshot
+      t0 = time.perf_counter ()
+      appln = self.build_appln (log_dir, 1 << 62)
+      appln.store.load ()
+      self.fill (appln)
+      appln.store.close ()
+      self.logger.info ("{} publishers x {} topics of {}: registered and logged in {:.2f} s".format (
+        self.num_pubs, self.topics_per_pub, self.num_topics, time.perf_counter () - t0))
+
+      random.seed (6381)
+      appln = self.build_appln (snapshot_dir, 2 * self.num_pubs)
+      appln.store.load ()
+      self.fill (appln)
+      appln.store.close ()
+
+      # a restarted process holds nothing but the registry, so we keep no more than the
+      # keys of the first restart around while timing the second
+      appln = None
+      self.logger.info ("{:>9} {:>12} {:>10} {:>10}".format ("from", "MB on disk", "restart s", "mismatch"))
+      reference = None
+      for name, data_dir in (("log", log_dir), ("snapshot", snapshot_dir)):
+        size = sum (os.path.getsize (os.path.join (data_dir, f)) for f in os.listdir (data_dir))
+        appln, elapsed = self.restart (data_dir)
+        restored = (set (appln.pub_dict), appln.topic_index)
+        appln = None
+        mismatch = 0
+        if reference is None:
+          reference = restored
+        else:
+          mismatch = len (reference[0] ^ restored[0])
+          mismatch += sum (1 for topic, pubs in reference[1].items () if restored[1].get (topic) != pubs)
+        self.logger.info ("{:>9} {:>12.1f} {:>10.3f} {:>10}".format (name, size / 1e6, elapsed, mismatch))
+
+###################################
+#
+# Parse command line arguments
+#
+###################################
+def parseCmdLineArgs ():
+  # instantiate a ArgumentParser object
+  parser = argparse.ArgumentParser (description="Restart time of a discovery node from its registry log or snapshot")
+
+  parser.add_argument ("-p", "--num_pubs", type=int, default=500000, help="Number of publishers, each stored as an entity record and a topic entry, default 500000")
+
+  parser.add_argument ("-t", "--num_topics", type=int, default=1000, help="Number of distinct topics, default 1000")
+
+  parser.add_argument ("-k", "--topics_per_pub", type=int, default=2, help="Topics published by each publisher, default 2")
+
+  parser.add_argument ("-l", "--loglevel", type=int, default=logging.INFO, choices=[logging.DEBUG,logging.INFO,logging.WARNING,logging.ERROR,logging.CRITICAL], help="logging level, choices 10,20,30,40,50: default 20=logging.INFO")
+
+  return parser.parse_args()
+
+
+###################################
+#
+# Main program
+#
+###################################
+def main ():
+  try:
+    # obtain a system wide logger and initialize it to debug level to begin with
+    logging.info ("Main - acquire a child logger and then log messages in the child")
+    logger = logging.getLogger ("RegistryRestoreBenchmark")
+
+    # first parse the arguments
+    logger.debug ("Main: parse command line arguments")
+    args = parseCmdLineArgs ()
+
+    # reset the log level to as specified
+    logger.debug ("Main: resetting log level to {}".format (args.loglevel))
+    logger.setLevel (args.loglevel)
+    logger.debug ("Main: effective log level is {}".format (logger.getEffectiveLevel ()))
+
+    # Obtain the benchmark object
+    logger.debug ("Main: obtain the RegistryRestoreBenchmark object")
+    bench_obj = RegistryRestoreBenchmark (logger)
+
+    # configure the object
+    logger.debug ("Main: configure the benchmark object")
+    bench_obj.configure (args)
+
+    # now invoke the driver program
+    logger.debug ("Main: invoke the benchmark driver")
+    bench_obj.driver ()
+
+  except Exception as e:
+    logger.error ("Exception caught in main - {}".format (e))
+    return
+
+
+###################################
+#
+# Main entry point
+#
+###################################
+if __name__ == "__main__":
+
+  # set underlying default logging capabilities
+  logging.basicConfig (level=logging.DEBUG,
+                       format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+
+  main ()
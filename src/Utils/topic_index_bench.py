@@ -0,0 +1,195 @@
+# Purpose:
+#
+# Latency of DiscoveryAppln.lookup_pubs_topic_request on a large registry. We register
+# the requested number of publishers, each with a few topics drawn from the topic
+# universe, as topic entries of a DiscoveryAppln (as if this node owned every topic key)
+# and then time random lookups of one and of several topics with
+#
+#    scan   - the original lookup: every publisher entry is visited, formatted for a
+#             debug log line and its topic list compared against the requested topics
+#    index  - the current lookup: the union of the publisher sets of the topic index
+#
+# Both must return the same publishers; the number of mismatches is reported.
+
+import os
+import sys
+import time
+import random # random number generation
+import argparse # argument parsing
+import logging # for logging. Use it in place of print statements.
+
+# the application and middleware packages live one level up
+sys.path.insert (0, os.path.join (os.path.dirname (os.path.abspath (__file__)), ".."))
+
+from CS6381_MW import discovery_pb2
+from DiscoveryAppln import DiscoveryAppln
+
+class TopicIndexBenchmark ():
+
+  #################
+  # constructor
+  #################
+  def __init__ (self, logger):
+    self.num_pubs = None  # number of publishers
+    self.num_topics = None  # size of the topic universe
+    self.topics_per_pub = None  # topics published by each publisher
+    self.topics_per_lookup = None  # list of topic counts per lookup
+    self.num_lookups = None  # lookups per configuration
+    self.logger = logger
+
+  #################
+  # configuration
+  #################
+  def configure (self, args):
+    self.logger.debug ("TopicIndexBenchmark::configure")
+
+    self.num_pubs = args.num_pubs
+    self.num_topics = args.num_topics
+    self.topics_per_pub = args.topics_per_pub
+    self.topics_per_lookup = [int (x) for x in args.topics_per_lookup.split (",")]
+    self.num_lookups = args.num_lookups
+
+  #################
+  # the original lookup logic
+  #################
+  @staticmethod
+  def scan_lookup (appln, lookup_req):
+    pubs_matching_topics = []
+    for pub in appln.topic_dict:
+      appln.logger.debug ("DiscoveryAppln::lookup_pubs_topic_request evaluating pub: {}".format (appln.topic_dict[pub]))
+      if any (x in lookup_req.topiclist for x in appln.topic_dict[pub].topiclist):
+        pubs_matching_topics.append (appln.topic_dict[pub].info)
+    return pubs_matching_topics
+
+  #################
+  # a discovery application holding the registry
+  #################
+  def build_appln (self):
+    # the application logs every registration at INFO level; keep it quiet
+    appln_logger = logging.getLogger ("DiscoveryAppln")
+    appln_logger.setLevel (logging.WARNING)
+    appln = DiscoveryAppln (appln_logger)
+    appln.dissemination = "Direct"
+    appln.pub_dict = {}
+    appln.sub_dict = {}
+    appln.topic_dict = {}
+    appln.topic_index = {}
+
+    for i in range (self.num_pubs):
+      reg_req = discovery_pb2.RegisterReq ()
+      reg_req.role = discovery_pb2.ROLE_PUBLISHER
+      reg_req.info.id = "pub{}".format (i)
+      reg_req.info.addr = "10.0.{}.{}".format (i // 250 % 250, i % 250 + 1)
+      reg_req.info.port = 5577
+      reg_req.topiclist.extend ("topic{}".format (t) for t in random.sample (range (self.num_topics), self.topics_per_pub))
+      appln.register_request (reg_req, discovery_pb2.KEY_TOPIC)
+    return appln
+
+  #################
+  # Driver program
+  #################
+  def driver (self):
+    self.logger.debug ("TopicIndexBenchmark::driver")
+
+    random.seed (6381)
+    t0 = time.perf_counter ()
+    appln = self.build_appln ()
+    self.logger.info ("{} publishers x {} topics of {}: registered in {:.2f} s".format (
+      self.num_pubs, self.topics_per_pub, self.num_topics, time.perf_counter () - t0))
+    self.logger.info ("{:>7} {:>9} {:>12} {:>12} {:>9} {:>10}".format (
+      "topics", "pubs", "scan us", "index us", "speedup", "mismatch"))
+
+    for count in self.topics_per_lookup:
+      lookups = []
+      for i in range (self.num_lookups):
+        lookup_req = discovery_pb2.LookupPubByTopicReq ()
+        lookup_req.topiclist.extend ("topic{}".format (t) for t in random.sample (range (self.num_topics), count))
+        lookups.append (lookup_req)
+
+      t0 = time.perf_counter ()
+      scanned = [TopicIndexBenchmark.scan_lookup (appln, req) for req in lookups]
+      scan_us = (time.perf_counter () - t0) * 1e6 / self.num_lookups
+
+      t0 = time.perf_counter ()
+      indexed = [appln.lookup_pubs_topic_request (req) for req in lookups]
+      index_us = (time.perf_counter () - t0) * 1e6 / self.num_lookups
+
+      mismatch = sum (1 for a, b in zip (scanned, indexed) if set (p.id for p in a) != set (p.id for p in b))
+      pubs = sum (len (b) for b in indexed) / self.num_lookups
+      self.logger.info ("{:>7} {:>9.1f} {:>12.1f} {:>12.1f} {:>8.0f}x {:>10}".format (
+        count, pubs, scan_us, index_us, scan_us / index_us, mismatch))
+
+###################################
+#
+# Parse command line arguments
+#
+###################################
+def parseCmdLineArgs ():
+  # instantiate a ArgumentParser object
+  parser = argparse.ArgumentParser (description="Topic lookup latency, scan vs. topic index")
+
+  parser.add_argument ("-p", "--num_pubs", type=int, default=10000, help="Number of publishers, default 10000")
+
+  parser.add_argument ("-t", "--num_topics", type=int, default=1000, help="Number of distinct topics, default 1000")
+
+  parser.add_argument ("-k", "--topics_per_pub", type=int, default=5, help="Topics published by each publisher, default 5")
+
+  parser.add_argument ("-q", "--topics_per_lookup", default="1,3,10", help="Comma separated topics per lookup, default 1,3,10")
+
+  parser.add_argument ("-n", "--num_lookups", type=int, default=100, help="Lookups per configuration, default 100")
+
+  parser.add_argument ("-l", "--loglevel", type=int, default=logging.INFO, choices=[logging.DEBUG,logging.INFO,logging.WARNING,logging.ERROR,logging.CRITICAL], help="logging level, choices 10,20,30,40,50: default 20=logging.INFO")
+
+  return parser.parse_args()
+
+
+###################################
+#
+# Main program
+#
+###################################
+def main ():
+  try:
+    # obtain a system wide logger and initialize it to debug level to begin with
+    logging.info ("Main - acquire a child logger and then log messages in the child")
+    logger = logging.getLogger ("TopicIndexBenchmark")
+
+    # first parse the arguments
+    logger.debug ("Main: parse command line arguments")
+    args = parseCmdLineArgs ()
+
+    # reset the log level to as specified
+    logger.debug ("Main: resetting log level to {}".format (args.loglevel))
+    logger.setLevel (args.loglevel)
+    logger.debug ("Main: effective log level is {}".format (logger.getEffectiveLevel ()))
+
+    # Obtain the benchmark object
+    logger.debug ("Main: obtain the TopicIndexBenchmark object")
+    bench_obj = TopicIndexBenchmark (logger)
+
+    # configure the object
+    logger.debug ("Main: configure the benchmark object")
+    bench_obj.configure (args)
+
+    # now invoke the driver program
+    logger.debug ("Main: invoke the benchmark driver")
+    bench_obj.driver ()
+
+  except Exception as e:
+    logger.error ("Exception caught in main - {}".format (e))
+    return
+
+
+###################################
+#
+# Main entry point
+#
+###################################
+if __name__ == "__main__":
+
+  # set underlying default logging capabilities
+  logging.basicConfig (level=logging.DEBUG,
+                       format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+
+  main ()
@@ -0,0 +1,215 @@
+# Purpose:
+#
+# Where traced discovery requests spend their time in a Chord experiment. With TraceRate > 0
+# in the [Discovery] section of config.ini, publishers, subscribers and the broker trace that
+# share of their requests and log a line of the form
+#
+#    DhtClient::trace - client=sub1 type=TYPE_LOOKUP_PUB_BY_TOPIC sent=... recvd=... hops=disc1/0/t1/t2,disc4/1/t3/t4
+#
+# per traced request: one node/depth/recv_ns/send_ns entry per DHT node a part of the request
+# passed, the node the client sent it to at depth 0, every part starting again from there.
+# We scan the *.out files of a results directory (e.g., Experiments/ChordDHT/Direct/results)
+# and print
+#
+#    - the histogram of the hop count of the requests, i.e., the deepest part of each
+#    - the histogram of the per-hop latency, from the arrival at one node to the arrival at
+#      the next one, in power of two buckets of microseconds
+#    - per DHT node the time requests spent in it until it passed them on or served them,
+#      and the time they took to get to it from the node before
+#
+# Timestamps come from the clocks of the hosts the nodes run on; on more than one host the
+# times between nodes are as good as the clock sync of the hosts.
+
+import os
+import re
+import glob
+import argparse # argument parsing
+import logging # for logging. Use it in place of print statements.
+
+class TraceReport ():
+  # This is a class variable
+  pattern = re.compile (r"DhtClient::trace - (.*)$")
+
+  #################
+  # constructor
+  #################
+  def __init__ (self, logger):
+    self.results_dir = None  # directory with the *.out files of an experiment
+    self.requests = 0  # traced requests found
+    self.rtts = []  # round trip of every traced request as seen by its client, ns
+    self.hop_counts = {}  # hop count -> requests
+    self.hop_latencies = []  # arrival at a node to the arrival at the next one, ns
+    self.at_node = {}  # node -> time spent by requests until it passed them on or served them, ns
+    self.to_node = {}  # node -> time from the node before to the arrival at it, ns
+    self.logger = logger
+
+  #################
+  # configuration
+  #################
+  def configure (self, args):
+    self.logger.debug ("TraceReport::configure")
+
+    self.results_dir = args.results_dir
+
+  #################
+  # one traced request
+  #################
+  def add_trace (self, trace):
+    self.requests += 1
+    self.rtts.append (int (trace["recvd"]) - int (trace["sent"]))
+    if trace["hops"] == "-":
+      return  # answered from before the request was traced, e.g., shed
+
+    # the paths of the parts, each starts at depth 0
+    paths = []
+    for entry in trace["hops"].split (","):
+      node, depth, recv_ns, send_ns = entry.rsplit ("/", 3)
+      if int (depth) == 0:
+        paths.append ([])
+      paths[-1].append ((node, int (recv_ns), int (send_ns)))
+
+    depth = max (len (path) - 1 for path in paths)
+    self.hop_counts[depth] = self.hop_counts.get (depth, 0) + 1
+
+    # the node the client sent to is in every path, count it once
+    seen = set ()
+    for path in paths:
+      for i, (node, recv_ns, send_ns) in enumerate (path):
+        if send_ns and (i > 0 or node not in seen):
+          self.at_node.setdefault (node, []).append (send_ns - recv_ns)
+        if i > 0:
+          prev_node, prev_recv, prev_send = path[i - 1]
+          self.to_node.setdefault (node, []).append (recv_ns - prev_send)
+          self.hop_latencies.append (recv_ns - prev_recv)
+      seen.add (path[0][0])
+
+  #################
+  # parse one log file
+  #################
+  def parse_file (self, path):
+    with open (path, "r") as f:
+      for line in f:
+        match = TraceReport.pattern.search (line)
+        if match:
+          self.add_trace (dict (kv.split ("=", 1) for kv in match.group (1).split ()))
+
+  #################
+  # percentile of a list of ns, in us
+  #################
+  @staticmethod
+  def pct (values, q):
+    if not values:
+      return 0.0
+    values = sorted (values)
+    return values[min (len (values) - 1, int (q * len (values)))] / 1000.0
+
+  #################
+  # print a histogram of {label: count}
+  #################
+  def histogram (self, title, counts):
+    self.logger.info (title)
+    total = sum (counts.values ())
+    for label, count in counts.items ():
+      self.logger.info ("{:>14} {:>7} {:>6.1f}% {}".format (label, count, 100.0 * count / total, "#" * round (50 * count / total)))
+
+  #################
+  # Driver program
+  #################
+  def driver (self):
+    self.logger.debug ("TraceReport::driver")
+
+    for path in sorted (glob.glob (os.path.join (self.results_dir, "*.out"))):
+      self.parse_file (path)
+
+    if not self.requests:
+      self.logger.info ("No traced requests found in {}, is TraceRate set?".format (self.results_dir))
+      return
+
+    self.logger.info ("Traced requests: {}, round trip p50 {:.0f} us, p99 {:.0f} us".format (
+      self.requests, TraceReport.pct (self.rtts, 0.5), TraceReport.pct (self.rtts, 0.99)))
+
+    if self.hop_counts:
+      self.histogram ("Hop count", {h: self.hop_counts[h] for h in sorted (self.hop_counts)})
+
+    if self.hop_latencies:
+      # power of two buckets of microseconds, the first one everything below 1 us
+      buckets = {}
+      for latency in self.hop_latencies:
+        bucket = max (0, int (latency // 1000)).bit_length ()
+        buckets[bucket] = buckets.get (bucket, 0) + 1
+      self.histogram ("Per-hop latency (us)", {"< {}".format (1 << b): buckets[b] for b in sorted (buckets)})
+
+    self.logger.info ("{:<10} {:>7} {:>11} {:>11} {:>7} {:>11} {:>11}".format (
+      "Node", "served", "at p50 us", "at p99 us", "reached", "to p50 us", "to p99 us"))
+    for node in sorted (set (self.at_node) | set (self.to_node)):
+      at, to = self.at_node.get (node, []), self.to_node.get (node, [])
+      self.logger.info ("{:<10} {:>7} {:>11.0f} {:>11.0f} {:>7} {:>11.0f} {:>11.0f}".format (
+        node, len (at), TraceReport.pct (at, 0.5), TraceReport.pct (at, 0.99),
+        len (to), TraceReport.pct (to, 0.5), TraceReport.pct (to, 0.99)))
+
+###################################
+#
+# Parse command line arguments
+#
+###################################
+def parseCmdLineArgs ():
+  # instantiate a ArgumentParser object
+  parser = argparse.ArgumentParser (description="Hop counts and per-hop latencies of traced discovery requests of a Chord experiment")
+
+  parser.add_argument ("-d", "--results_dir", default="results", help="Directory with the *.out files of the publishers, subscribers and broker, default results")
+
+  parser.add_argument ("-l", "--loglevel", type=int, default=logging.INFO, choices=[logging.DEBUG,logging.INFO,logging.WARNING,logging.ERROR,logging.CRITICAL], help="logging level, choices 10,20,30,40,50: default 20=logging.INFO")
+
+  return parser.parse_args()
+
+
+###################################
+#
+# Main program
+#
+###################################
+def main ():
+  try:
+    # obtain a system wide logger and initialize it to debug level to begin with
+    logging.info ("Main - acquire a child logger and then log messages in the child")
+    logger = logging.getLogger ("TraceReport")
+
+    # first parse the arguments
+    logger.debug ("Main: parse command line arguments")
+    args = parseCmdLineArgs ()
+
+    # reset the log level to as specified
+    logger.debug ("Main: resetting log level to {}".format (args.loglevel))
+    logger.setLevel (args.loglevel)
+    logger.debug ("Main: effective log level is {}".format (logger.getEffectiveLevel ()))
+
+    # Obtain the report object
+    logger.debug ("Main: obtain the TraceReport object")
+    report_obj = TraceReport (logger)
+
+    # configure the object
+    logger.debug ("Main: configure the report object")
+    report_obj.configure (args)
+
+    # now invoke the driver program
+    logger.debug ("Main: invoke the report driver")
+    report_obj.driver ()
+
+  except Exception as e:
+    logger.error ("Exception caught in main - {}".format (e))
+    return
+
+
+###################################
+#
+# Main entry point
+#
+###################################
+if __name__ == "__main__":
+
+  # set underlying default logging capabilities
+  logging.basicConfig (level=logging.DEBUG,
+                       format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+
+  main ()
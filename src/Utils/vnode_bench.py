@@ -0,0 +1,199 @@
+# Purpose:
+#
+# How evenly do the discovery instances of a ring share the key space, with and without
+# virtual nodes? For a ring read from a dht json file (dht48.json by default) and for
+# every requested number of virtual nodes per instance we expand the ring the same way
+# DiscoveryAppln does (ChordUtils.expand_virtual_nodes), add up the arcs every physical
+# instance owns and report
+#
+#    positions  - number of points on the ring
+#    CoV        - coefficient of variation (stddev/mean) of the owned fraction divided by the
+#                 weight of the instance's host, so a perfectly weighted ring reports zero
+#    max/mean   - the most loaded instance relative to the mean (weight adjusted)
+#    hops       - mean physical hops of random lookups routed with VirtualFingerTables,
+#                 the router used by DiscoveryMW, plus the number of misrouted lookups
+#
+# Host weights can be given like in config.ini, e.g., -w h1:2,h3:0.5
+
+import os
+import sys
+import math
+import random # random number generation
+import bisect
+import argparse # argument parsing
+import logging # for logging. Use it in place of print statements.
+
+# the Chord package lives one level up
+sys.path.insert (0, os.path.join (os.path.dirname (os.path.abspath (__file__)), ".."))
+
+from Chord.constants import *
+from Chord.chordutils import ChordUtils
+from Chord.fingertablegen import FingerTableGen
+
+class VirtualNodeBenchmark ():
+
+  #################
+  # constructor
+  #################
+  def __init__ (self, logger):
+    self.json_file = None  # dht json file with the physical ring
+    self.bits_hash = None  # number of bits in the hash
+    self.vnode_counts = None  # list of virtual node counts to evaluate
+    self.host_weights = None  # host -> weight
+    self.num_routes = None  # number of routed lookups per configuration
+    self.logger = logger
+
+  #################
+  # configuration
+  #################
+  def configure (self, args):
+    self.logger.debug ("VirtualNodeBenchmark::configure")
+
+    self.json_file = args.json_file
+    self.bits_hash = args.bits_hash if args.bits_hash else ChordUtils.ring_bits (ChordUtils.load_json_data (self.json_file))
+    self.vnode_counts = [int (x) for x in args.vnodes.split (",")]
+    self.host_weights = ChordUtils.parse_host_weights (args.weights)
+    self.num_routes = args.num_routes
+
+  #################
+  # fraction of the key space owned by each physical node
+  #################
+  def ownership (self, ring):
+    ring_size = 1 << self.bits_hash
+    owned = {}
+    for i, vnode in enumerate (ring):
+      # a virtual node owns the arc (predecessor, vnode]
+      arc = (vnode[HASH] - ring[i - 1][HASH]) % ring_size or ring_size
+      owned[vnode[PHYSICAL]] = owned.get (vnode[PHYSICAL], 0) + arc / ring_size
+    return owned
+
+  #################
+  # route random keys between physical nodes
+  #################
+  def route (self, ring, nodes):
+    tables = {}
+    for node in nodes:
+      tables[node[ID]] = FingerTableGen.generate_virtual_finger_tables (node[ID], ring, self.bits_hash)
+    hashes = [n[HASH] for n in ring]
+
+    total_hops = 0
+    misrouted = 0
+    for i in range (self.num_routes):
+      key = random.getrandbits (self.bits_hash)
+      owner = ring[bisect.bisect_left (hashes, key) % len (ring)][PHYSICAL]
+      current = tables[random.choice (nodes)[ID]]
+      hops = 0
+      while hops <= len (ring):
+        nxt = current.next_hop (key)
+        if current.is_local (nxt):
+          break
+        current = tables[nxt[PHYSICAL]]
+        hops += 1
+      total_hops += hops
+      if current.physical != owner:
+        misrouted += 1
+
+    return total_hops / self.num_routes, misrouted
+
+  #################
+  # Driver program
+  #################
+  def driver (self):
+    self.logger.debug ("VirtualNodeBenchmark::driver")
+
+    random.seed (6381)
+    nodes = ChordUtils.to_sorted_dht_node_list (ChordUtils.load_json_data (self.json_file))
+    weights = [self.host_weights.get (n.get (HOST), 1.0) for n in nodes]
+    total_weight = sum (weights)
+
+    self.logger.info ("Ring {} with {} discovery instances".format (os.path.basename (self.json_file), len (nodes)))
+    self.logger.info ("{:>7} {:>10} {:>8} {:>9} {:>8} {:>10}".format (
+      "vnodes", "positions", "CoV", "max/mean", "hops", "misrouted"))
+
+    for vnodes in self.vnode_counts:
+      ring = ChordUtils.expand_virtual_nodes (nodes, self.bits_hash, vnodes, self.host_weights)
+      owned = self.ownership (ring)
+
+      # owned fraction relative to the fraction the weight of the host entitles the node to
+      ratios = [owned.get (n[ID], 0.0) * total_weight / w for n, w in zip (nodes, weights)]
+      mean = sum (ratios) / len (ratios)
+      cov = math.sqrt (sum ((r - mean) ** 2 for r in ratios) / len (ratios)) / mean
+
+      hops, misrouted = self.route (ring, nodes)
+      self.logger.info ("{:>7} {:>10} {:>8.3f} {:>9.2f} {:>8.2f} {:>10}".format (
+        vnodes, len (ring), cov, max (ratios) / mean, hops, misrouted))
+
+###################################
+#
+# Parse command line arguments
+#
+###################################
+def parseCmdLineArgs ():
+  # instantiate a ArgumentParser object
+  parser = argparse.ArgumentParser (description="Key ownership balance with virtual nodes")
+
+  parser.add_argument ("-j", "--json_file", default=os.path.join (os.path.dirname (os.path.abspath (__file__)), "dht48.json"), help="JSON file with the database of all DHT nodes, default dht48.json")
+
+  parser.add_argument ("-b", "--bits_hash", type=int, default=None, help="Number of bits of hash value, default taken from the json file")
+
+  parser.add_argument ("-V", "--vnodes", default="1,2,4,8,16,32", help="Comma separated virtual nodes per instance, default 1,2,4,8,16,32")
+
+  parser.add_argument ("-w", "--weights", default="", help="Host weights, e.g., h1:2,h3:0.5, default all 1")
+
+  parser.add_argument ("-r", "--num_routes", type=int, default=5000, help="Number of routed lookups per configuration, default 5000")
+
+  parser.add_argument ("-l", "--loglevel", type=int, default=logging.INFO, choices=[logging.DEBUG,logging.INFO,logging.WARNING,logging.ERROR,logging.CRITICAL], help="logging level, choices 10,20,30,40,50: default 20=logging.INFO")
+
+  return parser.parse_args()
+
+
+###################################
+#
+# Main program
+#
+###################################
+def main ():
+  try:
+    # obtain a system wide logger and initialize it to debug level to begin with
+    logging.info ("Main - acquire a child logger and then log messages in the child")
+    logger = logging.getLogger ("VirtualNodeBenchmark")
+
+    # first parse the arguments
+    logger.debug ("Main: parse command line arguments")
+    args = parseCmdLineArgs ()
+
+    # reset the log level to as specified
+    logger.debug ("Main: resetting log level to {}".format (args.loglevel))
+    logger.setLevel (args.loglevel)
+    logger.debug ("Main: effective log level is {}".format (logger.getEffectiveLevel ()))
+
+    # Obtain the benchmark object
+    logger.debug ("Main: obtain the VirtualNodeBenchmark object")
+    bench_obj = VirtualNodeBenchmark (logger)
+
+    # configure the object
+    logger.debug ("Main: configure the benchmark object")
+    bench_obj.configure (args)
+
+    # now invoke the driver program
+    logger.debug ("Main: invoke the benchmark driver")
+    bench_obj.driver ()
+
+  except Exception as e:
+    logger.error ("Exception caught in main - {}".format (e))
+    return
+
+
+###################################
+#
+# Main entry point
+#
+###################################
+if __name__ == "__main__":
+
+  # set underlying default logging capabilities
+  logging.basicConfig (level=logging.DEBUG,
+                       format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+
+  main ()
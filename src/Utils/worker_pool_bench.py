@@ -0,0 +1,269 @@
+# Purpose:
+#
+# Throughput of one discovery node with a worker pool (Workers in the [Discovery] section
+# of config.ini) as the pool grows. For every pool size we start a one node ring on this
+# machine, so that the node owns every key, register the requested number of publishers
+# and then let many concurrent clients (spread over a few client processes) look up
+# publishers of random topics, one request at a time on a REQ socket like the subscriber
+# middleware does. Pool size 0 is the plain single threaded node.
+#
+# Lookups are what the workers answer from their copy of the registry, so this shows how
+# far the reads scale with the cores of the machine. Workers, client processes and the
+# node share the machine; beyond its number of cores there is nothing left to gain.
+
+import os
+import sys
+import time
+import json
+import random # random number generation
+import asyncio
+import tempfile
+import configparser
+import subprocess
+import multiprocessing
+import argparse # argument parsing
+import logging # for logging. Use it in place of print statements.
+
+import zmq
+import zmq.asyncio
+
+# the Chord and CS6381_MW packages live one level up
+sys.path.insert (0, os.path.join (os.path.dirname (os.path.abspath (__file__)), ".."))
+
+from Chord.constants import *
+from Chord.hashgen import hashgen
+from CS6381_MW import discovery_pb2
+
+##################################
+# client side, runs in the client processes
+##################################
+async def run_client (client_id, endpoint, num_requests, num_topics, latencies):
+  socket = zmq.asyncio.Context.instance ().socket (zmq.REQ)
+  socket.connect (endpoint)
+  rng = random.Random (client_id)
+  for i in range (num_requests):
+    disc_req = discovery_pb2.DiscoveryReq ()
+    disc_req.msg_type = discovery_pb2.TYPE_LOOKUP_PUB_BY_TOPIC
+    disc_req.lookup_req.topiclist.extend (["topic{}".format (rng.randrange (num_topics)) for t in range (3)])
+
+    start = time.perf_counter ()
+    await socket.send (disc_req.SerializeToString ())
+    disc_resp = discovery_pb2.DiscoveryResp ()
+    disc_resp.ParseFromString (await socket.recv ())
+    latencies.append (time.perf_counter () - start)
+  socket.close (linger=0)
+
+async def run_clients (first, endpoint, num_clients, num_requests, num_topics):
+  latencies = []
+  await asyncio.gather (*[run_client (c, endpoint, num_requests, num_topics, latencies)
+                          for c in range (first, first + num_clients)])
+  return latencies
+
+def client_process (args):
+  first, endpoint, num_clients, num_requests, num_topics = args
+  return asyncio.run (run_clients (first, endpoint, num_clients, num_requests, num_topics))
+
+class WorkerPoolBenchmark ():
+
+  #################
+  # constructor
+  #################
+  def __init__ (self, logger):
+    self.pool_sizes = None  # worker pool sizes to compare
+    self.num_pubs = None  # registered publishers
+    self.num_topics = None  # distinct topics
+    self.num_clients = None  # concurrent clients
+    self.num_requests = None  # lookups per client
+    self.num_procs = None  # client processes
+    self.base_port = None  # port of the node of the first run
+    self.logger = logger
+
+  #################
+  # configuration
+  #################
+  def configure (self, args):
+    self.logger.debug ("WorkerPoolBenchmark::configure")
+
+    self.pool_sizes = [int (w) for w in args.pool_sizes.split (",")]
+    self.num_pubs = args.num_pubs
+    self.num_topics = args.num_topics
+    self.num_clients = args.num_clients
+    self.num_requests = args.num_requests
+    self.num_procs = args.num_procs
+    self.base_port = args.base_port
+
+  #################
+  # start a one node ring with the given pool
+  #################
+  def start_node (self, workdir, workers, port):
+    node = {ID: "disc1", HASH: hashgen (48, "disc1:127.0.0.1:{}".format (port)), IP: "127.0.0.1", PORT: port, HOST: "h1"}
+    json_file = os.path.join (workdir, "ring-{}.json".format (workers))
+    with open (json_file, "w") as f:
+      json.dump ({BITS: 48, DHT: [node]}, f)
+
+    # the node runs with the config.ini of the src directory and the pool size under test.
+    # Clients are never shed, we want to see what the node can serve.
+    src_dir = os.path.join (os.path.dirname (os.path.abspath (__file__)), "..")
+    config = configparser.ConfigParser ()
+    config.read (os.path.join (src_dir, "config.ini"))
+    config["Discovery"]["Workers"] = str (workers)
+    config["Discovery"]["MaxInFlight"] = str (1 << 30)
+    config["Discovery"]["IngressQueue"] = str (1 << 30)
+    config_file = os.path.join (workdir, "config-{}.ini".format (workers))
+    with open (config_file, "w") as f:
+      config.write (f)
+
+    cmd = [sys.executable, os.path.join (src_dir, "DiscoveryAppln.py"), "-n", node[ID], "-a", "127.0.0.1",
+           "-p", str (port), "-j", json_file, "-c", config_file, "-l", "30"]
+    out = open (os.path.join (workdir, "disc-{}.out".format (workers)), "w")
+    return "tcp://127.0.0.1:{}".format (port), subprocess.Popen (cmd, stdout=out, stderr=subprocess.STDOUT, cwd=src_dir)
+
+  #################
+  # register the publishers, each with two random topics
+  #################
+  def fill (self, endpoint):
+    socket = zmq.Context.instance ().socket (zmq.REQ)
+    socket.connect (endpoint)
+    rng = random.Random (6381)
+    for i in range (self.num_pubs):
+      disc_req = discovery_pb2.DiscoveryReq ()
+      disc_req.msg_type = discovery_pb2.TYPE_REGISTER
+      register_req = disc_req.register_req
+      register_req.role = discovery_pb2.ROLE_PUBLISHER
+      register_req.info.id = "pub{}".format (i)
+      register_req.info.addr = "10.0.0.1"
+      register_req.info.port = 5000 + i
+      register_req.topiclist.extend (["topic{}".format (rng.randrange (self.num_topics)) for t in range (2)])
+      socket.send (disc_req.SerializeToString ())
+      socket.recv ()
+    socket.close (linger=0)
+
+  #################
+  # run the clients against one pool size
+  #################
+  def run_pool (self, workdir, workers, port):
+    endpoint, proc = self.start_node (workdir, workers, port)
+    try:
+      # give the node time to bind and fork its workers
+      time.sleep (2)
+      self.fill (endpoint)
+      # the workers apply the registrations after the node acknowledged them
+      time.sleep (1)
+
+      per_proc = [self.num_clients // self.num_procs + (1 if p < self.num_clients % self.num_procs else 0)
+                  for p in range (self.num_procs)]
+      jobs = []
+      first = 0
+      for count in per_proc:
+        jobs.append ((first, endpoint, count, self.num_requests, self.num_topics))
+        first += count
+
+      start = time.perf_counter ()
+      with multiprocessing.Pool (self.num_procs) as pool:
+        results = pool.map (client_process, jobs)
+      elapsed = time.perf_counter () - start
+    finally:
+      # the workers notice that the node is gone and exit
+      proc.kill ()
+      proc.wait ()
+
+    latencies = sorted (l for res in results for l in res)
+    pct = lambda q: 1000.0 * latencies[min (len (latencies) - 1, int (q * len (latencies)))]
+    return len (latencies) / elapsed, pct (0.5), pct (0.99)
+
+  #################
+  # Driver program
+  #################
+  def driver (self):
+    self.logger.debug ("WorkerPoolBenchmark::driver")
+
+    self.logger.info ("{} CPUs, {} publishers on {} topics, {} clients x {} lookups from {} processes".format (
+      os.cpu_count (), self.num_pubs, self.num_topics, self.num_clients, self.num_requests, self.num_procs))
+    self.logger.info ("{:>8} {:>9} {:>8} {:>9} {:>9}".format ("workers", "lookup/s", "speedup", "p50 ms", "p99 ms"))
+
+    baseline = None
+    with tempfile.TemporaryDirectory () as workdir:
+      for i, workers in enumerate (self.pool_sizes):
+        # a fresh port per run so that we do not race the previous node shutting down
+        throughput, p50, p99 = self.run_pool (workdir, workers, self.base_port + i)
+        baseline = baseline or throughput
+        self.logger.info ("{:>8} {:>9.0f} {:>8.2f} {:>9.2f} {:>9.2f}".format (workers, throughput, throughput / baseline, p50, p99))
+
+###################################
+#
+# Parse command line arguments
+#
+###################################
+def parseCmdLineArgs ():
+  # instantiate a ArgumentParser object
+  parser = argparse.ArgumentParser (description="Lookup throughput of a discovery node by worker pool size")
+
+  parser.add_argument ("-w", "--pool_sizes", default="0,1,2,4", help="Comma separated worker pool sizes to compare, default 0,1,2,4")
+
+  parser.add_argument ("-p", "--num_pubs", type=int, default=1000, help="Registered publishers, default 1000")
+
+  parser.add_argument ("-t", "--num_topics", type=int, default=50, help="Distinct topics, default 50")
+
+  parser.add_argument ("-c", "--num_clients", type=int, default=200, help="Concurrent clients, default 200")
+
+  parser.add_argument ("-r", "--num_requests", type=int, default=100, help="Lookups per client, default 100")
+
+  parser.add_argument ("-P", "--num_procs", type=int, default=min (4, os.cpu_count ()), help="Client processes, default 4 or the number of CPUs if less")
+
+  parser.add_argument ("-b", "--base_port", type=int, default=7201, help="Port of the node of the first run, default 7201")
+
+  parser.add_argument ("-l", "--loglevel", type=int, default=logging.INFO, choices=[logging.DEBUG,logging.INFO,logging.WARNING,logging.ERROR,logging.CRITICAL], help="logging level, choices 10,20,30,40,50: default 20=logging.INFO")
+
+  return parser.parse_args()
+
+
+###################################
+#
+# Main program
+#
+###################################
+def main ():
+  try:
+    # obtain a system wide logger and initialize it to debug level to begin with
+    logging.info ("Main - acquire a child logger and then log messages in the child")
+    logger = logging.getLogger ("WorkerPoolBenchmark")
+
+    # first parse the arguments
+    logger.debug ("Main: parse command line arguments")
+    args = parseCmdLineArgs ()
+
+    # reset the log level to as specified
+    logger.debug ("Main: resetting log level to {}".format (args.loglevel))
+    logger.setLevel (args.loglevel)
+    logger.debug ("Main: effective log level is {}".format (logger.getEffectiveLevel ()))
+
+    # Obtain the benchmark object
+    logger.debug ("Main: obtain the WorkerPoolBenchmark object")
+    bench_obj = WorkerPoolBenchmark (logger)
+
+    # configure the object
+    logger.debug ("Main: configure the benchmark object")
+    bench_obj.configure (args)
+
+    # now invoke the driver program
+    logger.debug ("Main: invoke the benchmark driver")
+    bench_obj.driver ()
+
+  except Exception as e:
+    logger.error ("Exception caught in main - {}".format (e))
+    return
+
+
+###################################
+#
+# Main entry point
+#
+###################################
+if __name__ == "__main__":
+
+  # set underlying default logging capabilities
+  logging.basicConfig (level=logging.DEBUG,
+                       format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+
+  main ()